@@ -0,0 +1,677 @@
+import argparse
+import hashlib
+import json
+import logging
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from core.service.ai_service import AIRequest, AIService
+from core.service.context_builder import CONTEXT_HEADER
+from core.service.context_delta import ContextDelta
+from core.service.history_compactor import AI_PREFIX, USER_PREFIX, HistoryCompactor, to_chat_message
+from core.service.prompt_builder import get_prompt_builder
+from core.service.response_cache import ResponseCache
+from core.service.session_service import SessionService
+from core.service.telemetry import RequestMetrics, format_summary, get_telemetry, percentile
+from core.service.tokenizer import get_token_counter
+from core.workers.cancellation import CancellationToken, RequestCancelled
+from core.workers.request_scheduler import RequestScheduler
+
+logger = logging.getLogger("ChatController")
+
+# Prazo padrão (s) de uma requisição, contado a partir do envio.
+REQUEST_DEADLINE = 120.0
+# Quantidade de mensagens carregadas por página do histórico.
+HISTORY_PAGE_SIZE = 50
+# Subfila do scheduler usada pela etapa de fusão de um fan-out.
+MERGE_OWNER = "merge"
+# Marca das subfilas `(chat_id, AGENT_OWNER, agente)` de um fan-out; não colide com as demais.
+AGENT_OWNER = "agent"
+# Subfila do aquecimento de contexto enquanto o usuário digita, e o prazo dele.
+PREFETCH_OWNER = "prefetch"
+PREFETCH_DEADLINE = 30.0
+MERGE_PROMPT = (
+    "Pergunta do usuário:\n{question}\n\n"
+    "Respostas de {count} agentes:\n\n{answers}\n\n"
+    "Combine as respostas em uma única resposta: mantenha o que for correto e complementar "
+    "em cada uma, ordene pelo que for mais útil e aponte divergências relevantes."
+)
+
+
+class ChatRequest:
+    """Envio feito por um ChatController: requisição, ticket no scheduler e resultado."""
+
+    PENDING = "pending"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+    def __init__(self, controller, request: AIRequest, listener=None):
+        self.controller = controller
+        self.request = request
+        self.listener = listener
+        self.token = request.token
+        self.ticket = None
+        self.state = self.PENDING
+        self.text = None
+        self.error = None
+        self.reason = None
+        self.history_index = None
+        self.agent = request.agent
+        self.save_reply = True
+        self.submitted_at = time.monotonic()
+        self.first_chunk_at = None
+        self.finished_at = None
+        self._done = threading.Event()
+
+    def cancel(self, reason: str = "cancelado pelo usuário") -> None:
+        self.controller.cancel(self, reason)
+
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout=None) -> bool:
+        return self._done.wait(timeout)
+
+
+class FanOut:
+    """
+    Um prompt enviado a vários agentes em paralelo (um ChatRequest por
+    agente) e, opcionalmente, a fusão das respostas numa só.
+    """
+
+    def __init__(self, controller, text: str, agents: list[str], listener=None, merge: bool = False):
+        self.controller = controller
+        self.text = text
+        self.agents = list(agents)
+        self.listener = listener
+        self.merge = merge
+        self.handles = {}
+        self.merge_handle = None
+        self.merged = None
+        self.cancelled = False
+        self.submitted_at = time.monotonic()
+        self.finished_at = None
+        self._remaining = len(self.agents)
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    @property
+    def results(self) -> dict:
+        """Resposta de cada agente que terminou com sucesso."""
+        return {agent: h.text for agent, h in self.handles.items() if h.state == ChatRequest.DONE}
+
+    def cancel(self, reason: str = "cancelado pelo usuário") -> None:
+        self.cancelled = True
+        for handle in list(self.handles.values()) + [self.merge_handle]:
+            if handle is not None:
+                handle.cancel(reason)
+
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout=None) -> bool:
+        return self._done.wait(timeout)
+
+    def _member_done(self) -> bool:
+        with self._lock:
+            self._remaining -= 1
+            return self._remaining == 0
+
+
+class _AgentListener:
+    """Repassa os eventos do envio de um agente ao listener do fan-out."""
+
+    def __init__(self, fan_out: FanOut, agent: str):
+        self.fan_out = fan_out
+        self.agent = agent
+
+    def on_context_built(self, report):
+        _call(self.fan_out.listener, "on_agent_context_built", self.agent, report)
+
+    def on_chunk(self, delta):
+        _call(self.fan_out.listener, "on_agent_chunk", self.agent, delta)
+
+    def on_finished(self, text):
+        self._done("on_agent_finished", text)
+
+    def on_error(self, exc):
+        self._done("on_agent_error", exc)
+
+    def on_cancelled(self, reason):
+        self._done("on_agent_cancelled", reason)
+
+    def _done(self, event, arg):
+        _call(self.fan_out.listener, event, self.agent, arg)
+        if self.fan_out._member_done():
+            self.fan_out.controller._fan_out_collected(self.fan_out)
+
+
+class _MergeListener:
+    """Eventos da etapa de fusão de um fan-out."""
+
+    def __init__(self, fan_out: FanOut):
+        self.fan_out = fan_out
+
+    def on_chunk(self, delta):
+        _call(self.fan_out.listener, "on_merge_chunk", delta)
+
+    def on_finished(self, text):
+        self.fan_out.merged = text
+        _call(self.fan_out.listener, "on_merge_finished", text)
+        self.fan_out.controller._fan_out_finished(self.fan_out)
+
+    def on_error(self, exc):
+        self._failed(exc)
+
+    def on_cancelled(self, reason):
+        self._failed(reason)
+
+    def _failed(self, cause):
+        # sem fusão, as respostas individuais é que ficam no histórico
+        _call(self.fan_out.listener, "on_merge_error", cause)
+        self.fan_out.controller._save_agent_answers(self.fan_out)
+        self.fan_out.controller._fan_out_finished(self.fan_out)
+
+
+def _call(listener, event, *args):
+    callback = getattr(listener, event, None)
+    if callback is None:
+        return
+    try:
+        callback(*args)
+    except Exception as e:
+        logger.error(f"[ChatController] listener falhou em {event}: {e}", exc_info=True)
+
+
+class ChatController:
+    """
+    Orquestração de um chat sem dependência de Qt: histórico paginado,
+    anexos, seleção de agente/fontes, montagem do contexto e envio à IA
+    pelo RequestScheduler.
+
+    Os eventos de cada envio são entregues ao `listener` informado em
+    `send` (métodos opcionais `on_context_built`, `on_chunk`, `on_finished`,
+    `on_error` e `on_cancelled`), sempre a partir da thread do scheduler; a UI é
+    responsável por levá-los à sua própria thread.
+    """
+
+    def __init__(self, chat_id: str, session_service: SessionService, ai_service: AIService | None = None,
+                 scheduler: RequestScheduler | None = None, deadline: float | None = REQUEST_DEADLINE):
+        self.chat_id = chat_id
+        self.session = session_service
+        self.ai_service = ai_service or AIService()
+        self.scheduler = scheduler or RequestScheduler(max_workers=1)
+        self.deadline = deadline
+        self.selected_agent_groups = {}
+        self.selected_kb_sources = {}
+        self.merge_agents = False
+        self.bypass_cache_once = False
+        self._prefetch = None
+        self.compactor = HistoryCompactor(session_service)
+        self.context_delta = ContextDelta(session_service)
+        self._history_start = 0
+        self._requests = []
+        self._lock = threading.Lock()
+
+    # histórico
+
+    def load_latest_history(self, limit: int = HISTORY_PAGE_SIZE) -> tuple[list[str], bool]:
+        """Página mais recente do histórico e se há mensagens mais antigas."""
+        total = self.session.history_count(self.chat_id)
+        page = self.session.load_history(self.chat_id, limit=limit)
+        self._history_start = total - len(page)
+        return page, self._history_start > 0
+
+    def load_older_history(self, limit: int = HISTORY_PAGE_SIZE) -> tuple[list[str], bool]:
+        """Página anterior à última carregada (vazia se já chegou ao início)."""
+        if self._history_start <= 0:
+            return [], False
+        page = self.session.load_history(self.chat_id, before=self._history_start, limit=limit)
+        self._history_start -= len(page)
+        return page, self._history_start > 0
+
+    # anexos e seleção
+
+    def attach_files(self, paths: list[str]) -> None:
+        for path in paths:
+            self.session.add_file(self.chat_id, path)
+
+    def active_files(self) -> list[str]:
+        return [
+            path for path in self.session.get_files(self.chat_id)
+            if self.session.get_file_active(self.chat_id, path)
+        ]
+
+    def select_agent(self, name: str | None) -> None:
+        """Seleção de um único agente (substitui as demais)."""
+        self.selected_agent_groups = {None: [name] if name else []}
+
+    def select_agents(self, group, names: list[str]) -> None:
+        """Agentes marcados em um grupo do seletor; com mais de um, o envio vira fan-out."""
+        self.selected_agent_groups[group] = list(names)
+
+    @property
+    def selected_agents(self) -> list[str]:
+        agents = []
+        for names in self.selected_agent_groups.values():
+            agents.extend(name for name in names if name not in agents)
+        return agents
+
+    @property
+    def selected_agent(self) -> str | None:
+        agents = self.selected_agents
+        return agents[0] if agents else None
+
+    def select_kb_sources(self, group, names: list[str]) -> None:
+        """Fontes marcadas em um grupo (ex.: uma lista do diálogo de seleção)."""
+        self.selected_kb_sources[group] = list(names)
+
+    @property
+    def kb_sources(self) -> list[str]:
+        return sorted(name for names in self.selected_kb_sources.values() for name in names)
+
+    @property
+    def knowledge_bases(self):
+        return self.ai_service.knowledge_bases
+
+    def refresh_knowledge_bases(self, names: list[str] | None = None) -> list:
+        """Atualiza (incrementalmente) as bases no scheduler; todas, se `names` for None."""
+        kbs = self.knowledge_bases
+        if kbs is None:
+            return []
+        bases = kbs.list_bases() if names is None else [kb for kb in map(kbs.get, names) if kb is not None]
+        return [self.scheduler.submit(f"kb:{kb.name}", kb.refresh) for kb in bases]
+
+    def forget_kb_source(self, name: str) -> None:
+        for names in self.selected_kb_sources.values():
+            if name in names:
+                names.remove(name)
+
+    def prompt_cache_stats(self):
+        """Reaproveitamento de prefixo e cache do provedor neste chat (None se nada foi enviado)."""
+        return get_prompt_builder().stats(self.chat_id)
+
+    # envio
+
+    def build_request(self, text: str, files: list[str] | None = None, agent: str | None = None,
+                      bypass_cache: bool | None = None) -> AIRequest:
+        """
+        Monta a AIRequest com a seleção atual. Sem `bypass_cache`, usa o
+        bypass de cache pendente, que vale para um envio.
+        """
+        if bypass_cache is None:
+            bypass_cache, self.bypass_cache_once = self.bypass_cache_once, False
+        return AIRequest(
+            prompt=text,
+            context_files=self.active_files() if files is None else list(files),
+            agent=agent or self.selected_agent,
+            kb_sources=self.kb_sources,
+            bypass_cache=bypass_cache,
+            chat_id=self.chat_id,
+        )
+
+    def prefetch(self, text: str, files: list[str] | None = None):
+        """
+        Aquecimento especulativo do envio de `text` (ver AIService.prefetch),
+        numa subfila própria do chat. Cancela o aquecimento anterior, que
+        ficou desatualizado; retorna o ticket, ou None se não há o que aquecer.
+        """
+        self.cancel_prefetch()
+        text = text.strip()
+        request = AIRequest(
+            prompt=text,
+            context_files=self.active_files() if files is None else list(files),
+            kb_sources=self.kb_sources,
+            chat_id=self.chat_id,
+        )
+        if not text or not (request.context_files or request.kb_sources):
+            return None
+        request.token = CancellationToken(timeout=PREFETCH_DEADLINE)
+        try:
+            self._prefetch = self.scheduler.submit((self.chat_id, PREFETCH_OWNER), self._run_prefetch, request,
+                                                   token=request.token, background=True)
+        except Exception as e:
+            logger.warning(f"[ChatController] aquecimento não enfileirado: {e}")
+            request.token.close()
+            return None
+        return self._prefetch
+
+    def cancel_prefetch(self) -> None:
+        ticket, self._prefetch = self._prefetch, None
+        if ticket is not None and not ticket.done():
+            self.scheduler.cancel(ticket)
+
+    def _run_prefetch(self, request: AIRequest):
+        started = time.monotonic()
+        try:
+            self.ai_service.prefetch(request)
+            logger.debug(f"[ChatController] contexto aquecido em {time.monotonic() - started:.3f}s")
+        finally:
+            request.token.close()
+
+    def send(self, text: str, files: list[str] | None = None, listener=None) -> ChatRequest:
+        """Grava a mensagem do usuário e enfileira a requisição à IA."""
+        history_index = self.session.save_message(self.chat_id, f"{USER_PREFIX}{text}")
+        request = self.build_request(text, files)
+        return self._submit(self.chat_id, request, listener, history_index)
+
+    def fan_out(self, text: str, agents: list[str] | None = None, files: list[str] | None = None,
+                listener=None, merge: bool | None = None) -> FanOut:
+        """
+        Envia o mesmo prompt a cada agente em paralelo: cada um ocupa uma
+        subfila `(chat_id, AGENT_OWNER, agente)` do scheduler, então o tempo total é o do
+        agente mais lento (limitado pelas vagas livres do scheduler).
+
+        Eventos do `listener`: `on_agent_context_built`, `on_agent_chunk`,
+        `on_agent_finished`, `on_agent_error` e `on_agent_cancelled` (todos
+        com o agente como primeiro argumento); com `merge`, depois que todos
+        terminam, `on_merge_chunk`, `on_merge_finished` ou `on_merge_error`;
+        por fim, `on_fan_out_finished(fan_out)`.
+        """
+        agents = list(agents if agents is not None else self.selected_agents)
+        if not agents:
+            raise ValueError("nenhum agente selecionado")
+        merge = self.merge_agents if merge is None else merge
+        history_index = self.session.save_message(self.chat_id, f"{USER_PREFIX}{text}")
+        fan_out = FanOut(self, text, agents, listener, merge)
+        # o bypass de cache vale para o envio inteiro, ou seja, para todos os agentes
+        bypass_cache = self.bypass_cache_once
+        for agent in agents:
+            request = self.build_request(text, files, agent=agent, bypass_cache=bypass_cache)
+            handle = self._submit((self.chat_id, AGENT_OWNER, agent), request, _AgentListener(fan_out, agent),
+                                  history_index, save_reply=False)
+            fan_out.handles[agent] = handle
+        self.bypass_cache_once = False
+        logger.info(f"[ChatController] fan-out no chat {self.chat_id} para {len(agents)} agente(s)")
+        return fan_out
+
+    def _submit(self, owner, request: AIRequest, listener, history_index: int, save_reply: bool = True) -> ChatRequest:
+        request.token = CancellationToken(timeout=self.deadline)
+        request.metrics = RequestMetrics(self.chat_id, request.agent, request.provider or self.ai_service.default)
+        handle = ChatRequest(self, request, listener)
+        handle.history_index = history_index
+        handle.save_reply = save_reply
+        with self._lock:
+            self._requests.append(handle)
+        try:
+            handle.ticket = self.scheduler.submit(owner, self._run, handle, token=request.token)
+        except Exception:
+            with self._lock:
+                self._requests.remove(handle)
+            request.token.close()
+            raise
+        return handle
+
+    def _fan_out_collected(self, fan_out: FanOut) -> None:
+        """Todos os agentes terminaram: funde as respostas ou grava cada uma."""
+        answers = fan_out.results
+        if not fan_out.merge or fan_out.cancelled or len(answers) < 2:
+            self._save_agent_answers(fan_out)
+            self._fan_out_finished(fan_out)
+            return
+        prompt = MERGE_PROMPT.format(
+            question=fan_out.text,
+            count=len(answers),
+            answers="\n\n".join(f"### {agent}\n{text}" for agent, text in answers.items()),
+        )
+        request = AIRequest(prompt=prompt, chat_id=self.chat_id, bypass_cache=False)
+        history_index = next(iter(fan_out.handles.values())).history_index
+        try:
+            fan_out.merge_handle = self._submit((self.chat_id, MERGE_OWNER), request, _MergeListener(fan_out),
+                                                history_index)
+        except Exception as e:
+            logger.error(f"[ChatController] falha ao enfileirar fusão: {e}", exc_info=True)
+            _MergeListener(fan_out)._failed(e)
+
+    def _save_agent_answers(self, fan_out: FanOut) -> None:
+        for agent, text in fan_out.results.items():
+            self.session.save_message(self.chat_id, f"{AI_PREFIX}[{agent}] {text}")
+
+    def _fan_out_finished(self, fan_out: FanOut) -> None:
+        fan_out.finished_at = time.monotonic()
+        fan_out._done.set()
+        _call(fan_out.listener, "on_fan_out_finished", fan_out)
+
+    def cancel(self, handle: ChatRequest, reason: str = "cancelado pelo usuário") -> None:
+        """Cancela o envio; se ainda estava na fila, o listener recebe `cancelled` já."""
+        handle.token.cancel(reason)
+        if handle.ticket is not None and self.scheduler.cancel(handle.ticket):
+            self._finish(handle, ChatRequest.CANCELLED, reason=reason)
+
+    def cancel_all(self, reason: str = "cancelado pelo usuário") -> int:
+        with self._lock:
+            handles = list(self._requests)
+        for handle in handles:
+            self.cancel(handle, reason)
+        return len(handles)
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._requests)
+
+    def _run(self, handle: ChatRequest):
+        token = handle.token
+        metrics = handle.request.metrics
+        started = time.monotonic()
+        metrics.queue_wait = started - handle.submitted_at
+        try:
+            folded = self._attach_history(handle)
+            context = self.ai_service.build_context(handle.request)
+            if context is not None:
+                delta = self.context_delta.apply(self.chat_id, handle.history_index, context, since=folded)
+                handle.request.context_message = delta.text
+                context.report.reused = delta.referenced
+            metrics.context_build = time.monotonic() - started
+            if context is not None:
+                self._notify(handle, "on_context_built", context.report)
+            parts = []
+            for delta in self.ai_service.stream(handle.request):
+                if handle.first_chunk_at is None:
+                    handle.first_chunk_at = time.monotonic()
+                parts.append(delta)
+                self._notify(handle, "on_chunk", delta)
+            token.raise_if_cancelled()
+            text = "".join(parts)
+            if handle.save_reply:
+                self.session.save_message(self.chat_id, f"{AI_PREFIX}{text}")
+            self._finish(handle, ChatRequest.DONE, text=text)
+        except RequestCancelled as e:
+            self._finish(handle, ChatRequest.CANCELLED, reason=str(e))
+        except Exception as e:
+            logger.error(f"[ChatController] falha no chat {self.chat_id}: {e}", exc_info=True)
+            self._finish(handle, ChatRequest.FAILED, error=e)
+        finally:
+            token.close()
+
+    def _attach_history(self, handle: ChatRequest) -> int:
+        """
+        Histórico anterior à mensagem do envio: resumo + mensagens recentes,
+        cada mensagem do usuário precedida do contexto (delta) enviado com ela.
+        Respostas a envios anteriores que chegaram depois dela também entram;
+        mensagens enviadas depois dela, não. Retorna o ponto de corte do resumo.
+        """
+        history = self.compactor.compact(self.chat_id, upto=handle.history_index)
+        contexts = self.session.get_contexts(self.chat_id)
+        messages = []
+        for index, message in enumerate(history.messages, start=history.folded):
+            context = contexts.get(index)
+            if context is not None:
+                messages.append({"role": "user", "content": CONTEXT_HEADER + context["text"]})
+            messages.append(message)
+        count = self.session.history_count(self.chat_id)
+        later = self.session.load_history(self.chat_id, before=count,
+                                          limit=max(0, count - handle.history_index - 1))
+        handle.request.summary = history.summary
+        handle.request.history = messages + [
+            to_chat_message(entry) for entry in later if not entry.startswith(USER_PREFIX)
+        ]
+        return history.folded
+
+    def _finish(self, handle, state, text=None, reason=None, error=None):
+        with self._lock:
+            if handle.done():
+                return
+            if handle in self._requests:
+                self._requests.remove(handle)
+            handle.state = state
+            handle.text = text
+            handle.reason = reason
+            handle.error = error
+            handle.finished_at = time.monotonic()
+            # antes de liberar quem espera pelo envio, para que já encontre a medição na sessão
+            self._record_metrics(handle)
+            handle._done.set()
+        if state == ChatRequest.DONE:
+            self._notify(handle, "on_finished", text)
+        elif state == ChatRequest.CANCELLED:
+            self._notify(handle, "on_cancelled", reason)
+        else:
+            self._notify(handle, "on_error", error)
+
+    def _record_metrics(self, handle):
+        metrics = handle.request.metrics
+        if metrics is None:
+            return
+        try:
+            tokens = get_token_counter().count(handle.text) if handle.text else 0
+            metrics.finish(handle.state, handle.submitted_at, handle.first_chunk_at, handle.finished_at, tokens)
+            self.session.add_metrics(self.chat_id, get_telemetry().record(metrics))
+        except Exception as e:
+            logger.error(f"[ChatController] falha ao registrar telemetria: {e}", exc_info=True)
+
+    def telemetry(self) -> list[dict]:
+        """Medições dos envios deste chat, gravadas na sessão."""
+        return self.session.get_metrics(self.chat_id)
+
+    @staticmethod
+    def _notify(handle, event, *args):
+        _call(handle.listener, event, *args)
+
+    def shutdown(self, reason: str = "chat encerrado") -> None:
+        """Cancela os envios em andamento e na fila, sem notificar os listeners."""
+        self.cancel_prefetch()
+        with self._lock:
+            handles, self._requests = self._requests, []
+        for handle in handles:
+            handle.listener = None
+            handle.token.cancel(reason)
+            if handle.ticket is not None:
+                self.scheduler.cancel(handle.ticket)
+
+
+def _read_prompts(path):
+    """Uma entrada por linha: texto puro ou JSON {"prompt", "files"?, "chat"?}."""
+    stream = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    try:
+        for line in stream:
+            line = line.rstrip("\n")
+            if not line.strip():
+                continue
+            if line.lstrip().startswith("{"):
+                entry = json.loads(line)
+                yield entry["prompt"], entry.get("files"), entry.get("chat")
+            else:
+                yield line, None, None
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+def run_batch(argv=None) -> int:
+    """
+    Modo batch: reproduz prompts de um arquivo sem interface gráfica e grava
+    um resultado JSON por linha (status, latências e hash da resposta, para
+    comparar execuções).
+    """
+    parser = argparse.ArgumentParser(prog="python -m core.controller.chat_controller",
+                                     description="Reproduz prompts em lote, sem Qt.")
+    parser.add_argument("prompts", help="arquivo de prompts (uma linha por prompt, texto ou JSON); '-' para stdin")
+    parser.add_argument("-o", "--output", default="-", help="arquivo JSONL de resultados ('-' para stdout)")
+    parser.add_argument("--chats", type=int, default=4, help="chats simultâneos (os prompts são distribuídos entre eles)")
+    parser.add_argument("--workers", type=int, default=None, help="limite global do scheduler (padrão: --chats)")
+    parser.add_argument("--files", nargs="*", default=None, help="anexos aplicados a todos os prompts")
+    parser.add_argument("--agent", default=None)
+    parser.add_argument("--cache", default=None, help="banco do cache de respostas (padrão: sem cache)")
+    parser.add_argument("--deadline", type=float, default=REQUEST_DEADLINE)
+    parser.add_argument("--storage-path", default=None, help="diretório das sessões (padrão: temporário)")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING,
+                        format="%(asctime)s %(name)s %(levelname)s %(message)s")
+
+    storage_path = args.storage_path or tempfile.mkdtemp(prefix="chatbot-batch-")
+    session = SessionService(storage_path=storage_path)
+    ai_service = AIService.from_env(response_cache=ResponseCache(args.cache) if args.cache else None)
+    scheduler = RequestScheduler(max_workers=args.workers or args.chats)
+    controllers = {}
+
+    def controller_for(name):
+        if name not in controllers:
+            controller = ChatController(session.create_chat(), session, ai_service, scheduler, args.deadline)
+            controller.select_agent(args.agent)
+            controllers[name] = controller
+        return controllers[name]
+
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    handles = []
+    started = time.monotonic()
+    try:
+        for index, (prompt, files, chat) in enumerate(_read_prompts(args.prompts)):
+            controller = controller_for(chat if chat is not None else index % max(1, args.chats))
+            files = files if files is not None else args.files
+            handles.append((index, controller.send(prompt, files=files or [])))
+
+        latencies, ttfts = [], []
+        counts = {}
+        for index, handle in handles:
+            handle.wait()
+            total = handle.finished_at - handle.submitted_at
+            ttft = handle.first_chunk_at - handle.submitted_at if handle.first_chunk_at else None
+            counts[handle.state] = counts.get(handle.state, 0) + 1
+            if handle.state == ChatRequest.DONE:
+                latencies.append(total)
+                if ttft is not None:
+                    ttfts.append(ttft)
+            out.write(json.dumps({
+                "index": index,
+                "chat_id": handle.controller.chat_id,
+                "prompt": handle.request.prompt,
+                "state": handle.state,
+                "seconds": round(total, 4),
+                "ttft": round(ttft, 4) if ttft is not None else None,
+                "chars": len(handle.text or ""),
+                "sha256": hashlib.sha256(handle.text.encode("utf-8")).hexdigest() if handle.text is not None else None,
+                "error": str(handle.error or handle.reason or "") or None,
+            }, ensure_ascii=False) + "\n")
+        elapsed = time.monotonic() - started
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        scheduler.shutdown(wait=False)
+        session.close()
+        ai_service.close()
+
+    print(
+        f"{len(handles)} prompt(s) em {elapsed:.2f}s ({len(handles) / elapsed if elapsed else 0:.1f} req/s) | "
+        + " ".join(f"{state}={count}" for state, count in sorted(counts.items()))
+        + f" | latência p50={percentile(latencies, 50):.3f}s p95={percentile(latencies, 95):.3f}s"
+        + f" | ttft p50={percentile(ttfts, 50):.3f}s",
+        file=sys.stderr,
+    )
+    print(format_summary(get_telemetry().recent()), file=sys.stderr)
+    for name, controller in sorted(controllers.items(), key=lambda item: str(item[0])):
+        stats = controller.prompt_cache_stats()
+        if stats is not None:
+            print(f"chat {controller.chat_id}: {stats.summary()}", file=sys.stderr)
+    if not args.storage_path:
+        shutil.rmtree(storage_path, ignore_errors=True)
+    return 0 if counts.get(ChatRequest.FAILED, 0) == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(run_batch())
@@ -0,0 +1,402 @@
+import json
+import logging
+import os
+import socket
+import time
+from dataclasses import dataclass, field, replace
+from typing import Iterator
+
+from core.service.context_builder import DEFAULT_TOKEN_BUDGET, BuiltContext, ContextBuilder
+from core.service.knowledge_base import KnowledgeBaseService
+from core.service.mock_backend import MockBackend, MockProfile
+from core.service.prompt_builder import BuiltPrompt, PromptBuilder, get_prompt_builder
+from core.service.resilience import (
+    CircuitBreaker, RateLimiter, ResilientProvider, RetryPolicy, parse_retry_after
+)
+from core.service.response_cache import ResponseCache, response_key
+from core.service.singleflight import SingleFlight
+from core.service.telemetry import RequestMetrics
+from core.service.tokenizer import MODE_BPE, get_token_counter
+from core.workers.cancellation import CancellationToken
+from infra.http_pool import HttpConnectionPool
+
+logger = logging.getLogger("AIService")
+
+# Trechos consultados nas bases de conhecimento a cada envio.
+KB_SEARCH_K = 24
+
+
+@dataclass
+class AIRequest:
+    """Requisição independente de provedor."""
+    prompt: str
+    context_files: list[str] = field(default_factory=list)
+    model: str | None = None
+    provider: str | None = None
+    agent: str | None = None
+    kb_sources: list[str] = field(default_factory=list)
+    bypass_cache: bool = False
+    history: list[dict] = field(default_factory=list)
+    summary: str | None = None
+    context: BuiltContext | None = None
+    # contexto já renderizado em forma delta (ver ContextDelta); substitui context.render()
+    context_message: str | None = None
+    chat_id: str | None = None
+    token: CancellationToken | None = None
+    # telemetria do envio; o AIService mede os bytes e o provedor HTTP, a conexão
+    metrics: RequestMetrics | None = None
+
+
+def payload_size(request: AIRequest) -> int:
+    """Bytes (UTF-8) do JSON das mensagens que o PromptBuilder monta para `request`."""
+    return len(json.dumps(PromptBuilder.layout(request), ensure_ascii=False).encode("utf-8"))
+
+
+class AIProviderError(Exception):
+    """Falha reportada pelo provedor (status HTTP, payload inválido...)."""
+
+    def __init__(self, message, status=None, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        # segundos pedidos pelo servidor (Retry-After) antes de tentar de novo
+        self.retry_after = retry_after
+
+
+class AIProvider:
+    """
+    Contrato dos provedores: `stream` produz os deltas de texto da resposta.
+
+    Se `request.token` for informado, o provedor deve interromper o stream
+    assim que ele for cancelado (lançando RequestCancelled), sem continuar
+    consumindo o backend.
+    """
+    name = "base"
+
+    def stream(self, request: AIRequest) -> Iterator[str]:
+        raise NotImplementedError
+
+    def complete(self, request: AIRequest) -> str:
+        return "".join(self.stream(request))
+
+    def close(self) -> None:
+        pass
+
+
+class MockProvider(AIProvider):
+    """
+    Provedor local, sem rede, que ecoa o prompt token a token.
+
+    O ritmo, o tamanho e as falhas seguem um MockProfile (ver
+    core/service/mock_backend.py), com semente fixa: execuções repetidas
+    produzem as mesmas respostas e latências. O mesmo perfil servido por
+    tools/fake_ai_server.py exercita o HttpProvider de ponta a ponta.
+    """
+    name = "mock"
+
+    def __init__(self, profile: MockProfile | None = None):
+        self.backend = MockBackend(profile)
+
+    def stream(self, request):
+        cancel = request.token
+        plan = self.backend.plan(request.prompt)
+        if plan.failed:
+            if plan.ttft:
+                (cancel.wait if cancel is not None else time.sleep)(plan.ttft)
+            if cancel is not None:
+                cancel.raise_if_cancelled()
+            raise AIProviderError(f"HTTP {plan.error_status}: falha simulada", status=plan.error_status)
+        for token in plan.play(cancel.wait if cancel is not None else time.sleep):
+            if cancel is not None:
+                cancel.raise_if_cancelled()
+            yield token
+
+
+class HttpProvider(AIProvider):
+    """
+    Provedor compatível com a API de chat completions (streaming via SSE).
+
+    As conexões vêm de um HttpConnectionPool compartilhado, de modo que
+    requisições consecutivas reaproveitam a mesma conexão TCP/TLS. As
+    mensagens são montadas pelo PromptBuilder (ordem estável, amiga do cache
+    de prompt do provedor), que também registra o uso informado no fim do
+    stream quando `include_usage` está ativo.
+    """
+    name = "http"
+
+    def __init__(self, base_url: str, api_key: str | None = None, model: str = "default",
+                 pool: HttpConnectionPool | None = None, path: str = "/v1/chat/completions",
+                 prompts: PromptBuilder | None = None, include_usage: bool = True):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self.model = model
+        self.path = path
+        self.pool = pool or HttpConnectionPool()
+        self.prompts = prompts or get_prompt_builder()
+        self.include_usage = include_usage
+
+    def _build_body(self, prompt: BuiltPrompt, request):
+        body = {
+            "model": request.model or self.model,
+            "messages": prompt.messages,
+            "stream": True,
+        }
+        if self.include_usage:
+            body["stream_options"] = {"include_usage": True}
+        return body
+
+    def _headers(self):
+        headers = {
+            "Content-Type": "application/json",
+            "Accept": "text/event-stream",
+            "Connection": "keep-alive",
+        }
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        return headers
+
+    def stream(self, request):
+        cancel = request.token
+        if cancel is not None:
+            cancel.raise_if_cancelled()
+        url = self.base_url + self.path
+        prompt = self.prompts.build(request)
+        body = json.dumps(self._build_body(prompt, request)).encode("utf-8")
+        metrics = request.metrics
+        started = time.monotonic()
+        conn, resp = self.pool.request("POST", url, body=body, headers=self._headers())
+        if metrics is not None:
+            metrics.connect = time.monotonic() - started
+        reusable = False
+        unregister = None
+        if cancel is not None:
+            # desbloqueia a leitura em curso; a conexão não volta ao pool
+            unregister = cancel.on_cancel(lambda: self._abort(conn))
+        try:
+            if resp.status >= 400:
+                detail = resp.read().decode("utf-8", errors="replace")
+                reusable = not resp.will_close
+                raise AIProviderError(f"HTTP {resp.status}: {detail[:200]}", status=resp.status,
+                                      retry_after=parse_retry_after(resp.getheader("Retry-After")))
+            ttft, usage = None, None
+            try:
+                for event in self._iter_sse(resp):
+                    if event == "[DONE]":
+                        break
+                    delta, event_usage = self._parse_event(event)
+                    usage = event_usage or usage
+                    if delta:
+                        if ttft is None:
+                            ttft = time.monotonic() - started
+                        yield delta
+                    if cancel is not None:
+                        cancel.raise_if_cancelled()
+                # consome o restante para que a conexão possa voltar ao pool
+                resp.read()
+            except OSError:
+                if cancel is not None:
+                    cancel.raise_if_cancelled()
+                raise
+            if cancel is not None:
+                cancel.raise_if_cancelled()
+            reusable = not resp.will_close
+            self.prompts.record_response(prompt, ttft, usage)
+        finally:
+            # a conexão pode ir para outra requisição: este token não pode mais fechá-la
+            if unregister is not None:
+                unregister()
+            self.pool.release(url, conn, reusable=reusable)
+
+    @staticmethod
+    def _abort(conn):
+        sock = conn.sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    @staticmethod
+    def _iter_sse(resp):
+        """Itera os campos `data:` de um stream Server-Sent Events."""
+        while True:
+            line = resp.readline()
+            if not line:
+                return
+            line = line.decode("utf-8").strip()
+            if line.startswith("data:"):
+                yield line[len("data:"):].strip()
+
+    @staticmethod
+    def _parse_event(event):
+        """Texto do delta e, no último evento (stream_options.include_usage), o uso de tokens."""
+        try:
+            payload = json.loads(event)
+        except ValueError:
+            raise AIProviderError(f"evento SSE inválido: {event[:200]}")
+        if "error" in payload:
+            raise AIProviderError(str(payload["error"]))
+        choices = payload.get("choices") or [{}]
+        return (choices[0].get("delta") or {}).get("content") or "", payload.get("usage")
+
+    def close(self):
+        self.pool.close()
+
+
+class AIService:
+    """
+    Registro de provedores e ponto único de acesso à IA.
+
+    Com um ResponseCache configurado, respostas completas ficam guardadas
+    pela impressão digital da requisição (ver response_key); requisições
+    com `bypass_cache=True` sempre vão ao provedor. Requisições idênticas em
+    andamento (mesma chave) compartilham uma única chamada ao provedor.
+
+    Os bytes da telemetria são medidos aqui, do mesmo jeito para qualquer
+    provedor e também para quem pega carona num voo: `bytes_out` é o JSON
+    das mensagens montadas pelo PromptBuilder e `bytes_in`, o texto dos
+    deltas recebidos. Respostas do cache não contam bytes.
+    """
+
+    def __init__(self, providers: list[AIProvider] | None = None, default: str | None = None,
+                 response_cache: ResponseCache | None = None,
+                 context_builder: ContextBuilder | None = None,
+                 knowledge_bases: KnowledgeBaseService | None = None):
+        self._providers = {}
+        for provider in providers or [MockProvider()]:
+            self.register(provider)
+        self.default = default or next(iter(self._providers))
+        self.response_cache = response_cache
+        self.context_builder = context_builder or ContextBuilder()
+        self.knowledge_bases = knowledge_bases
+        self.flights = SingleFlight()
+
+    @classmethod
+    def from_env(cls, response_cache: ResponseCache | None = None,
+                 knowledge_bases: KnowledgeBaseService | None = None):
+        """
+        CHATBOT_AI_BASE_URL (e opcionalmente CHATBOT_AI_API_KEY e
+        CHATBOT_AI_MODEL) ativam o HttpProvider como padrão; sem elas, usa o
+        MockProvider local, configurado por CHATBOT_MOCK_* (ver
+        MockProfile.from_env). CHATBOT_CONTEXT_TOKENS define o orçamento de
+        tokens dos anexos e CHATBOT_TOKEN_MODE (`bpe`/`heuristic`), o modo
+        de contagem.
+
+        O HttpProvider é envolvido por um ResilientProvider: CHATBOT_AI_RPM e
+        CHATBOT_AI_TPM limitam requisições e tokens por minuto (sem limite se
+        ausentes), CHATBOT_AI_RETRIES define as tentativas e
+        CHATBOT_AI_BREAKER_FAILURES / CHATBOT_AI_BREAKER_RESET (s) o disjuntor.
+        CHATBOT_AI_USAGE=0 desliga o pedido de `usage` no stream, para
+        servidores que não aceitam `stream_options`.
+        """
+        providers = [MockProvider(MockProfile.from_env())]
+        default = MockProvider.name
+        base_url = os.environ.get("CHATBOT_AI_BASE_URL")
+        if base_url:
+            env = os.environ.get
+            providers.append(ResilientProvider(
+                HttpProvider(
+                    base_url,
+                    api_key=env("CHATBOT_AI_API_KEY"),
+                    model=env("CHATBOT_AI_MODEL", "default"),
+                    include_usage=env("CHATBOT_AI_USAGE", "1") != "0",
+                ),
+                limiter=RateLimiter(rpm=float(env("CHATBOT_AI_RPM", 0)), tpm=float(env("CHATBOT_AI_TPM", 0))),
+                breaker=CircuitBreaker(
+                    failure_threshold=int(env("CHATBOT_AI_BREAKER_FAILURES", 5)),
+                    reset_timeout=float(env("CHATBOT_AI_BREAKER_RESET", 30)),
+                    name=HttpProvider.name,
+                ),
+                retry=RetryPolicy(max_attempts=int(env("CHATBOT_AI_RETRIES", 3))),
+            ))
+            default = HttpProvider.name
+        logger.info(f"[AIService] provedor padrão: {default}")
+        context_builder = ContextBuilder(
+            token_budget=int(os.environ.get("CHATBOT_CONTEXT_TOKENS", DEFAULT_TOKEN_BUDGET)),
+            counter=get_token_counter(os.environ.get("CHATBOT_TOKEN_MODE", MODE_BPE)),
+        )
+        return cls(providers, default, response_cache, context_builder, knowledge_bases)
+
+    def register(self, provider: AIProvider) -> None:
+        self._providers[provider.name] = provider
+
+    def get(self, name: str | None = None) -> AIProvider:
+        name = name or self.default
+        try:
+            return self._providers[name]
+        except KeyError:
+            raise AIProviderError(f"provedor desconhecido: {name}")
+
+    def build_context(self, request: AIRequest) -> BuiltContext | None:
+        """
+        Lê os anexos da requisição e consulta as bases de conhecimento
+        selecionadas (uma única vez), guardando o resultado em `request.context`.
+        """
+        if request.context is not None:
+            return request.context
+        use_kb = bool(request.kb_sources) and self.knowledge_bases is not None
+        if not request.context_files and not use_kb:
+            return None
+        context = self.context_builder.build(request.context_files, token=request.token, query=request.prompt)
+        if use_kb:
+            hits = self.knowledge_bases.search(request.kb_sources, request.prompt, k=KB_SEARCH_K)
+            self.context_builder.extend(context, hits, self.knowledge_bases.token_budget)
+        request.context = context
+        return context
+
+    def prefetch(self, request: AIRequest) -> None:
+        """
+        Aquece, antes do envio, o que `build_context` vai precisar para
+        `request`: leitura, hash e contagem dos anexos, índice de recuperação,
+        vetor da consulta e as bases de conhecimento selecionadas. Não monta
+        nem guarda o contexto; o envio refaz só o que mudou desde então.
+        """
+        if request.context_files:
+            self.context_builder.warm(request.context_files, token=request.token, query=request.prompt)
+        if request.kb_sources and self.knowledge_bases is not None:
+            if request.token is not None:
+                request.token.raise_if_cancelled()
+            self.knowledge_bases.search(request.kb_sources, request.prompt, k=KB_SEARCH_K)
+
+    def stream(self, request: AIRequest) -> Iterator[str]:
+        provider = self.get(request.provider)
+        self.build_context(request)
+        key = response_key(request)
+        if self.response_cache is not None and not request.bypass_cache:
+            cached = self.response_cache.get(key)
+            if cached is not None:
+                logger.info(f"[AIService] resposta servida do cache ({key[:12]})")
+                if request.metrics is not None:
+                    request.metrics.cached = True
+                yield cached
+                return
+        metrics = request.metrics
+        if metrics is not None:
+            metrics.bytes_out = payload_size(request)
+        for delta in self.flights.stream(
+            key, lambda upstream: self._produce(provider, request, key, upstream), request.token
+        ):
+            if metrics is not None:
+                metrics.bytes_in += len(delta.encode("utf-8"))
+            yield delta
+
+    def _produce(self, provider, request, key, upstream):
+        """Chamada upstream de um voo; grava a resposta completa no cache."""
+        parts = []
+        for delta in provider.stream(replace(request, token=upstream)):
+            parts.append(delta)
+            yield delta
+        if self.response_cache is not None:
+            self.response_cache.put(key, "".join(parts))
+
+    def complete(self, request: AIRequest) -> str:
+        return "".join(self.stream(request))
+
+    def close(self) -> None:
+        self.context_builder.close()
+        if self.response_cache is not None:
+            self.response_cache.close()
+        for provider in self._providers.values():
+            try:
+                provider.close()
+            except Exception as e:
+                logger.error(f"[AIService] falha ao fechar {provider.name}: {e}", exc_info=True)
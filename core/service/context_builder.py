@@ -0,0 +1,375 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from core.service.retrieval import CHUNK_CHARS, RetrievalIndex
+from core.service.tokenizer import TokenCounter, get_token_counter
+from core.workers.cancellation import CancellationToken
+from infra.file_cache import READ_BLOCK, FileSnapshotCache, get_file_cache
+
+logger = logging.getLogger("ContextBuilder")
+
+# Orçamento padrão de tokens para o conteúdo dos anexos.
+DEFAULT_TOKEN_BUDGET = 32_000
+# Arquivos maiores que isso são lidos só até este limite (e marcados como truncados).
+MAX_FILE_BYTES = 1024 * 1024
+# Bytes iniciais inspecionados para decidir se o arquivo é binário.
+BINARY_SNIFF_BYTES = 8192
+# Memória máxima usada para manter o texto já lido entre envios.
+TEXT_CACHE_BYTES = 64 * 1024 * 1024
+# Memória máxima do índice de recuperação dos anexos (trechos + vetores).
+INDEX_MAX_BYTES = 64 * 1024 * 1024
+# Trechos truncados menores que isso (em tokens) são descartados.
+MIN_TRUNCATED_TOKENS = 64
+# Mínimo de trechos buscados no modo de recuperação e tamanho médio estimado de um trecho.
+RETRIEVAL_MIN_K = 16
+RETRIEVAL_CHUNK_TOKENS = CHUNK_CHARS // 4
+# Diretórios ignorados ao expandir uma pasta anexada.
+IGNORED_DIRS = {".git", ".hg", ".svn", "__pycache__", "node_modules", ".venv", "venv", ".idea"}
+# Abertura da mensagem que leva os anexos ao provedor.
+CONTEXT_HEADER = "Arquivos de contexto:\n\n"
+
+
+def expand_paths(paths):
+    """Caminhos dos arquivos, com as pastas expandidas recursivamente."""
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                dirs[:] = sorted(d for d in dirs if d not in IGNORED_DIRS)
+                for name in names:
+                    yield os.path.join(root, name)
+        else:
+            yield path
+
+
+def is_binary(raw: bytes) -> bool:
+    return b"\0" in raw[:BINARY_SNIFF_BYTES]
+
+
+class ContextFile:
+    """Conteúdo de um anexo incluído no contexto."""
+
+    def __init__(self, path, sha256, text, tokens, truncated=False, lines=None, source=None):
+        self.path = path
+        self.sha256 = sha256
+        self.text = text
+        self.tokens = tokens
+        self.truncated = truncated
+        self.lines = lines
+        self.source = source
+
+    @property
+    def label(self) -> str:
+        label = f"{self.path}:{self.lines[0]}-{self.lines[1]}" if self.lines is not None else self.path
+        return f"kb/{self.source}:{label}" if self.source is not None else label
+
+    @property
+    def heading(self) -> str:
+        if self.lines is not None:
+            suffix = f" (linhas {self.lines[0]}-{self.lines[1]})"
+        else:
+            suffix = " (truncado)" if self.truncated else ""
+        prefix = f"[{self.source}] " if self.source is not None else ""
+        return f"### {prefix}{self.path}{suffix}"
+
+
+class ContextReport:
+    """Resumo do que entrou (ou não) no contexto de um envio."""
+
+    def __init__(self, token_budget):
+        self.token_budget = token_budget
+        self.mode = "full"
+        self.tokens = 0
+        self.chunks = 0
+        self.kb_chunks = 0
+        self.kb_tokens = 0
+        self.reused = 0
+        self.included = []
+        self.truncated = []
+        self.binary = []
+        self.duplicates = []
+        self.unreadable = []
+        self.omitted = []
+
+    def summary(self) -> str:
+        mode = f"{self.chunks} trecho(s) de " if self.mode == "retrieval" else ""
+        return (
+            f"{mode}{len(self.included)} arquivo(s), {self.tokens}/{self.token_budget} tokens"
+            f" | truncados={len(self.truncated)} binários={len(self.binary)}"
+            f" duplicados={len(self.duplicates)} ilegíveis={len(self.unreadable)}"
+            f" fora do orçamento={len(self.omitted)}"
+            + (f" | bases: {self.kb_chunks} trecho(s), {self.kb_tokens} tokens" if self.kb_chunks else "")
+            + (f" | {self.reused} bloco(s) já enviados nesta conversa" if self.reused else "")
+        )
+
+
+class BuiltContext:
+    """Resultado do ContextBuilder: arquivos incluídos, em ordem, e o relatório."""
+
+    def __init__(self, files: list[ContextFile], report: ContextReport):
+        self.files = files
+        self.report = report
+
+    @property
+    def fingerprints(self) -> list[list[str]]:
+        return [[f.label, f.sha256] for f in self.files]
+
+    def render(self) -> str:
+        return "\n\n".join(f"{f.heading}\n{f.text}" for f in self.files)
+
+
+class _Entry:
+    __slots__ = ("mtime_ns", "size", "sha256", "text", "binary", "tokens")
+
+    def __init__(self, mtime_ns, size, sha256, text, binary, tokens=0):
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.sha256 = sha256
+        self.text = text
+        self.binary = binary
+        self.tokens = tokens
+
+
+class ContextBuilder:
+    """
+    Monta o contexto dos anexos ativos de um envio.
+
+    - Leitura concorrente em um pool de threads; pastas são expandidas.
+    - Arquivos binários são ignorados e conteúdos idênticos entram uma vez.
+    - O texto lido fica em cache por (path, mtime, size): reenvios com os
+      mesmos anexos custam apenas um `stat` por arquivo.
+    - Se tudo cabe no orçamento, os arquivos vão inteiros, na ordem dos
+      caminhos. Se não cabe e há um prompt (`query`), entram só os trechos
+      mais similares a ele (RetrievalIndex), reordenados por arquivo/linha.
+      Sem prompt, o primeiro arquivo que não cabe é truncado e os seguintes,
+      omitidos. Em todos os casos o mesmo conjunto de arquivos e prompt
+      gera sempre o mesmo contexto.
+    """
+
+    def __init__(self, token_budget: int = DEFAULT_TOKEN_BUDGET, max_workers: int | None = None,
+                 counter: TokenCounter | None = None, file_cache: FileSnapshotCache | None = None,
+                 index: RetrievalIndex | None = None):
+        self.token_budget = token_budget
+        self.index = index or RetrievalIndex(max_bytes=INDEX_MAX_BYTES)
+        self.counter = counter or get_token_counter()
+        self.file_cache = file_cache or get_file_cache()
+        self._max_workers = max_workers or min(32, (os.cpu_count() or 1) + 4)
+        self._executor = None
+        self._entries = OrderedDict()
+        self._cached_bytes = 0
+        self._lock = threading.Lock()
+
+    def build(self, paths: list[str], token: CancellationToken | None = None,
+              token_budget: int | None = None, query: str | None = None) -> BuiltContext:
+        budget = self.token_budget if token_budget is None else token_budget
+        report = ContextReport(budget)
+        candidates = self._candidates(paths, report, token)
+        if query and self.index is not None and sum(e.tokens for _, e in candidates) > budget:
+            included = self._retrieve(query, candidates, budget, report, token)
+        else:
+            included = self._pack(candidates, budget, report)
+        logger.info(f"[ContextBuilder] {report.summary()}")
+        return BuiltContext(included, report)
+
+    def warm(self, paths: list[str], token: CancellationToken | None = None,
+             token_budget: int | None = None, query: str | None = None) -> int:
+        """
+        Adianta o trabalho de um `build` futuro sem montar o contexto: lê,
+        hasheia e conta os anexos e, se eles forem para o modo de
+        recuperação, indexa os trechos e vetoriza `query`. Retorna quantos
+        arquivos ficaram prontos.
+        """
+        budget = self.token_budget if token_budget is None else token_budget
+        candidates = self._candidates(paths, ContextReport(budget), token)
+        if query and self.index is not None and sum(e.tokens for _, e in candidates) > budget:
+            self._index(candidates, token)
+            self.index.embedder.embed_query(query)
+        return len(candidates)
+
+    def _candidates(self, paths, report, token):
+        """Anexos legíveis e de texto, sem conteúdos repetidos; o resto vai para o relatório."""
+        files = sorted(set(expand_paths(paths)))
+        if token is not None:
+            token.raise_if_cancelled()
+
+        futures = [self._pool().submit(self._read, path) for path in files]
+        entries = []
+        try:
+            for path, future in zip(files, futures):
+                if token is not None:
+                    token.raise_if_cancelled()
+                entries.append((path, future.result()))
+        finally:
+            for future in futures:
+                future.cancel()
+
+        candidates = []
+        seen = set()
+        for path, entry in entries:
+            if entry is None:
+                report.unreadable.append(path)
+                continue
+            if entry.binary:
+                report.binary.append(path)
+                continue
+            if entry.sha256 in seen:
+                report.duplicates.append(path)
+                continue
+            seen.add(entry.sha256)
+            candidates.append((path, entry))
+        return candidates
+
+    def _pack(self, candidates, budget, report):
+        """Arquivos inteiros, em ordem de caminho, até esgotar o orçamento."""
+        included = []
+        exhausted = False
+        for path, entry in candidates:
+            remaining = budget - report.tokens
+            tokens = entry.tokens
+            truncated = entry.size > MAX_FILE_BYTES
+            text = entry.text
+            if tokens > remaining:
+                if exhausted or remaining < MIN_TRUNCATED_TOKENS:
+                    exhausted = True
+                    report.omitted.append(path)
+                    continue
+                exhausted = True
+                text = self._truncate(text, remaining)
+                tokens = self.counter.count(text)
+                truncated = True
+            if truncated:
+                report.truncated.append(path)
+            report.included.append(path)
+            report.tokens += tokens
+            included.append(ContextFile(path, entry.sha256, text, tokens, truncated))
+        return included
+
+    def _retrieve(self, query, candidates, budget, report, token):
+        """
+        Os anexos não cabem inteiros: indexa os trechos (uma vez por conteúdo)
+        e inclui os mais similares ao prompt até esgotar o orçamento.
+        """
+        report.mode = "retrieval"
+        self._index(candidates, token)
+
+        paths = [path for path, _ in candidates]
+        k = max(RETRIEVAL_MIN_K, 2 * budget // RETRIEVAL_CHUNK_TOKENS)
+        selected = []
+        for score, chunk in self.index.search(query, k=k, paths=paths):
+            tokens = self.counter.count(chunk.text)
+            if report.tokens + tokens > budget:
+                continue
+            report.tokens += tokens
+            selected.append(chunk)
+        selected.sort(key=lambda c: (c.path, c.start))
+
+        chosen = {c.path for c in selected}
+        report.included = sorted(chosen)
+        report.omitted = [path for path in paths if path not in chosen]
+        report.chunks = len(selected)
+        return [
+            ContextFile(c.path, c.sha256, c.text, self.counter.count(c.text), lines=(c.start, c.end))
+            for c in selected
+        ]
+
+    def _index(self, candidates, token):
+        """Indexa os trechos dos anexos (só os de conteúdo ainda não indexado)."""
+        futures = [self._pool().submit(self.index.add, path, entry.text, entry.sha256)
+                   for path, entry in candidates]
+        try:
+            for future in futures:
+                if token is not None:
+                    token.raise_if_cancelled()
+                future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def extend(self, context: BuiltContext, hits, token_budget: int) -> None:
+        """
+        Acrescenta ao contexto trechos de bases de conhecimento ((score, base,
+        trecho), do mais relevante ao menos) até `token_budget` tokens.
+        """
+        report = context.report
+        selected = []
+        for _, source, chunk in hits:
+            tokens = self.counter.count(chunk.text)
+            if report.kb_tokens + tokens > token_budget:
+                continue
+            report.kb_tokens += tokens
+            selected.append(ContextFile(chunk.path, chunk.sha256, chunk.text, tokens,
+                                        lines=(chunk.start, chunk.end), source=source))
+        selected.sort(key=lambda f: (f.source, f.path, f.lines))
+        report.kb_chunks += len(selected)
+        context.files.extend(selected)
+
+    def _truncate(self, text, max_tokens):
+        """Maior prefixo (cortado em fim de linha, se possível) que cabe em `max_tokens`."""
+        lo, hi = 0, len(text)
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if self.counter.count(text[:mid]) <= max_tokens:
+                lo = mid
+            else:
+                hi = mid - 1
+        cut = text.rfind("\n", 0, lo)
+        return text[:cut + 1] if cut > lo // 2 else text[:lo]
+
+    def _read(self, path):
+        try:
+            stat = os.stat(path)
+            with self._lock:
+                entry = self._entries.get(path)
+                if entry is not None and entry.mtime_ns == stat.st_mtime_ns and entry.size == stat.st_size:
+                    self._entries.move_to_end(path)
+                    return entry
+            with open(path, "rb") as f:
+                raw = f.read(MAX_FILE_BYTES)
+                # o hash cobre o arquivo inteiro: arquivos grandes com o mesmo
+                # início não podem ser tomados por duplicados
+                digest = hashlib.sha256(raw)
+                for block in iter(lambda: f.read(READ_BLOCK), b""):
+                    digest.update(block)
+            sha256 = digest.hexdigest()
+            if is_binary(raw):
+                entry = _Entry(stat.st_mtime_ns, stat.st_size, sha256, None, True)
+            else:
+                text = raw.decode("utf-8", errors="replace")
+                tokens = self.counter.count_file(path, text=text, stat=stat)
+                entry = _Entry(stat.st_mtime_ns, stat.st_size, sha256, text, False, tokens)
+            # o hash do arquivo inteiro já é conhecido: poupa a releitura em response_key
+            self.file_cache.store(path, stat.st_mtime_ns, stat.st_size, sha256)
+            self._remember(path, entry)
+            return entry
+        except OSError as e:
+            logger.warning(f"[ContextBuilder] não foi possível ler {path}: {e}")
+            return None
+
+    def _remember(self, path, entry):
+        size = len(entry.text) if entry.text else 0
+        with self._lock:
+            previous = self._entries.pop(path, None)
+            if previous is not None and previous.text:
+                self._cached_bytes -= len(previous.text)
+            self._entries[path] = entry
+            self._cached_bytes += size
+            while self._cached_bytes > TEXT_CACHE_BYTES and len(self._entries) > 1:
+                _, old = self._entries.popitem(last=False)
+                if old.text:
+                    self._cached_bytes -= len(old.text)
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self._max_workers,
+                                                    thread_name_prefix="ContextBuilder")
+            return self._executor
+
+    def close(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,112 @@
+import hashlib
+import logging
+import zlib
+
+from core.service.context_builder import BuiltContext
+from core.service.prompt_builder import canonical_files
+from core.service.session_service import SessionService
+
+logger = logging.getLogger("ContextDelta")
+
+# Tamanho mínimo e máximo (caracteres) de um bloco de anexo.
+BLOCK_MIN_CHARS = 400
+BLOCK_MAX_CHARS = 2400
+# Uma linha fecha o bloco quando o seu hash é múltiplo deste valor (~1 corte a cada N linhas).
+BLOCK_BOUNDARY = 16
+UNCHANGED_FILE = "inalterado, conteúdo já enviado nesta conversa"
+UNCHANGED_BLOCK = "[linhas {start}-{end} inalteradas, já enviadas nesta conversa]\n"
+
+
+def split_blocks(text: str) -> list[tuple[int, int, str]]:
+    """
+    Quebra `text` em blocos de linhas (início, fim, texto), 1-based.
+
+    Os cortes dependem do conteúdo das linhas, não da posição: editar
+    algumas linhas muda apenas os blocos que as contêm, e inserir linhas
+    não desloca os cortes do resto do arquivo.
+    """
+    lines = text.splitlines(keepends=True)
+    blocks, start, size = [], 0, 0
+    for i, line in enumerate(lines):
+        size += len(line)
+        boundary = size >= BLOCK_MIN_CHARS and zlib.crc32(line.rstrip().encode("utf-8")) % BLOCK_BOUNDARY == 0
+        if boundary or size >= BLOCK_MAX_CHARS or i == len(lines) - 1:
+            blocks.append((start + 1, i + 1, "".join(lines[start:i + 1])))
+            start, size = i + 1, 0
+    return blocks
+
+
+def block_key(source: str | None, path: str, text: str) -> str:
+    return hashlib.sha256(f"{source or ''}\0{path}\0{text}".encode("utf-8")).hexdigest()[:32]
+
+
+class DeltaResult:
+    """Contexto de um envio em forma delta e quantos blocos foram enviados ou referenciados."""
+
+    def __init__(self, text: str | None, sent: int = 0, referenced: int = 0, referenced_chars: int = 0):
+        self.text = text
+        self.sent = sent
+        self.referenced = referenced
+        self.referenced_chars = referenced_chars
+
+
+class ContextDelta:
+    """
+    Envia só o que mudou nos anexos entre mensagens de um mesmo chat.
+
+    Cada anexo é quebrado em blocos (split_blocks) identificados por hash.
+    O contexto de cada mensagem é guardado na sessão já em forma delta,
+    com os hashes dos blocos enviados por inteiro, e volta ao provedor como
+    parte do histórico (ver ChatController._attach_history). Um bloco cujo
+    hash foi enviado numa mensagem ainda visível no histórico (a partir de
+    `since`, o ponto de corte do resumo) vira apenas uma referência; os
+    demais seguem completos.
+    """
+
+    def __init__(self, session: SessionService):
+        self.session = session
+
+    def apply(self, chat_id: str, turn: int, context: BuiltContext, since: int = 0) -> DeltaResult:
+        """Renderiza o contexto da mensagem `turn` e o registra na sessão."""
+        if not context.files:
+            return DeltaResult(None)
+        seen = set()
+        for index, stored in self.session.get_contexts(chat_id).items():
+            if since <= index < turn:
+                seen.update(stored["chunks"])
+
+        result = DeltaResult(None)
+        parts, sent_keys = [], []
+        for f in canonical_files(context.files):
+            offset = f.lines[0] - 1 if f.lines is not None else 0
+            blocks = [(start, end, text, block_key(f.source, f.path, text)) for start, end, text in split_blocks(f.text)]
+            if blocks and all(key in seen for *_, key in blocks):
+                parts.append(f"{f.heading} — {UNCHANGED_FILE}")
+                result.referenced += len(blocks)
+                result.referenced_chars += len(f.text)
+                continue
+            body, unchanged = [], None
+            for start, end, text, key in blocks:
+                if key in seen:
+                    # blocos inalterados consecutivos viram uma única referência
+                    unchanged = (unchanged[0] if unchanged else start, end)
+                    result.referenced += 1
+                    result.referenced_chars += len(text)
+                    continue
+                if unchanged:
+                    body.append(UNCHANGED_BLOCK.format(start=unchanged[0] + offset, end=unchanged[1] + offset))
+                    unchanged = None
+                body.append(text)
+                sent_keys.append(key)
+                result.sent += 1
+            if unchanged:
+                if body and not body[-1].endswith("\n"):
+                    body.append("\n")
+                body.append(UNCHANGED_BLOCK.format(start=unchanged[0] + offset, end=unchanged[1] + offset))
+            parts.append(f"{f.heading}\n" + "".join(body))
+        result.text = "\n\n".join(parts)
+        self.session.set_context(chat_id, turn, result.text, sent_keys)
+        if result.referenced:
+            logger.info(f"[ContextDelta] chat {chat_id}: {result.sent} bloco(s) enviados, "
+                        f"{result.referenced} referenciados ({result.referenced_chars} caracteres poupados)")
+        return result
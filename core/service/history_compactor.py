@@ -0,0 +1,110 @@
+import logging
+import re
+
+from core.service.session_service import SessionService
+from core.service.tokenizer import TokenCounter, get_token_counter
+
+logger = logging.getLogger("HistoryCompactor")
+
+# Mensagens mais recentes enviadas sempre na íntegra.
+KEEP_RECENT = 8
+# O resumo avança em blocos deste tamanho: só é recalculado quando um bloco
+# inteiro de mensagens sai da janela recente.
+SUMMARY_BLOCK = 16
+# Orçamento de tokens do resumo acumulado.
+SUMMARY_TOKENS = 800
+# Tamanho máximo de cada linha do resumo (caracteres).
+SUMMARY_LINE_CHARS = 240
+
+USER_PREFIX = "Você: "
+AI_PREFIX = "AI: "
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+
+def to_chat_message(entry: str) -> dict:
+    """Converte uma entrada salva ("Você: ..."/"AI: ...") em {role, content}."""
+    if entry.startswith(USER_PREFIX):
+        return {"role": "user", "content": entry[len(USER_PREFIX):]}
+    if entry.startswith(AI_PREFIX):
+        return {"role": "assistant", "content": entry[len(AI_PREFIX):]}
+    return {"role": "assistant", "content": entry}
+
+
+class CompactedHistory:
+    """Histórico a enviar: resumo das mensagens antigas + mensagens recentes."""
+
+    def __init__(self, summary: str | None, messages: list[dict], folded: int):
+        self.summary = summary
+        self.messages = messages
+        self.folded = folded
+
+
+class HistoryCompactor:
+    """
+    Mantém as últimas mensagens na íntegra e dobra as anteriores num resumo
+    acumulado, salvo na sessão (SessionService.set_summary).
+
+    O ponto de corte anda em blocos de `block` mensagens; enquanto ele não
+    muda, o resumo salvo é reaproveitado. Quando muda, só as mensagens novas
+    do bloco são resumidas e somadas ao resumo anterior.
+
+    `summarize(previous, entries)` pode ser trocado (ex.: por um resumo feito
+    pelo modelo); o padrão é extrativo e local: a primeira frase de cada
+    mensagem, descartando as linhas mais antigas quando passa do orçamento.
+    """
+
+    def __init__(self, session: SessionService, keep_recent: int = KEEP_RECENT, block: int = SUMMARY_BLOCK,
+                 summary_tokens: int = SUMMARY_TOKENS, summarize=None, counter: TokenCounter | None = None):
+        self.session = session
+        self.keep_recent = keep_recent
+        self.block = block
+        self.summary_tokens = summary_tokens
+        self.summarize = summarize or self._extractive
+        self.counter = counter or get_token_counter()
+
+    def fold_point(self, count: int) -> int:
+        """Quantas das `count` mensagens entram no resumo."""
+        fold = max(0, count - self.keep_recent)
+        return fold - fold % self.block
+
+    def compact(self, chat_id: str, upto: int | None = None) -> CompactedHistory:
+        """
+        Histórico compactado das `upto` primeiras mensagens (todas, se None).
+        Só são lidas do histórico as mensagens recentes e as que ainda
+        faltam no resumo salvo.
+        """
+        total = self.session.history_count(chat_id)
+        count = total if upto is None else max(0, min(upto, total))
+        fold = self.fold_point(count)
+        summary, previous, start = None, None, fold
+        if fold:
+            stored = self.session.get_summary(chat_id)
+            if stored is not None and stored["upto"] == fold:
+                summary = stored["text"]
+            elif stored is not None and stored["upto"] < fold:
+                previous, start = stored["text"], stored["upto"]
+            else:
+                start = 0
+        entries = self.session.load_history(chat_id, before=count, limit=count - start)
+        if fold and summary is None:
+            summary = self.summarize(previous, entries[:fold - start])
+            self.session.set_summary(chat_id, fold, summary)
+            logger.info(f"[HistoryCompactor] resumo do chat {chat_id} avançou para {fold} mensagens")
+        messages = [to_chat_message(entry) for entry in entries[fold - start:]]
+        return CompactedHistory(summary, messages, fold)
+
+    def _extractive(self, previous: str | None, entries: list[str]) -> str:
+        lines = previous.splitlines() if previous else []
+        for entry in entries:
+            message = to_chat_message(entry)
+            speaker = "Usuário" if message["role"] == "user" else "IA"
+            text = " ".join(message["content"].split())
+            first = _SENTENCE_END.split(text, maxsplit=1)[0]
+            if len(first) > SUMMARY_LINE_CHARS:
+                first = first[:SUMMARY_LINE_CHARS - 1].rstrip() + "…"
+            if first:
+                lines.append(f"- {speaker}: {first}")
+        while len(lines) > 1 and self.counter.count("\n".join(lines)) > self.summary_tokens:
+            lines.pop(0)
+        return "\n".join(lines)
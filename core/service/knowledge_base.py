@@ -0,0 +1,269 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+
+import numpy as np
+
+from core.service.context_builder import MAX_FILE_BYTES, expand_paths, is_binary
+from core.service.retrieval import Chunk, RetrievalIndex
+from core.workers.cancellation import CancellationToken
+
+logger = logging.getLogger("KnowledgeBase")
+
+# Orçamento padrão de tokens para os trechos das bases selecionadas.
+KB_TOKEN_BUDGET = 4_000
+# Similaridade mínima para um trecho entrar no contexto.
+KB_MIN_SCORE = 0.15
+# Escopos exibidos no seletor de fontes.
+SCOPES = ["Pessoal", "Compartilhada", "Comunidade"]
+META_FILE = "kb.json"
+INDEX_FILE = "index.json"
+VECTORS_FILE = "vectors.npy"
+
+
+class RefreshResult:
+    """Contagem de arquivos por desfecho em uma atualização incremental."""
+
+    def __init__(self):
+        self.added = 0
+        self.updated = 0
+        self.removed = 0
+        self.unchanged = 0
+        self.skipped = 0
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.added or self.updated or self.removed)
+
+    def __str__(self):
+        return (f"novos={self.added} alterados={self.updated} removidos={self.removed} "
+                f"inalterados={self.unchanged} ignorados={self.skipped}")
+
+
+class KnowledgeBase:
+    """
+    Coleção de documentos locais indexada para recuperação.
+
+    Fica em `<root>/<id>/`: `kb.json` (metadados e fontes), `index.json`
+    (estado de cada arquivo e o texto dos trechos) e `vectors.npy` (matriz
+    de vetores). Consultas usam só o índice salvo; os documentos de origem
+    são lidos apenas por `refresh`, e apenas os que mudaram.
+    """
+
+    def __init__(self, directory: str, meta: dict):
+        self.directory = directory
+        self.meta = meta
+        self._files = None
+        self._index = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    @property
+    def id(self) -> str:
+        return self.meta["id"]
+
+    @property
+    def name(self) -> str:
+        return self.meta["name"]
+
+    @property
+    def sources(self) -> list[str]:
+        return list(self.meta.get("sources", []))
+
+    def summary(self) -> dict:
+        return {
+            "name": self.name,
+            "description": self.meta.get("description") or
+            f"{self.meta.get('file_count', 0)} arquivo(s), {self.meta.get('chunk_count', 0)} trecho(s)",
+        }
+
+    def search(self, query: str, k: int = 10) -> list[tuple[float, Chunk]]:
+        with self._lock:
+            self._ensure_loaded()
+            index = self._index
+        return index.search(query, k=k)
+
+    def refresh(self, token: CancellationToken | None = None) -> RefreshResult:
+        """
+        Sincroniza o índice com as fontes: arquivos com mesmo (mtime, size)
+        não são lidos; lidos com o mesmo sha256 não são revetorizados.
+        """
+        result = RefreshResult()
+        with self._refresh_lock:
+            # consultas continuam atendidas durante a atualização
+            with self._lock:
+                self._ensure_loaded()
+            seen = set()
+            dirty = False
+            for path in sorted(set(expand_paths(self.sources))):
+                if token is not None:
+                    token.raise_if_cancelled()
+                try:
+                    stat = os.stat(path)
+                    seen.add(path)
+                    state = self._files.get(path)
+                    if state is not None and state["mtime_ns"] == stat.st_mtime_ns and state["size"] == stat.st_size:
+                        result.unchanged += 1
+                        continue
+                    with open(path, "rb") as f:
+                        raw = f.read(MAX_FILE_BYTES)
+                except OSError as e:
+                    logger.warning(f"[KnowledgeBase] não foi possível ler {path}: {e}")
+                    result.skipped += 1
+                    continue
+                sha256 = hashlib.sha256(raw).hexdigest()
+                binary = is_binary(raw)
+                new_state = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "sha256": sha256, "binary": binary}
+                dirty = True
+                if state is not None and state["sha256"] == sha256:
+                    self._files[path] = new_state
+                    result.unchanged += 1
+                    continue
+                if binary:
+                    self._index.remove(path)
+                    result.skipped += 1
+                else:
+                    self._index.add(path, raw.decode("utf-8", errors="replace"), sha256)
+                    if state is None:
+                        result.added += 1
+                    else:
+                        result.updated += 1
+                self._files[path] = new_state
+            for path in set(self._files) - seen:
+                del self._files[path]
+                self._index.remove(path)
+                result.removed += 1
+                dirty = True
+            if dirty:
+                self._save()
+        logger.info(f"[KnowledgeBase] '{self.name}' atualizada: {result}")
+        return result
+
+    def _ensure_loaded(self):
+        # chamado com o lock adquirido
+        if self._index is not None:
+            return
+        self._files, self._index = {}, RetrievalIndex()
+        index_path = os.path.join(self.directory, INDEX_FILE)
+        if not os.path.exists(index_path):
+            return
+        try:
+            with open(index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            matrix = np.load(os.path.join(self.directory, VECTORS_FILE))
+            self._index.restore(data["records"], matrix)
+            self._files = data["files"]
+        except Exception as e:
+            # índice corrompido ou incompleto: o próximo refresh reindexa tudo
+            logger.error(f"[KnowledgeBase] falha ao carregar índice de '{self.name}': {e}", exc_info=True)
+            self._files, self._index = {}, RetrievalIndex()
+
+    def _save(self):
+        # chamado durante o refresh; cada arquivo é gravado de forma atômica
+        records, matrix = self._index.dump()
+        _write_atomic(os.path.join(self.directory, VECTORS_FILE), lambda f: np.save(f, matrix), binary=True)
+        _write_atomic(os.path.join(self.directory, INDEX_FILE),
+                      lambda f: json.dump({"files": self._files, "records": records}, f, ensure_ascii=False))
+        self.meta.update(
+            updated_at=time.time(),
+            file_count=len(records),
+            chunk_count=int(len(matrix)),
+        )
+        self.save_meta()
+
+    def save_meta(self):
+        _write_atomic(os.path.join(self.directory, META_FILE),
+                      lambda f: json.dump(self.meta, f, ensure_ascii=False, indent=2))
+
+
+def _write_atomic(path, write, binary=False):
+    tmp = path + ".tmp"
+    with open(tmp, "wb" if binary else "w", **({} if binary else {"encoding": "utf-8"})) as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+class KnowledgeBaseService:
+    """Registro das bases de conhecimento persistidas em `root`."""
+
+    def __init__(self, root: str = "knowledge_bases", token_budget: int = KB_TOKEN_BUDGET):
+        self.root = root
+        self.token_budget = token_budget
+        self._bases = None
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _load(self):
+        # chamado com o lock adquirido
+        if self._bases is not None:
+            return self._bases
+        self._bases = {}
+        for entry in sorted(os.listdir(self.root)):
+            meta_path = os.path.join(self.root, entry, META_FILE)
+            if not os.path.isfile(meta_path):
+                continue
+            try:
+                with open(meta_path, "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+                self._bases[meta["name"]] = KnowledgeBase(os.path.join(self.root, entry), meta)
+            except Exception as e:
+                logger.error(f"[KnowledgeBaseService] falha ao ler {meta_path}: {e}", exc_info=True)
+        return self._bases
+
+    def list_bases(self, scope: str | None = None) -> list[KnowledgeBase]:
+        with self._lock:
+            bases = self._load().values()
+            return [kb for kb in bases if scope is None or kb.meta.get("scope") == scope]
+
+    def get(self, name: str) -> KnowledgeBase | None:
+        with self._lock:
+            return self._load().get(name)
+
+    def create(self, name: str, sources: list[str], description: str = "", scope: str = SCOPES[0]) -> KnowledgeBase:
+        """Registra a base; o conteúdo só é indexado no primeiro `refresh`."""
+        with self._lock:
+            bases = self._load()
+            if name in bases:
+                raise ValueError(f"já existe uma base chamada '{name}'")
+            kb_id = str(uuid.uuid4())[:8]
+            directory = os.path.join(self.root, kb_id)
+            os.makedirs(directory)
+            meta = {
+                "id": kb_id, "name": name, "description": description, "scope": scope,
+                "sources": [os.path.abspath(s) for s in sources],
+                "created_at": time.time(), "updated_at": None, "file_count": 0, "chunk_count": 0,
+            }
+            kb = KnowledgeBase(directory, meta)
+            kb.save_meta()
+            bases[name] = kb
+        logger.info(f"[KnowledgeBaseService] base '{name}' criada ({kb_id})")
+        return kb
+
+    def delete(self, name: str) -> bool:
+        with self._lock:
+            kb = self._load().pop(name, None)
+        if kb is None:
+            return False
+        shutil.rmtree(kb.directory, ignore_errors=True)
+        logger.info(f"[KnowledgeBaseService] base '{name}' removida")
+        return True
+
+    def search(self, names: list[str], query: str, k: int = 10,
+               min_score: float = KB_MIN_SCORE) -> list[tuple[float, str, Chunk]]:
+        """Os `k` melhores trechos entre as bases `names`: (score, base, trecho)."""
+        hits = []
+        for name in sorted(set(names)):
+            kb = self.get(name)
+            if kb is None:
+                logger.warning(f"[KnowledgeBaseService] base desconhecida: {name}")
+                continue
+            hits.extend((score, name, chunk) for score, chunk in kb.search(query, k) if score >= min_score)
+        hits.sort(key=lambda hit: (-hit[0], hit[1], hit[2].path, hit[2].start))
+        return hits[:k]
@@ -0,0 +1,150 @@
+import hashlib
+import logging
+import math
+import os
+import random
+import re
+import threading
+import time
+
+logger = logging.getLogger("MockBackend")
+
+# Vocabulário do enchimento das respostas simuladas.
+FILLER_WORDS = (
+    "o", "a", "de", "para", "com", "uma", "função", "arquivo", "classe", "teste", "valor", "retorno",
+    "dados", "serviço", "contexto", "resposta", "exemplo", "código", "módulo", "lista", "erro", "cache",
+)
+RESPONSE_PREFIX = "Simulação de resposta da IA para o prompt: "
+
+
+class MockProfile:
+    """
+    Perfil de carga do backend simulado.
+
+    - `ttft`: segundos até o primeiro token (± `ttft_jitter`, fração);
+    - `tokens_per_second`: ritmo do stream depois do primeiro token (0 = sem espera);
+    - `error_rate`: fração das requisições que falham com `error_status`;
+    - `mean_tokens` / `size_sigma`: tamanho da resposta, log-normal com essa
+      média (0 = apenas ecoa o prompt) e esse desvio em escala log;
+      `max_tokens` limita a cauda;
+    - `seed`: semente; a mesma semente e os mesmos prompts geram as mesmas
+      respostas, latências e falhas.
+    """
+
+    def __init__(self, ttft: float = 0.0, tokens_per_second: float = 20.0, error_rate: float = 0.0,
+                 error_status: int = 500, mean_tokens: int = 0, size_sigma: float = 0.5,
+                 max_tokens: int = 4096, ttft_jitter: float = 0.0, seed: int = 0):
+        self.ttft = ttft
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.mean_tokens = mean_tokens
+        self.size_sigma = size_sigma
+        self.max_tokens = max_tokens
+        self.ttft_jitter = ttft_jitter
+        self.seed = seed
+
+    @classmethod
+    def from_env(cls, environ=None) -> "MockProfile":
+        """CHATBOT_MOCK_TTFT, _TTFT_JITTER, _TPS, _ERROR_RATE, _ERROR_STATUS, _TOKENS, _SIGMA, _MAX_TOKENS e _SEED."""
+        env = (environ if environ is not None else os.environ).get
+        return cls(
+            ttft=float(env("CHATBOT_MOCK_TTFT", 0.0)),
+            ttft_jitter=float(env("CHATBOT_MOCK_TTFT_JITTER", 0.0)),
+            tokens_per_second=float(env("CHATBOT_MOCK_TPS", 20.0)),
+            error_rate=float(env("CHATBOT_MOCK_ERROR_RATE", 0.0)),
+            error_status=int(env("CHATBOT_MOCK_ERROR_STATUS", 500)),
+            mean_tokens=int(env("CHATBOT_MOCK_TOKENS", 0)),
+            size_sigma=float(env("CHATBOT_MOCK_SIGMA", 0.5)),
+            max_tokens=int(env("CHATBOT_MOCK_MAX_TOKENS", 4096)),
+            seed=int(env("CHATBOT_MOCK_SEED", 0)),
+        )
+
+    def add_arguments(self, parser) -> None:
+        """Opções de linha de comando equivalentes, com os valores deste perfil como padrão."""
+        parser.add_argument("--ttft", type=float, default=self.ttft, help="segundos até o primeiro token")
+        parser.add_argument("--ttft-jitter", type=float, default=self.ttft_jitter, help="variação relativa do ttft")
+        parser.add_argument("--tps", type=float, default=self.tokens_per_second, help="tokens por segundo")
+        parser.add_argument("--error-rate", type=float, default=self.error_rate, help="fração de requisições que falham")
+        parser.add_argument("--error-status", type=int, default=self.error_status, help="status HTTP das falhas")
+        parser.add_argument("--mean-tokens", type=int, default=self.mean_tokens, help="tamanho médio da resposta (0 = eco)")
+        parser.add_argument("--size-sigma", type=float, default=self.size_sigma, help="desvio log-normal do tamanho")
+        parser.add_argument("--max-tokens", type=int, default=self.max_tokens)
+        parser.add_argument("--seed", type=int, default=self.seed)
+
+    @classmethod
+    def from_args(cls, args) -> "MockProfile":
+        return cls(ttft=args.ttft, ttft_jitter=args.ttft_jitter, tokens_per_second=args.tps, error_rate=args.error_rate,
+                   error_status=args.error_status, mean_tokens=args.mean_tokens, size_sigma=args.size_sigma,
+                   max_tokens=args.max_tokens, seed=args.seed)
+
+
+class MockPlan:
+    """Roteiro de uma resposta: espera inicial, tokens e intervalo, ou a falha."""
+
+    def __init__(self, ttft: float, tokens: list[str], interval: float, error_status: int | None):
+        self.ttft = ttft
+        self.tokens = tokens
+        self.interval = interval
+        self.error_status = error_status
+
+    @property
+    def failed(self) -> bool:
+        return self.error_status is not None
+
+    def play(self, wait=time.sleep):
+        """
+        Itera os tokens respeitando o ritmo do perfil; `wait(seconds)` pode
+        ser trocado por uma espera cancelável (CancellationToken.wait).
+        Os instantes são absolutos, então atrasos do consumidor não se acumulam.
+        """
+        start = time.monotonic()
+        for i, token in enumerate(self.tokens):
+            due = start + self.ttft + i * self.interval
+            delay = due - time.monotonic()
+            if delay > 0:
+                wait(delay)
+            yield token
+
+
+class MockBackend:
+    """
+    Gera roteiros determinísticos a partir de um MockProfile.
+
+    Cada roteiro usa um RNG próprio derivado de (semente, prompt, ocorrência
+    desse prompt): o resultado não depende da ordem em que requisições
+    concorrentes chegam, só de quantas vezes o mesmo prompt já foi visto.
+    Usado tanto pelo MockProvider (em processo) quanto pelo servidor falso
+    de tools/fake_ai_server.py (via HTTP/SSE).
+    """
+
+    def __init__(self, profile: MockProfile | None = None):
+        self.profile = profile or MockProfile()
+        self._seen = {}
+        self._lock = threading.Lock()
+
+    def plan(self, prompt: str) -> MockPlan:
+        profile = self.profile
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        with self._lock:
+            occurrence = self._seen.get(digest, 0)
+            self._seen[digest] = occurrence + 1
+        rng = random.Random(f"{profile.seed}:{digest}:{occurrence}")
+
+        ttft = profile.ttft * (1 + rng.uniform(-profile.ttft_jitter, profile.ttft_jitter))
+        interval = 1.0 / profile.tokens_per_second if profile.tokens_per_second > 0 else 0.0
+        if rng.random() < profile.error_rate:
+            return MockPlan(ttft, [], interval, profile.error_status)
+
+        tokens = re.findall(r"\S+\s*", RESPONSE_PREFIX + prompt)
+        if profile.mean_tokens > 0:
+            # log-normal com média `mean_tokens`: mu = ln(média) - sigma²/2
+            sigma = profile.size_sigma
+            size = rng.lognormvariate(math.log(profile.mean_tokens) - sigma * sigma / 2, sigma)
+            size = max(1, min(profile.max_tokens, round(size)))
+            tokens = tokens[:size]
+            if len(tokens) < size:
+                tokens[-1] = tokens[-1].rstrip() + " "
+                tokens.extend(rng.choice(FILLER_WORDS) + " " for _ in range(size - len(tokens)))
+                tokens[-1] = tokens[-1].rstrip()
+        return MockPlan(ttft, tokens, interval, None)
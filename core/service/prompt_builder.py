@@ -0,0 +1,200 @@
+import hashlib
+import json
+import logging
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+from core.service.context_builder import CONTEXT_HEADER, ContextFile
+from core.service.tokenizer import TokenCounter, get_token_counter
+
+logger = logging.getLogger("PromptBuilder")
+
+SUMMARY_HEADER = "Resumo da conversa até aqui:\n"
+AGENT_INSTRUCTION = "Você está respondendo como o agente \"{agent}\"."
+# Fração mínima do prompt reaproveitada para considerar a requisição "quente" (sem uso informado pelo provedor).
+WARM_PREFIX_RATIO = 0.5
+# Mensagens com contagem de tokens memorizada.
+TOKEN_MEMO_ENTRIES = 4096
+
+
+def canonical_files(files: list[ContextFile]) -> list[ContextFile]:
+    """
+    Ordem canônica dos trechos de contexto: bases de conhecimento (por base,
+    caminho e linhas) e depois os anexos (por caminho e linhas), sem depender
+    da ordem em que foram selecionados na interface.
+    """
+    def key(f):
+        return (f.source is None, f.source or "", f.path, f.lines or (0, 0))
+    return sorted(files, key=key)
+
+
+def render_files(files: list[ContextFile]) -> str:
+    return "\n\n".join(f"{f.heading}\n{f.text}" for f in canonical_files(files))
+
+
+class PromptCacheStats:
+    """
+    Contabilidade de cache de prefixo de um chat.
+
+    `prefix_tokens` é a estimativa local (tokens do maior prefixo de
+    mensagens idêntico ao da requisição anterior); `cached_tokens` é o
+    que o provedor informou em `usage`, quando informa.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.prefix_tokens = 0
+        self.reported = 0
+        self.reported_prompt_tokens = 0
+        self.cached_tokens = 0
+        self.warm = 0
+        self.warm_ttft = 0.0
+        self.cold = 0
+        self.cold_ttft = 0.0
+
+    @property
+    def hit_ratio(self) -> float:
+        """Fração dos tokens de prompt servida do cache (informada pelo provedor, se houver)."""
+        if self.reported:
+            return self.cached_tokens / self.reported_prompt_tokens if self.reported_prompt_tokens else 0.0
+        return self.prefix_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+
+    def summary(self) -> str:
+        warm = self.warm_ttft / self.warm if self.warm else 0.0
+        cold = self.cold_ttft / self.cold if self.cold else 0.0
+        return (
+            f"{self.requests} requisição(ões), prefixo reaproveitável {self.prefix_tokens}/{self.prompt_tokens} tokens"
+            + (f", cache do provedor {self.cached_tokens}/{self.reported_prompt_tokens} tokens" if self.reported else "")
+            + f" ({self.hit_ratio:.0%}) | ttft quente={warm:.3f}s ({self.warm}) frio={cold:.3f}s ({self.cold})"
+        )
+
+
+class BuiltPrompt:
+    """Mensagens de uma requisição, seus tokens e quantos repetem o prefixo da anterior."""
+
+    def __init__(self, chat_id, messages: list[dict], tokens: int, prefix_tokens: int):
+        self.chat_id = chat_id
+        self.messages = messages
+        self.tokens = tokens
+        self.prefix_tokens = prefix_tokens
+
+
+class PromptBuilder:
+    """
+    Monta as mensagens enviadas ao provedor numa ordem estável, do mais ao
+    menos duradouro, para que o prefixo seja idêntico byte a byte entre
+    mensagens de um mesmo chat e aproveite o cache de prompt do provedor:
+
+    1. instrução do agente (system);
+    2. resumo acumulado do histórico (system; muda a cada bloco dobrado);
+    3. histórico, com o contexto delta de cada mensagem anterior;
+    4. contexto desta mensagem: bases de conhecimento e anexos, em ordem
+       canônica (ver canonical_files);
+    5. a nova mensagem.
+
+    Também contabiliza, por chat, quanto do prompt repete o prefixo da
+    requisição anterior e quanto o provedor informou ter servido do cache.
+    """
+
+    def __init__(self, counter: TokenCounter | None = None):
+        self.counter = counter or get_token_counter()
+        self._chains = {}
+        self._stats = {}
+        self._counts = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def layout(request) -> list[dict]:
+        messages = []
+        if request.agent:
+            messages.append({"role": "system", "content": AGENT_INSTRUCTION.format(agent=request.agent)})
+        if request.summary:
+            messages.append({"role": "system", "content": SUMMARY_HEADER + request.summary})
+        messages.extend(request.history)
+        if request.context_message is not None:
+            messages.append({"role": "user", "content": CONTEXT_HEADER + request.context_message})
+        elif request.context is not None and request.context.files:
+            messages.append({"role": "user", "content": CONTEXT_HEADER + render_files(request.context.files)})
+        messages.append({"role": "user", "content": request.prompt})
+        return messages
+
+    def build(self, request) -> BuiltPrompt:
+        """Mensagens da requisição; registra o prefixo reaproveitado no chat `request.chat_id`."""
+        messages = self.layout(request)
+        chain, tokens, digest = [], 0, hashlib.sha256()
+        for message in messages:
+            digest.update(json.dumps(message, ensure_ascii=False, sort_keys=True).encode("utf-8"))
+            tokens += self._tokens(message["content"])
+            chain.append((digest.copy().hexdigest(), tokens))
+        # cada agente tem sua própria cadeia: num fan-out, um não apaga o prefixo do outro
+        key = (request.chat_id, request.agent)
+        with self._lock:
+            previous = self._chains.get(key, [])
+            prefix = 0
+            for (h1, t1), (h2, _) in zip(chain, previous):
+                if h1 != h2:
+                    break
+                prefix = t1
+            self._chains[key] = chain
+            stats = self._stats.setdefault(request.chat_id, PromptCacheStats())
+            stats.requests += 1
+            stats.prompt_tokens += tokens
+            stats.prefix_tokens += prefix
+        return BuiltPrompt(request.chat_id, messages, tokens, prefix)
+
+    def _tokens(self, content):
+        # o histórico se repete a cada mensagem: a contagem é memorizada por conteúdo
+        key = hashlib.sha256(content.encode("utf-8")).digest()
+        with self._lock:
+            tokens = self._counts.get(key)
+            if tokens is not None:
+                self._counts.move_to_end(key)
+                return tokens
+        tokens = self.counter.count(content)
+        with self._lock:
+            self._counts[key] = tokens
+            while len(self._counts) > TOKEN_MEMO_ENTRIES:
+                self._counts.popitem(last=False)
+        return tokens
+
+    def record_response(self, prompt: BuiltPrompt, ttft: float | None, usage: dict | None = None) -> None:
+        """Uso informado pelo provedor (formato chat completions) e o tempo até o primeiro token."""
+        cached = None
+        with self._lock:
+            stats = self._stats.setdefault(prompt.chat_id, PromptCacheStats())
+            if usage:
+                details = usage.get("prompt_tokens_details") or {}
+                cached = int(details.get("cached_tokens") or 0)
+                stats.reported += 1
+                stats.reported_prompt_tokens += int(usage.get("prompt_tokens") or 0)
+                stats.cached_tokens += cached
+            if ttft is None:
+                return
+            if cached is not None:
+                warm = cached > 0
+            else:
+                warm = bool(prompt.tokens) and prompt.prefix_tokens / prompt.tokens >= WARM_PREFIX_RATIO
+            if warm:
+                stats.warm += 1
+                stats.warm_ttft += ttft
+            else:
+                stats.cold += 1
+                stats.cold_ttft += ttft
+
+    def stats(self, chat_id: str | None) -> PromptCacheStats | None:
+        with self._lock:
+            return self._stats.get(chat_id)
+
+    def forget(self, chat_id: str | None) -> None:
+        with self._lock:
+            for key in [key for key in self._chains if key[0] == chat_id]:
+                del self._chains[key]
+            self._stats.pop(chat_id, None)
+
+
+@lru_cache(maxsize=None)
+def get_prompt_builder() -> PromptBuilder:
+    """Instância compartilhada, para que a contabilidade de cada chat sobreviva entre provedores."""
+    return PromptBuilder()
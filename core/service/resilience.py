@@ -0,0 +1,309 @@
+import http.client
+import logging
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+from core.service.tokenizer import TokenCounter, get_token_counter
+from core.workers.cancellation import CancellationToken, RequestCancelled
+
+logger = logging.getLogger("Resilience")
+
+# Espera máxima (s) por vaga no limitador antes de desistir da requisição.
+MAX_RATE_WAIT = 10.0
+# Status HTTP que valem nova tentativa.
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+# Maior Retry-After (s) respeitado; acima disso a requisição desiste na hora.
+MAX_RETRY_AFTER = 60.0
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Segundos pedidos pelo cabeçalho Retry-After (número ou data HTTP), ou None."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimitExceeded(Exception):
+    """O limitador exigiria esperar mais que o permitido."""
+
+    def __init__(self, message, wait=None):
+        super().__init__(message)
+        self.wait = wait
+
+
+class CircuitOpenError(Exception):
+    """O provedor está marcado como indisponível; a chamada nem foi feita."""
+
+
+class TokenBucket:
+    """
+    Balde de fichas com reposição contínua de `rate_per_minute`.
+
+    `reserve` reserva as fichas na hora (o saldo pode ficar negativo) e
+    informa quanto esperar; assim a ordem de chegada é respeitada sem que
+    threads fiquem disputando o balde. `charge` debita consumo conhecido
+    só depois (ex.: tokens da resposta).
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: float | None = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self._level = self.capacity
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._level = min(self.capacity, self._level + (now - self._stamp) * self.rate)
+        self._stamp = now
+
+    def reserve(self, amount: float, max_wait: float | None = None) -> float:
+        """
+        Reserva `amount` fichas e retorna quantos segundos esperar até elas
+        existirem. Se passar de `max_wait`, nada é reservado e levanta
+        RateLimitExceeded.
+        """
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill(time.monotonic())
+            deficit = amount - self._level
+            wait = deficit / self.rate if deficit > 0 else 0.0
+            if max_wait is not None and wait > max_wait:
+                raise RateLimitExceeded(f"limite de taxa: espera de {wait:.1f}s", wait=wait)
+            self._level -= amount
+            return wait
+
+    def refund(self, amount: float) -> None:
+        with self._lock:
+            self._level = min(self.capacity, self._level + amount)
+
+    def charge(self, amount: float) -> None:
+        with self._lock:
+            self._refill(time.monotonic())
+            self._level -= amount
+
+
+class RateLimiter:
+    """Limites por minuto de requisições (rpm) e de tokens (tpm) de um provedor."""
+
+    def __init__(self, rpm: float | None = None, tpm: float | None = None, max_wait: float = MAX_RATE_WAIT):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.max_wait = max_wait
+
+    def acquire(self, tokens: int = 0, cancel: CancellationToken | None = None) -> float:
+        """
+        Espera (cancelável) pela vaga; retorna os segundos esperados. Se a
+        espera passar de `max_wait` ou do prazo do token, falha na hora com
+        RateLimitExceeded em vez de prender a thread.
+        """
+        max_wait = self.max_wait
+        if cancel is not None and cancel.remaining() is not None:
+            max_wait = min(max_wait, cancel.remaining())
+        wait = 0.0
+        if self.requests is not None:
+            wait = self.requests.reserve(1, max_wait)
+        if self.tokens is not None and tokens:
+            try:
+                wait = max(wait, self.tokens.reserve(tokens, max_wait))
+            except RateLimitExceeded:
+                if self.requests is not None:
+                    self.requests.refund(1)
+                raise
+        if wait > 0:
+            if cancel is None:
+                time.sleep(wait)
+            elif cancel.wait(wait):
+                self._refund(tokens)
+                cancel.raise_if_cancelled()
+        return wait
+
+    def _refund(self, tokens):
+        if self.requests is not None:
+            self.requests.refund(1)
+        if self.tokens is not None and tokens:
+            self.tokens.refund(tokens)
+
+    def charge_tokens(self, tokens: int) -> None:
+        if self.tokens is not None and tokens:
+            self.tokens.charge(tokens)
+
+
+class CircuitBreaker:
+    """
+    Disjuntor: após `failure_threshold` falhas seguidas abre e recusa
+    chamadas por `reset_timeout` segundos; depois deixa passar uma chamada
+    de teste (meio-aberto), que fecha o circuito se der certo.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, name: str = "provider"):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.name = name
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probe = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> None:
+        with self._lock:
+            if self.state == self.OPEN:
+                remaining = self._opened_at + self.reset_timeout - time.monotonic()
+                if remaining > 0:
+                    raise CircuitOpenError(f"{self.name} indisponível; nova tentativa em {remaining:.0f}s")
+                self.state = self.HALF_OPEN
+                self._probe = False
+            if self.state == self.HALF_OPEN:
+                if self._probe:
+                    raise CircuitOpenError(f"{self.name} em teste; aguarde")
+                self._probe = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info(f"[CircuitBreaker] {self.name} recuperado")
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probe = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"[CircuitBreaker] {self.name} aberto após {self.failures} falha(s)")
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probe = False
+
+    def release_probe(self) -> None:
+        """Libera a vaga de teste sem contar sucesso nem falha (ex.: cancelamento)."""
+        with self._lock:
+            self._probe = False
+
+
+class RetryPolicy:
+    """Novas tentativas com backoff exponencial e jitter completo."""
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.5, max_delay: float = 8.0,
+                 rng: random.Random | None = None):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.rng = rng or random.Random()
+
+    def delay(self, attempt: int, exc: Exception | None = None) -> float:
+        """
+        Espera antes da tentativa `attempt + 1` (attempt começa em 1). Se a
+        falha trouxer `retry_after` (cabeçalho Retry-After de um 429/503),
+        espera o que o servidor pediu.
+        """
+        retry_after = getattr(exc, "retry_after", None)
+        if retry_after is not None:
+            return retry_after
+        return self.rng.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    @staticmethod
+    def retryable(exc: Exception) -> bool:
+        if isinstance(exc, (RequestCancelled, RateLimitExceeded, CircuitOpenError)):
+            return False
+        status = getattr(exc, "status", None)
+        if status is not None:
+            return status in RETRYABLE_STATUS
+        return isinstance(exc, (OSError, http.client.HTTPException))
+
+
+class ResilientProvider:
+    """
+    Envolve um provedor com limitador de taxa, novas tentativas e disjuntor.
+
+    Só há nova tentativa enquanto nenhum trecho foi entregue: depois do
+    primeiro delta, uma falha é repassada como está (o texto parcial já
+    chegou à UI). Só falhas transitórias (RetryPolicy.retryable) contam
+    para o disjuntor: um 400/401/413 diz respeito à requisição, não à saúde
+    do provedor. Quando o disjuntor está aberto, as chamadas falham na hora
+    com CircuitOpenError.
+
+    Um Retry-After maior que MAX_RETRY_AFTER ou que o prazo restante do
+    token encerra as tentativas em vez de esperar em vão.
+    """
+
+    def __init__(self, provider, limiter: RateLimiter | None = None, breaker: CircuitBreaker | None = None,
+                 retry: RetryPolicy | None = None, counter: TokenCounter | None = None):
+        self.provider = provider
+        self.name = provider.name
+        self.limiter = limiter or RateLimiter()
+        self.breaker = breaker or CircuitBreaker(name=provider.name)
+        self.retry = retry or RetryPolicy()
+        self.counter = counter or get_token_counter()
+
+    def _input_tokens(self, request):
+        tokens = self.counter.count(request.prompt) + self.counter.count(request.summary or "")
+        tokens += sum(self.counter.count(m["content"]) for m in request.history)
+        if request.context_message is not None:
+            tokens += self.counter.count(request.context_message)
+        elif request.context is not None:
+            tokens += request.context.report.tokens + request.context.report.kb_tokens
+        return tokens
+
+    def stream(self, request):
+        cancel = request.token
+        attempt = 0
+        while True:
+            attempt += 1
+            self.breaker.allow()
+            delivered = False
+            try:
+                self.limiter.acquire(self._input_tokens(request), cancel)
+                output = []
+                for delta in self.provider.stream(request):
+                    delivered = True
+                    output.append(delta)
+                    yield delta
+                self.breaker.record_success()
+                self.limiter.charge_tokens(self.counter.count("".join(output)))
+                return
+            except (GeneratorExit, RequestCancelled, RateLimitExceeded):
+                # consumidor desistiu ou sem vaga: nada a dizer sobre a saúde do provedor
+                self.breaker.release_probe()
+                raise
+            except Exception as e:
+                retryable = self.retry.retryable(e)
+                if retryable:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.release_probe()
+                if delivered or attempt >= self.retry.max_attempts or not retryable:
+                    raise
+                delay = self.retry.delay(attempt, e)
+                remaining = cancel.remaining() if cancel is not None else None
+                if delay > MAX_RETRY_AFTER or (remaining is not None and delay > remaining):
+                    logger.warning(f"[ResilientProvider] {self.name}: {e}; espera de {delay:.1f}s "
+                                   f"excede o limite, sem nova tentativa")
+                    raise
+                logger.warning(f"[ResilientProvider] {self.name}: {e}; tentativa {attempt + 1} em {delay:.2f}s")
+                if cancel is not None:
+                    if cancel.wait(delay):
+                        cancel.raise_if_cancelled()
+                else:
+                    time.sleep(delay)
+
+    def complete(self, request) -> str:
+        return "".join(self.stream(request))
+
+    def close(self) -> None:
+        self.provider.close()
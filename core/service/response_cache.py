@@ -0,0 +1,148 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from infra.file_cache import FileSnapshotCache, get_file_cache
+
+logger = logging.getLogger("ResponseCache")
+
+# Orçamento de disco do cache de respostas.
+MAX_BYTES = 64 * 1024 * 1024
+# Validade padrão de uma resposta (s).
+DEFAULT_TTL = 7 * 24 * 3600
+
+
+def response_key(request, file_cache: FileSnapshotCache | None = None) -> str:
+    """
+    Impressão digital de uma requisição: prompt, histórico enviado,
+    modelo/provedor, agente, fontes de conhecimento e o hash do conteúdo de
+    cada arquivo de contexto
+    (o do contexto já montado, quando houver). Arquivos alterados no disco
+    geram outra chave.
+    """
+    if request.context is not None:
+        files = request.context.fingerprints
+    else:
+        file_cache = file_cache or get_file_cache()
+        files = [[path, file_cache.fingerprint(path)] for path in sorted(set(request.context_files))]
+    payload = {
+        "prompt": request.prompt,
+        "model": request.model,
+        "provider": request.provider,
+        "agent": request.agent,
+        "kb_sources": sorted(request.kb_sources),
+        "files": files,
+        "summary": request.summary,
+        "history": request.history,
+    }
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True).encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()
+
+
+class ResponseCache:
+    """
+    Cache persistente de respostas em SQLite, com TTL por entrada e despejo
+    LRU quando o total armazenado passa de `max_bytes`.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS responses (
+            key         TEXT PRIMARY KEY,
+            response    TEXT NOT NULL,
+            size        INTEGER NOT NULL,
+            created_at  REAL NOT NULL,
+            accessed_at REAL NOT NULL,
+            expires_at  REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed_at);
+    """
+
+    SQL_GET = "SELECT response, expires_at FROM responses WHERE key = ?"
+    SQL_TOUCH = "UPDATE responses SET accessed_at = ? WHERE key = ?"
+    SQL_DELETE = "DELETE FROM responses WHERE key = ?"
+    SQL_PUT = (
+        "INSERT OR REPLACE INTO responses (key, response, size, created_at, accessed_at, expires_at) "
+        "VALUES (?, ?, ?, ?, ?, ?)"
+    )
+    SQL_SIZE_OF = "SELECT size FROM responses WHERE key = ?"
+    SQL_TOTAL = "SELECT COALESCE(SUM(size), 0) FROM responses"
+    SQL_PURGE_EXPIRED = "DELETE FROM responses WHERE expires_at <= ?"
+    SQL_OLDEST = "SELECT key, size FROM responses ORDER BY accessed_at LIMIT ?"
+
+    def __init__(self, path: str = os.path.join("cache", "responses.db"),
+                 max_bytes: int = MAX_BYTES, ttl: float = DEFAULT_TTL):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(self.SCHEMA)
+        self._conn.execute(self.SQL_PURGE_EXPIRED, (time.time(),))
+        self._total = self._conn.execute(self.SQL_TOTAL).fetchone()[0]
+
+    def get(self, key: str) -> str | None:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(self.SQL_GET, (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            response, expires_at = row
+            if expires_at <= now:
+                self._delete(key)
+                self.misses += 1
+                return None
+            self._conn.execute(self.SQL_TOUCH, (now, key))
+            self.hits += 1
+            return response
+
+    def put(self, key: str, response: str, ttl: float | None = None) -> None:
+        size = len(response.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            try:
+                previous = self._conn.execute(self.SQL_SIZE_OF, (key,)).fetchone()
+                self._conn.execute(self.SQL_PUT, (key, response, size, now, now, now + (ttl or self.ttl)))
+                self._total += size - (previous[0] if previous else 0)
+                self._evict()
+            except Exception as e:
+                logger.error(f"[ResponseCache] falha ao gravar resposta: {e}", exc_info=True)
+
+    def _delete(self, key):
+        row = self._conn.execute(self.SQL_SIZE_OF, (key,)).fetchone()
+        if row:
+            self._conn.execute(self.SQL_DELETE, (key,))
+            self._total -= row[0]
+
+    def _evict(self):
+        """Remove as entradas menos usadas até caber no orçamento."""
+        if self._total <= self.max_bytes:
+            return
+        self._conn.execute(self.SQL_PURGE_EXPIRED, (time.time(),))
+        self._total = self._conn.execute(self.SQL_TOTAL).fetchone()[0]
+        evicted = 0
+        while self._total > self.max_bytes:
+            rows = self._conn.execute(self.SQL_OLDEST, (32,)).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                self._conn.execute(self.SQL_DELETE, (key,))
+                self._total -= size
+                evicted += 1
+                if self._total <= self.max_bytes:
+                    break
+        if evicted:
+            logger.info(f"[ResponseCache] {evicted} entrada(s) despejada(s) (total={self._total} bytes)")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,296 @@
+import hashlib
+import logging
+import re
+import threading
+import zlib
+from collections import Counter, OrderedDict
+from functools import lru_cache
+
+import numpy as np
+
+logger = logging.getLogger("Retrieval")
+
+# Dimensão dos vetores de n-gramas (hashing trick).
+DEFAULT_DIM = 512
+# Tamanho alvo de um trecho, em caracteres, e a sobreposição entre trechos vizinhos.
+CHUNK_CHARS = 1200
+CHUNK_OVERLAP = 200
+# Consultas com vetor memorizado (o prefetch vetoriza o prompt antes do envio).
+QUERY_CACHE_ENTRIES = 256
+
+_WORDS = re.compile(r"\w+", re.UNICODE)
+
+
+@lru_cache(maxsize=1 << 16)
+def _word_grams(word: str) -> tuple[str, ...]:
+    """Trigramas de caracteres de uma palavra e, em identificadores snake_case, suas partes."""
+    parts = tuple(part for part in word.split("_") if len(part) > 1) if "_" in word else ()
+    if len(word) <= 3:
+        return parts
+    padded = f"<{word}>"
+    return parts + tuple("#" + padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+@lru_cache(maxsize=1 << 18)
+def _hash(feature: str) -> int:
+    return zlib.crc32(feature.encode("utf-8"))
+
+
+class Chunk:
+    """Trecho de um arquivo (linhas `start`..`end`, 1-based) e seu conteúdo."""
+
+    __slots__ = ("path", "start", "end", "text", "sha256")
+
+    def __init__(self, path, start, end, text):
+        self.path = path
+        self.start = start
+        self.end = end
+        self.text = text
+        self.sha256 = hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def __repr__(self):
+        return f"<Chunk {self.path}:{self.start}-{self.end}>"
+
+
+def chunk_text(path: str, text: str, max_chars: int = CHUNK_CHARS, overlap: int = CHUNK_OVERLAP) -> list[Chunk]:
+    """Quebra `text` em trechos de até ~`max_chars`, sempre em fim de linha, com sobreposição."""
+    lines = text.splitlines(keepends=True)
+    chunks = []
+    start = 0
+    while start < len(lines):
+        end, size = start, 0
+        while end < len(lines) and (size + len(lines[end]) <= max_chars or end == start):
+            size += len(lines[end])
+            end += 1
+        chunks.append(Chunk(path, start + 1, end, "".join(lines[start:end])))
+        if end >= len(lines):
+            break
+        # recua algumas linhas para que o próximo trecho comece com contexto
+        back, carried = end, 0
+        while back > start + 1 and carried + len(lines[back - 1]) <= overlap:
+            back -= 1
+            carried += len(lines[back])
+        start = back
+    return chunks
+
+
+class HashedNgramEmbedder:
+    """
+    Vetores esparsos de n-gramas projetados em `dim` posições por hash
+    (estável entre execuções): palavras, pares de palavras e trigramas de
+    caracteres de cada palavra, que aproximam identificadores parecidos.
+    """
+
+    def __init__(self, dim: int = DEFAULT_DIM):
+        self.dim = dim
+
+    @staticmethod
+    def features(text: str) -> Counter:
+        words = _WORDS.findall(text.lower())
+        features = Counter(words)
+        features.update(map(" ".join, zip(words, words[1:])))
+        for word, count in list(features.items()):
+            if " " not in word:
+                for gram in _word_grams(word):
+                    features[gram] += count
+        return features
+
+    def embed(self, texts: list[str]) -> np.ndarray:
+        """Matriz (len(texts), dim) em float32 com linhas normalizadas (L2)."""
+        rows, hashes, counts = [], [], []
+        for row, text in enumerate(texts):
+            features = self.features(text)
+            rows.append(np.full(len(features), row, dtype=np.int64))
+            hashes.extend(map(_hash, features))
+            counts.extend(features.values())
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        if hashes:
+            hashes = np.asarray(hashes, dtype=np.uint32)
+            weights = np.sqrt(np.asarray(counts, dtype=np.float32))
+            weights[(hashes & 1) == 0] *= -1
+            cells = np.concatenate(rows) * self.dim + (hashes >> 1) % self.dim
+            # uma única acumulação para o lote inteiro
+            matrix += np.bincount(cells, weights=weights, minlength=matrix.size).reshape(matrix.shape).astype(np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+        return matrix
+
+    def embed_query(self, query: str) -> np.ndarray:
+        """Vetor (somente leitura) de uma consulta, memorizado entre buscas e bases."""
+        return _query_vector(query, self.dim)
+
+
+@lru_cache(maxsize=QUERY_CACHE_ENTRIES)
+def _query_vector(query: str, dim: int) -> np.ndarray:
+    vector = HashedNgramEmbedder(dim).embed([query])[0]
+    vector.flags.writeable = False
+    return vector
+
+
+class RetrievalIndex:
+    """
+    Índice em memória dos trechos dos anexos.
+
+    Cada arquivo é quebrado e vetorizado uma vez por conteúdo (sha256); os
+    vetores de todos os arquivos ficam numa única matriz NumPy, e a busca é
+    um produto matriz-vetor seguido de um top-k com `argpartition`.
+
+    A matriz cresce por acréscimo (capacidade dobrada quando enche): um
+    arquivo novo só copia as próprias linhas. Linhas de arquivos removidos
+    ou reindexados ficam mortas até serem maioria, quando a matriz é
+    compactada. Com `max_bytes`, os arquivos usados há mais tempo (texto +
+    vetores) saem do índice quando o total passa do limite.
+    """
+
+    def __init__(self, embedder: HashedNgramEmbedder | None = None, max_bytes: int | None = None):
+        self.embedder = embedder or HashedNgramEmbedder()
+        self.max_bytes = max_bytes
+        # path -> (sha256, trechos, bytes), do menos para o mais recentemente usado
+        self._files = OrderedDict()
+        self._bytes = 0
+        self._buffer = np.zeros((0, self.embedder.dim), dtype=np.float32)
+        self._rows = 0
+        self._chunks = []
+        self._offsets = {}
+        self._dead = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return self._rows - self._dead
+
+    def add(self, path: str, text: str, sha256: str) -> None:
+        """Indexa (ou reindexa, se o conteúdo mudou) o arquivo `path`."""
+        with self._lock:
+            current = self._files.get(path)
+            if current is not None and current[0] == sha256:
+                self._files.move_to_end(path)
+                return
+        chunks = chunk_text(path, text)
+        vectors = self.embedder.embed([c.text for c in chunks])
+        with self._lock:
+            self._discard(path)
+            self._append(path, sha256, chunks, vectors)
+            self._evict()
+
+    def remove(self, path: str) -> None:
+        with self._lock:
+            self._discard(path)
+
+    def files(self) -> dict[str, str]:
+        """sha256 indexado de cada arquivo."""
+        with self._lock:
+            return {path: sha256 for path, (sha256, _, _) in self._files.items()}
+
+    def dump(self) -> tuple[list[dict], np.ndarray]:
+        """Trechos por arquivo (sem vetores) e a matriz correspondente, na mesma ordem."""
+        with self._lock:
+            paths = sorted(self._files)
+            records = [
+                {"path": path, "sha256": self._files[path][0],
+                 "chunks": [[c.start, c.end, c.text] for c in self._files[path][1]]}
+                for path in paths
+            ]
+            blocks = [self._buffer[slice(*self._offsets[path])] for path in paths]
+            matrix = np.vstack(blocks) if blocks else np.zeros((0, self.embedder.dim), dtype=np.float32)
+            return records, matrix
+
+    def restore(self, records: list[dict], matrix: np.ndarray) -> None:
+        """Recarrega um índice salvo com `dump`, sem vetorizar novamente."""
+        files, offsets, all_chunks, row = OrderedDict(), {}, [], 0
+        for record in records:
+            chunks = [Chunk(record["path"], start, end, text) for start, end, text in record["chunks"]]
+            files[record["path"]] = (record["sha256"], chunks, self._size(chunks, matrix[row:row + len(chunks)]))
+            offsets[record["path"]] = (row, row + len(chunks))
+            all_chunks.extend(chunks)
+            row += len(chunks)
+        if row != len(matrix):
+            raise ValueError(f"índice inconsistente: {row} trechos para {len(matrix)} vetores")
+        with self._lock:
+            self._files, self._offsets, self._chunks = files, offsets, all_chunks
+            self._buffer = np.array(matrix, dtype=np.float32)
+            self._rows, self._dead = row, 0
+            self._bytes = sum(size for _, _, size in files.values())
+            self._evict()
+
+    @staticmethod
+    def _size(chunks, vectors):
+        return sum(len(c.text) for c in chunks) + vectors.nbytes
+
+    def _append(self, path, sha256, chunks, vectors):
+        # chamado com o lock adquirido
+        needed = self._rows + len(chunks)
+        if needed > len(self._buffer):
+            grown = np.zeros((max(needed, 2 * len(self._buffer), 64), self.embedder.dim), dtype=np.float32)
+            grown[:self._rows] = self._buffer[:self._rows]
+            self._buffer = grown
+        self._buffer[self._rows:needed] = vectors
+        self._offsets[path] = (self._rows, needed)
+        self._chunks.extend(chunks)
+        self._rows = needed
+        size = self._size(chunks, vectors)
+        self._files[path] = (sha256, chunks, size)
+        self._bytes += size
+
+    def _discard(self, path):
+        # chamado com o lock adquirido; as linhas do arquivo ficam mortas até a compactação
+        current = self._files.pop(path, None)
+        if current is None:
+            return
+        start, end = self._offsets.pop(path)
+        # nova lista: buscas em andamento seguem com a que leram sob o lock
+        self._chunks = self._chunks[:start] + [None] * (end - start) + self._chunks[end:]
+        self._dead += end - start
+        self._bytes -= current[2]
+        if self._dead > self._rows // 2:
+            self._compact()
+
+    def _evict(self):
+        # chamado com o lock adquirido; o arquivo mais recente nunca sai
+        while self.max_bytes is not None and self._bytes > self.max_bytes and len(self._files) > 1:
+            path = next(iter(self._files))
+            self._discard(path)
+            logger.info(f"[RetrievalIndex] {path} removido do índice (limite de {self.max_bytes} bytes)")
+
+    def _compact(self):
+        # chamado com o lock adquirido
+        live = [(path, *self._offsets[path]) for path in self._files]
+        rows = sum(end - start for _, start, end in live)
+        buffer = np.zeros((max(rows, 64), self.embedder.dim), dtype=np.float32)
+        chunks, row = [], 0
+        for path, start, end in live:
+            buffer[row:row + end - start] = self._buffer[start:end]
+            chunks.extend(self._chunks[start:end])
+            self._offsets[path] = (row, row + end - start)
+            row += end - start
+        self._buffer, self._chunks, self._rows, self._dead = buffer, chunks, rows, 0
+
+    def search(self, query: str, k: int = 10, paths: list[str] | None = None) -> list[tuple[float, Chunk]]:
+        """
+        Os `k` trechos mais similares a `query` (cosseno), do mais para o
+        menos similar. Com `paths`, restringe a busca a esses arquivos.
+        """
+        q = self.embedder.embed_query(query)
+        with self._lock:
+            # a matriz só cresce por acréscimo ou é trocada na compactação:
+            # a visão das linhas usadas continua válida fora do lock
+            matrix, chunks = self._buffer[:self._rows], self._chunks
+            if paths is not None:
+                rows = [np.arange(*self._offsets[p]) for p in sorted(set(paths)) if p in self._offsets]
+                rows = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+                for p in set(paths) & self._offsets.keys():
+                    self._files.move_to_end(p)
+            elif self._dead:
+                rows = np.flatnonzero([chunk is not None for chunk in chunks])
+            else:
+                rows = None
+        candidates = matrix if rows is None else matrix[rows]
+        if len(candidates) == 0:
+            return []
+        scores = candidates @ q
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        # ordem estável: maior score primeiro, empate pela posição no índice
+        top = top[np.lexsort((top, -scores[top]))]
+        index = top if rows is None else rows[top]
+        return [(float(scores[i]), chunks[j]) for i, j in zip(top, index)]
@@ -1,29 +1,87 @@
-import json
-import os
+import copy
+import threading
+from collections import OrderedDict
+import time
 import uuid
 import logging
 
+from infra.storage import SessionStorage, apply_record, create_storage
+
 logger = logging.getLogger("SessionService")
 
+# Atraso (s) entre a última mutação e a gravação em lote no backend.
+FLUSH_DELAY = 0.5
+# Espera máxima (s) de uma mutação pendente, mesmo com mutações contínuas.
+FLUSH_MAX_DELAY = 5.0
+# Atraso (s) antes de regravar um lote que o backend recusou.
+FLUSH_RETRY_DELAY = 2.0
+# Sessões mantidas no cache write-back; as sem gravação pendente usadas há mais tempo saem.
+CACHED_SESSIONS = 32
+
+
 class SessionService:
-    def __init__(self, storage_path="sessions"):
-        os.makedirs(storage_path, exist_ok=True)
-        self.storage_path = storage_path
+    """
+    Fachada de sessões de chat sobre um SessionStorage.
+
+    Toda mutação vira um registro (`{"op": ...}`) entregue ao backend, que
+    decide como persisti-lo (journal JSON ou SQLite, ver infra/storage.py).
 
-    def _path(self, chat_id):
-        return os.path.join(self.storage_path, f"{chat_id}.json")
+    As sessões carregadas ficam em um cache write-back: leituras são
+    consultas em memória e mutações são aplicadas no cache e enfileiradas;
+    um flush em background, disparado FLUSH_DELAY segundos após a última
+    mutação (e no máximo `flush_max_delay` após a primeira pendente), grava
+    cada chat alterado em um único lote. Lotes recusados pelo backend voltam
+    para a fila e são regravados FLUSH_RETRY_DELAY segundos depois.
+    `close()` descarrega o que estiver pendente.
+
+    O cache guarda até `max_cached` sessões: ao passar disso, saem as usadas
+    há mais tempo que não têm mutações pendentes nem em gravação (elas são
+    relidas do backend se voltarem a ser usadas). Mutações de sessões fora
+    do cache só entram na fila: o estado delas é o do backend mais o
+    pendente, e ler uma que está sendo gravada espera o fim do flush.
+    """
+
+    def __init__(self, storage_path="sessions", storage: SessionStorage | None = None,
+                 flush_delay: float = FLUSH_DELAY, flush_max_delay: float = FLUSH_MAX_DELAY,
+                 max_cached: int = CACHED_SESSIONS):
+        self.storage_path = storage_path
+        self.storage = storage or create_storage(storage_path=storage_path)
+        self.flush_delay = flush_delay
+        self.flush_max_delay = flush_max_delay
+        self.max_cached = max_cached
+        self._cache = OrderedDict()
+        self._pending = {}
+        # chats cujo lote está sendo gravado agora: não saem do cache, e quem
+        # for lê-los do backend espera o fim do flush (_flushed)
+        self._flushing = set()
+        self._pending_since = None
+        self._lock = threading.RLock()
+        self._flushed = threading.Condition(self._lock)
+        self._flush_lock = threading.Lock()
+        self._flush_timer = None
 
     def list_chats(self):
-        return [
-            fname.replace(".json", "")
-            for fname in os.listdir(self.storage_path)
-            if fname.endswith(".json")
-        ]
+        return self.storage.list_chats()
+
+    def list_chat_summaries(self):
+        """
+        Resumo das sessões (título, criação/atualização, nº de mensagens,
+        tamanho) lido do índice do backend, das mais recentes para as mais
+        antigas.
+        """
+        self.flush()
+        summaries = self.storage.list_summaries()
+        summaries.sort(key=lambda s: s.get("updated_at") or 0, reverse=True)
+        return summaries
 
     def create_chat(self):
         chat_id = str(uuid.uuid4())[:8]
-        data = {"history": [], "files": [], "title": None, "file_states": {}}
-        self._save(chat_id, data)
+        data = {"history": [], "files": [], "title": None, "file_states": {}, "summary": None, "contexts": {},
+                "metrics": []}
+        self.storage.create_chat(chat_id, data)
+        with self._lock:
+            self._cache[chat_id] = copy.deepcopy(data)
+            self._evict()
         return chat_id
 
     def get_file_active(self, chat_id, path):
@@ -33,21 +91,13 @@ class SessionService:
 
     def set_file_active(self, chat_id, path, state: bool):
         """Define o estado ativo de um arquivo e salva na sessão."""
-        data = self._load(chat_id)
-        file_states = data.get("file_states")
-        if file_states is None:
-            data["file_states"] = file_states = {}
-        file_states[path] = state
-        self._save(chat_id, data)
+        self._append(chat_id, {"op": "file_state", "path": path, "value": bool(state)})
 
     def remove_file_active(self, chat_id, path):
         """Remove o estado de um arquivo da sessão."""
         data = self._load(chat_id)
-        file_states = data.get("file_states", {})
-        if path in file_states:
-            del file_states[path]
-            data["file_states"] = file_states
-            self._save(chat_id, data)
+        if path in data.get("file_states", {}):
+            self._append(chat_id, {"op": "file_state_remove", "path": path})
 
     def get_chat_title(self, chat_id):
         """Retorna o título salvo da sessão, ou None."""
@@ -56,64 +106,210 @@ class SessionService:
 
     def rename_chat(self, chat_id, new_title):
         """Renomeia a sessão, salvando o novo título."""
-        data = self._load(chat_id)
-        data["title"] = new_title
-        self._save(chat_id, data)
+        self._append(chat_id, {"op": "title", "value": new_title})
         logger.info(f"[SessionService] chat {chat_id} renomeado para '{new_title}'")
 
     def delete_chat(self, chat_id):
-        try:
-            os.remove(self._path(chat_id))
-            logger.info(f"[SessionService] sessão {chat_id} deletada com sucesso")
-        except Exception as e:
-            logger.error(f"[SessionService] falha ao deletar sessão {chat_id}: {e}", exc_info=True)
+        with self._flush_lock:
+            with self._lock:
+                self._cache.pop(chat_id, None)
+                self._pending.pop(chat_id, None)
+            try:
+                self.storage.delete_chat(chat_id)
+                logger.info(f"[SessionService] sessão {chat_id} deletada com sucesso")
+            except Exception as e:
+                logger.error(f"[SessionService] falha ao deletar sessão {chat_id}: {e}", exc_info=True)
 
-    def load_history(self, chat_id):
-        data = self._load(chat_id)
-        return data["history"]
+    def load_history(self, chat_id, before=None, limit=None):
+        """
+        Retorna mensagens do histórico em ordem cronológica.
+
+        :param before: índice (exclusivo) da mensagem mais antiga já carregada;
+                       None começa do fim do histórico.
+        :param limit: tamanho máximo da página; None retorna tudo até `before`.
+
+        Sessões fora do cache não são carregadas: a página vem do backend
+        (SessionStorage.load_history), completada pelas mensagens pendentes.
+        """
+        with self._lock:
+            data = self._cache.get(chat_id)
+            if data is not None:
+                history = data["history"]
+                end = len(history) if before is None else max(0, min(before, len(history)))
+                start = 0 if limit is None else max(0, end - limit)
+                return history[start:end]
+            self._wait_flushing(chat_id)
+            stored = self.storage.history_count(chat_id)
+            queued = self._pending_messages(chat_id)
+            total = stored + len(queued)
+            end = total if before is None else max(0, min(before, total))
+            start = 0 if limit is None else max(0, end - limit)
+            page = []
+            if start < stored:
+                page = self.storage.load_history(chat_id, min(end, stored), min(end, stored) - start)
+            return page + queued[max(start, stored) - stored:max(end, stored) - stored]
+
+    def history_count(self, chat_id):
+        """Número total de mensagens da sessão."""
+        with self._lock:
+            data = self._cache.get(chat_id)
+            if data is not None:
+                return len(data["history"])
+            self._wait_flushing(chat_id)
+            return self.storage.history_count(chat_id) + len(self._pending_messages(chat_id))
 
     def save_message(self, chat_id, msg):
-        data = self._load(chat_id)
-        data["history"].append(msg)
-        self._save(chat_id, data)
+        """Acrescenta a mensagem ao histórico e retorna a sua posição (sem carregar a sessão)."""
+        with self._lock:
+            self._append(chat_id, {"op": "message", "value": msg})
+            return self.history_count(chat_id) - 1
+
+    def _pending_messages(self, chat_id):
+        return [record["value"] for record in self._pending.get(chat_id, ()) if record.get("op") == "message"]
+
+    def get_summary(self, chat_id):
+        """Resumo acumulado das mensagens antigas: {"upto": n, "text": ...} ou None."""
+        summary = self._load(chat_id).get("summary")
+        return dict(summary) if summary else None
+
+    def set_summary(self, chat_id, upto, text):
+        """Guarda o resumo das `upto` primeiras mensagens do histórico."""
+        self._append(chat_id, {"op": "summary", "upto": upto, "text": text})
+
+    def get_contexts(self, chat_id):
+        """Contexto enviado em cada mensagem: {índice: {"text": ..., "chunks": [hash, ...]}}."""
+        contexts = self._load(chat_id).get("contexts") or {}
+        return {int(turn): dict(context) for turn, context in contexts.items()}
+
+    def set_context(self, chat_id, turn, text, chunks):
+        """Guarda o contexto (já em forma delta) enviado junto da mensagem `turn`."""
+        self._append(chat_id, {"op": "context", "turn": turn, "text": text, "chunks": list(chunks)})
+
+    def get_metrics(self, chat_id):
+        """Medições dos envios do chat (RequestMetrics.to_dict), da mais antiga à mais recente."""
+        return [dict(record) for record in self._load(chat_id).get("metrics") or []]
+
+    def add_metrics(self, chat_id, record):
+        self._append(chat_id, {"op": "metrics", "value": dict(record)})
 
     def add_file(self, chat_id, path):
-        data = self._load(chat_id)
-        data["files"].append(path)
-        self._save(chat_id, data)
+        self._append(chat_id, {"op": "file_add", "path": path})
 
 
     def get_files(self, chat_id):
         data = self._load(chat_id)
-        return data["files"]
+        return list(data["files"])
+
+    def flush(self):
+        """Grava no backend, em um lote por chat, todas as mutações pendentes."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                self._pending_since = None
+                self._flushing = set(pending)
+            failed = {}
+            for chat_id, records in pending.items():
+                try:
+                    self.storage.append(chat_id, records)
+                except Exception as e:
+                    logger.error(f"[SessionService] falha no flush de {chat_id}, nova tentativa em "
+                                 f"{FLUSH_RETRY_DELAY}s: {e}", exc_info=True)
+                    failed[chat_id] = records
+            if failed:
+                with self._lock:
+                    # o lote recusado volta à frente do que chegou durante o flush
+                    for chat_id, records in failed.items():
+                        self._pending[chat_id] = records + self._pending.get(chat_id, [])
+                    self._schedule_flush(FLUSH_RETRY_DELAY)
+            with self._lock:
+                self._flushing = set()
+                self._flushed.notify_all()
+                self._evict()
+            if len(pending) > len(failed):
+                written = sum(len(records) for chat_id, records in pending.items() if chat_id not in failed)
+                logger.info(f"[SessionService] flush de {written} registro(s) "
+                            f"em {len(pending) - len(failed)} sessão(ões)")
+
+    def close(self):
+        """Descarrega as mutações pendentes e libera o backend (chamar no shutdown)."""
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+        self.flush()
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            lost = sum(map(len, self._pending.values()))
+        if lost:
+            logger.error(f"[SessionService] {lost} registro(s) não gravado(s) no encerramento")
+        self.storage.close()
+
+    def _append(self, chat_id, record):
+        """Aplica o registro no cache (se a sessão estiver nele) e agenda a gravação em lote."""
+        with self._lock:
+            data = self._cache.get(chat_id)
+            if data is not None:
+                apply_record(data, record)
+                self._cache.move_to_end(chat_id)
+            self._pending.setdefault(chat_id, []).append(record)
+            self._schedule_flush()
+
+    def _schedule_flush(self, delay=None):
+        """
+        Debounce: reinicia o timer a cada mutação, sem passar de
+        `flush_max_delay` desde a mutação pendente mais antiga.
+        """
+        now = time.monotonic()
+        if self._pending_since is None:
+            self._pending_since = now
+        if delay is None:
+            delay = min(self.flush_delay, max(0.0, self._pending_since + self.flush_max_delay - now))
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+        self._flush_timer = threading.Timer(delay, self.flush)
+        self._flush_timer.daemon = True
+        self._flush_timer.start()
 
     def _load(self, chat_id):
-        try:
-            with open(self._path(chat_id), "r", encoding="utf-8") as f:
-                data = json.load(f)
-                data.setdefault("history", [])
-                data.setdefault("files", [])
-                data.setdefault("title", None)
-                data.setdefault("file_states", {})
-                return data
-        except Exception as e:
-            logger.error(f"[SessionService] falha ao carregar {chat_id}: {e}", exc_info=True)
-            return {"history": [], "files": [], "title": None, "file_states": {}}
+        with self._lock:
+            data = self._cache.get(chat_id)
+            if data is None:
+                self._wait_flushing(chat_id)
+                data = self.storage.load(chat_id)
+                for record in self._pending.get(chat_id, ()):
+                    apply_record(data, record)
+                self._cache[chat_id] = data
+                self._evict()
+            else:
+                self._cache.move_to_end(chat_id)
+            return data
 
-    def _save(self, chat_id, data):
-        try:
-            with open(self._path(chat_id), "w", encoding="utf-8") as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-        except Exception as e:
-            logger.error(f"[SessionService] falha ao salvar {chat_id}: {e}", exc_info=True)
+    def _wait_flushing(self, chat_id):
+        # chamado com o lock adquirido: o backend só está consistente fora do flush do chat
+        while chat_id in self._flushing:
+            self._flushed.wait()
+
+    def _evict(self):
+        # chamado com o lock adquirido; sessões com gravação pendente nunca saem,
+        # nem a recém-usada (o chamador ainda vai aplicar a mutação nela)
+        excess = len(self._cache) - self.max_cached
+        if excess <= 0:
+            return
+        for chat_id in list(self._cache)[:-1]:
+            if excess <= 0:
+                break
+            if chat_id not in self._pending and chat_id not in self._flushing:
+                del self._cache[chat_id]
+                excess -= 1
 
     def remove_file(self, chat_id, path):
         """Remove um arquivo da sessão e salva."""
         try:
             data = self._load(chat_id)
             if path in data["files"]:
-                data["files"].remove(path)
-                self._save(chat_id, data)
+                self._append(chat_id, {"op": "file_remove", "path": path})
                 logger.info(f"[SessionService] arquivo removido da sessão {chat_id}: {path}")
             else:
                 logger.warn(f"[SessionService] arquivo não encontrado na sessão {chat_id}: {path}")
@@ -0,0 +1,136 @@
+import logging
+import threading
+from typing import Callable, Iterator
+
+from core.workers.cancellation import CancellationToken, RequestCancelled
+
+logger = logging.getLogger("SingleFlight")
+
+
+class _Flight:
+    """Uma chamada upstream em andamento e os trechos já recebidos."""
+
+    def __init__(self, key, timeout=None):
+        self.key = key
+        # herda o prazo de quem abriu o voo: a chamada upstream não passa dele
+        self.token = CancellationToken(timeout=timeout)
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.waiters = 0
+        self.cond = threading.Condition()
+
+
+class SingleFlight:
+    """
+    Agrupa requisições idênticas em andamento numa única chamada upstream.
+
+    A primeira requisição de uma chave abre o voo: o produtor roda numa
+    thread própria e cada trecho recebido é repassado a todos os
+    interessados, que podem entrar a qualquer momento (recebem primeiro o
+    que já chegou). Quem é cancelado apenas sai do voo; a chamada upstream
+    só é cancelada quando não resta mais ninguém esperando.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.started = 0
+        self.joined = 0
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._flights)
+
+    def stream(self, key: str, produce: Callable[[CancellationToken], Iterator[str]],
+               token: CancellationToken | None = None) -> Iterator[str]:
+        """
+        Itera os trechos do voo `key`. `produce(upstream_token)` só é chamado
+        se não houver voo aberto para a chave; `upstream_token` tem o prazo
+        de `token`.
+        """
+        flight, leader = self._join(key, token)
+        if leader:
+            threading.Thread(
+                target=self._pump, args=(flight, produce),
+                name=f"SingleFlight-{key[:8]}", daemon=True,
+            ).start()
+        else:
+            logger.info(f"[SingleFlight] requisição agrupada ao voo em andamento ({key[:12]})")
+        if token is not None:
+            token.on_cancel(lambda: self._wake(flight))
+        try:
+            index = 0
+            while True:
+                with flight.cond:
+                    while index >= len(flight.chunks) and not flight.done:
+                        if token is not None and token.cancelled:
+                            break
+                        flight.cond.wait()
+                    pending = flight.chunks[index:]
+                    done, error = flight.done, flight.error
+                if token is not None:
+                    token.raise_if_cancelled()
+                for chunk in pending:
+                    yield chunk
+                index += len(pending)
+                if done and index >= len(flight.chunks):
+                    if error is not None:
+                        raise error
+                    return
+        finally:
+            self._leave(flight)
+
+    def _join(self, key, token=None):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                remaining = token.remaining() if token is not None else None
+                # prazo já vencido vira o menor prazo possível (0 significaria "sem prazo")
+                timeout = max(remaining, 1e-3) if remaining is not None else None
+                flight = self._flights[key] = _Flight(key, timeout)
+                self.started += 1
+            else:
+                self.joined += 1
+            with flight.cond:
+                flight.waiters += 1
+            return flight, leader
+
+    def _leave(self, flight):
+        with self._lock:
+            with flight.cond:
+                flight.waiters -= 1
+                abandon = flight.waiters == 0 and not flight.done
+            if abandon and self._flights.get(flight.key) is flight:
+                # ninguém mais espera: novos pedidos abrem outro voo
+                del self._flights[flight.key]
+        if abandon:
+            flight.token.cancel("sem requisições aguardando")
+
+    @staticmethod
+    def _wake(flight):
+        with flight.cond:
+            flight.cond.notify_all()
+
+    def _pump(self, flight, produce):
+        error = None
+        try:
+            for chunk in produce(flight.token):
+                with flight.cond:
+                    flight.chunks.append(chunk)
+                    flight.cond.notify_all()
+        except RequestCancelled as e:
+            error = e
+        except Exception as e:
+            logger.error(f"[SingleFlight] falha no voo {flight.key[:12]}: {e}", exc_info=True)
+            error = e
+        finally:
+            with self._lock:
+                if self._flights.get(flight.key) is flight:
+                    del self._flights[flight.key]
+                with flight.cond:
+                    flight.done = True
+                    flight.error = error
+                    flight.cond.notify_all()
+            flight.token.close()
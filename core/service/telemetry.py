@@ -0,0 +1,169 @@
+import logging
+import threading
+import time
+from collections import Counter, deque
+from functools import lru_cache
+
+logger = logging.getLogger("Telemetry")
+
+# Envios recentes (de todos os chats) mantidos em memória para o painel.
+RECENT_REQUESTS = 1000
+# Percentis calculados em cada métrica.
+PERCENTILES = (50, 90, 99)
+# Métricas agregadas, na ordem exibida: (campo, rótulo, unidade).
+FIELDS = (
+    ("queue_wait", "espera na fila", "s"),
+    ("context_build", "montagem do contexto", "s"),
+    ("connect", "conexão", "s"),
+    ("ttft", "primeiro token", "s"),
+    ("tokens_per_second", "tokens/s", ""),
+    ("total", "tempo total", "s"),
+    ("bytes_out", "bytes enviados", "B"),
+    ("bytes_in", "bytes recebidos", "B"),
+)
+
+
+def percentile(values, pct):
+    """Percentil por posição mais próxima (0 para lista vazia)."""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def format_value(value: float, unit: str) -> str:
+    digits = 0 if unit == "B" else 3 if unit == "s" else 1
+    return f"{value:.{digits}f}{unit}"
+
+
+class RequestMetrics:
+    """
+    Onde foi o tempo de um envio, em segundos:
+
+    - `queue_wait`: da entrada na fila até uma vaga do scheduler;
+    - `context_build`: histórico, anexos, bases e contexto delta;
+    - `connect`: do pedido ao provedor até os cabeçalhos da resposta
+      (inclui o handshake quando a conexão é nova; só provedores HTTP);
+    - `ttft`: da entrada na fila até o primeiro trecho, como o usuário percebe;
+    - `tokens_per_second`: ritmo do stream depois do primeiro trecho;
+    - `total`: da entrada na fila até o fim, com sucesso ou não.
+
+    `bytes_out` é o JSON das mensagens montadas pelo PromptBuilder e
+    `bytes_in`, o texto dos deltas recebidos, medidos pelo AIService da
+    mesma forma em qualquer provedor. Preenchido pelo ChatController, pelo
+    AIService e pelo provedor HTTP (via AIRequest.metrics).
+    """
+
+    def __init__(self, chat_id: str | None = None, agent: str | None = None, provider: str | None = None):
+        self.chat_id = chat_id
+        self.agent = agent
+        self.provider = provider
+        self.timestamp = time.time()
+        self.state = None
+        self.cached = False
+        self.queue_wait = None
+        self.context_build = None
+        self.connect = None
+        self.ttft = None
+        self.tokens_per_second = None
+        self.total = None
+        self.output_tokens = 0
+        self.bytes_out = 0
+        self.bytes_in = 0
+
+    def finish(self, state: str, submitted_at: float, first_chunk_at: float | None, finished_at: float,
+               output_tokens: int = 0) -> None:
+        self.state = state
+        self.total = finished_at - submitted_at
+        self.output_tokens = output_tokens
+        if first_chunk_at is not None:
+            self.ttft = first_chunk_at - submitted_at
+            streaming = finished_at - first_chunk_at
+            if streaming > 0 and output_tokens > 1:
+                self.tokens_per_second = (output_tokens - 1) / streaming
+
+    def to_dict(self) -> dict:
+        return dict(vars(self))
+
+    def summary(self) -> str:
+        def seconds(value):
+            return f"{value:.3f}s" if value is not None else "-"
+        rate = f"{self.tokens_per_second:.1f}" if self.tokens_per_second is not None else "-"
+        return (
+            f"chat {self.chat_id}" + (f" [{self.agent}]" if self.agent else "") + f" {self.state}"
+            + (" (cache)" if self.cached else "")
+            + f" | fila={seconds(self.queue_wait)} contexto={seconds(self.context_build)}"
+            f" conexão={seconds(self.connect)} ttft={seconds(self.ttft)} total={seconds(self.total)}"
+            f" | {self.output_tokens} tokens, {rate} tokens/s | {self.bytes_out}B enviados, {self.bytes_in}B recebidos"
+        )
+
+
+class MetricSummary:
+    """Contagem, média, máximo e percentis de uma métrica."""
+
+    def __init__(self, values: list[float]):
+        self.count = len(values)
+        self.mean = sum(values) / len(values) if values else 0.0
+        self.max = max(values) if values else 0.0
+        self.percentiles = {pct: percentile(values, pct) for pct in PERCENTILES}
+
+
+def aggregate(records: list[dict]) -> tuple[dict, Counter]:
+    """
+    Resume envios gravados (RequestMetrics.to_dict): percentis de cada
+    métrica sobre os envios concluídos e a contagem por estado. Cancelados e
+    falhos ficam fora dos percentis para não distorcer as latências.
+    """
+    states = Counter(record.get("state") for record in records)
+    done = [record for record in records if record.get("state") == "done"]
+    summaries = {}
+    for name, _, _ in FIELDS:
+        values = [record[name] for record in done if record.get(name) is not None]
+        summaries[name] = MetricSummary(values)
+    return summaries, states
+
+
+def format_summary(records: list[dict]) -> str:
+    """Resumo em texto, uma métrica por linha."""
+    summaries, states = aggregate(records)
+    lines = [f"{len(records)} envio(s): " + " ".join(f"{state}={count}" for state, count in sorted(states.items()))]
+    for name, label, unit in FIELDS:
+        s = summaries[name]
+        if not s.count:
+            continue
+        values = " ".join(f"p{pct}={format_value(value, unit)}" for pct, value in s.percentiles.items())
+        lines.append(f"{label}: {values} máx={format_value(s.max, unit)} (n={s.count})")
+    return "\n".join(lines)
+
+
+class Telemetry:
+    """
+    Envios recentes do processo (todos os chats), para o painel de
+    telemetria; o histórico de cada chat fica na sessão
+    (SessionService.get_metrics).
+    """
+
+    def __init__(self, max_records: int = RECENT_REQUESTS):
+        self._records = deque(maxlen=max_records)
+        self._lock = threading.Lock()
+
+    def record(self, metrics: RequestMetrics) -> dict:
+        data = metrics.to_dict()
+        with self._lock:
+            self._records.append(data)
+        logger.info(f"[Telemetry] {metrics.summary()}")
+        return data
+
+    def recent(self, chat_id: str | None = None) -> list[dict]:
+        with self._lock:
+            records = list(self._records)
+        if chat_id is not None:
+            records = [record for record in records if record.get("chat_id") == chat_id]
+        return records
+
+
+@lru_cache(maxsize=None)
+def get_telemetry() -> Telemetry:
+    """Instância compartilhada pelo processo."""
+    return Telemetry()
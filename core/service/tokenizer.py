@@ -0,0 +1,140 @@
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+logger = logging.getLogger("Tokenizer")
+
+try:
+    import tiktoken
+except ImportError:  # dependência opcional: sem ela, o modo BPE usa a aproximação local
+    tiktoken = None
+
+# Modos de contagem.
+MODE_BPE = "bpe"
+MODE_HEURISTIC = "heuristic"
+# Codificação usada quando o tiktoken estiver instalado.
+DEFAULT_ENCODING = "cl100k_base"
+# Quantidade máxima de arquivos com contagem em cache.
+FILE_CACHE_ENTRIES = 50_000
+
+# Pré-tokenização no estilo cl100k (contrações, palavras, números de até 3
+# dígitos, pontuação, quebras de linha e espaços), usando apenas `re`.
+_PRETOKENIZE = re.compile(
+    r"'(?:[sdmt]|ll|ve|re)"
+    r"| ?[^\W\d_]+"
+    r"|\d{1,3}"
+    r"| ?[^\s\w]+[\r\n]*"
+    r"|\s*[\r\n]+"
+    r"|\s+(?!\S)"
+    r"|\s+",
+    re.IGNORECASE,
+)
+
+
+def _piece_tokens(piece: str) -> int:
+    """Estimativa de quantos tokens BPE um pedaço pré-tokenizado gera."""
+    size = len(piece.encode("utf-8"))
+    if size <= 4:
+        return 1
+    if piece.isascii():
+        stripped = piece.lstrip()
+        if stripped.isalpha():
+            # palavras comuns costumam ser um token só; as longas quebram em ~4 letras
+            return 1 if len(stripped) <= 7 else (len(stripped) + 3) // 4
+        if stripped.isspace() or not stripped:
+            return 1 + size // 16
+        return (size + 2) // 3
+    return (size + 2) // 3
+
+
+class TokenCounter:
+    """
+    Contador de tokens local (sem rede).
+
+    - `bpe`: usa o tiktoken, se instalado; caso contrário, aproxima a contagem
+      BPE pré-tokenizando o texto como o cl100k e estimando cada pedaço.
+    - `heuristic`: ~4 caracteres por token, para quando só a ordem de grandeza
+      importa.
+
+    Contagens de arquivos ficam em cache por (path, mtime, size, modo), de
+    modo que o mesmo anexo é contado uma vez e reaproveitado entre envios e abas.
+    """
+
+    def __init__(self, mode: str = MODE_BPE, encoding: str = DEFAULT_ENCODING):
+        if mode not in (MODE_BPE, MODE_HEURISTIC):
+            raise ValueError(f"modo de contagem desconhecido: {mode}")
+        self.mode = mode
+        self._encoding = None
+        if mode == MODE_BPE and tiktoken is not None:
+            try:
+                self._encoding = tiktoken.get_encoding(encoding)
+            except Exception as e:
+                logger.warning(f"[TokenCounter] tiktoken indisponível ({e}); usando aproximação local")
+        self._files = OrderedDict()
+        self._lock = threading.Lock()
+        self.file_hits = 0
+        self.file_misses = 0
+
+    @property
+    def exact(self) -> bool:
+        return self._encoding is not None
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self.mode == MODE_HEURISTIC:
+            return (len(text) + 3) // 4
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return sum(_piece_tokens(piece) for piece in _PRETOKENIZE.findall(text))
+
+    def count_file(self, path: str, text: str | None = None, stat: os.stat_result | None = None) -> int:
+        """
+        Tokens do arquivo `path`. `text` e `stat` podem ser passados por quem
+        já leu o arquivo, evitando uma segunda leitura.
+        """
+        stat = stat or os.stat(path)
+        key = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            cached = self._files.get(path)
+            if cached is not None and cached[0] == key:
+                self._files.move_to_end(path)
+                self.file_hits += 1
+                return cached[1]
+            self.file_misses += 1
+        if text is None:
+            with open(path, "rb") as f:
+                text = f.read().decode("utf-8", errors="replace")
+        tokens = self.count(text)
+        with self._lock:
+            self._files[path] = (key, tokens)
+            self._files.move_to_end(path)
+            while len(self._files) > FILE_CACHE_ENTRIES:
+                self._files.popitem(last=False)
+        return tokens
+
+    def count_files(self, paths: list[str]) -> dict[str, int]:
+        """Contagem por arquivo; arquivos ilegíveis ficam de fora."""
+        counts = {}
+        for path in paths:
+            try:
+                counts[path] = self.count_file(path)
+            except OSError as e:
+                logger.warning(f"[TokenCounter] não foi possível contar {path}: {e}")
+        return counts
+
+    def invalidate(self, path: str | None = None) -> None:
+        with self._lock:
+            if path is None:
+                self._files.clear()
+            else:
+                self._files.pop(path, None)
+
+
+@lru_cache(maxsize=None)
+def get_token_counter(mode: str = MODE_BPE) -> TokenCounter:
+    """Instância compartilhada pelo processo (uma por modo)."""
+    return TokenCounter(mode)
@@ -1,21 +1,114 @@
-import time
-
-from qtpy.QtCore import QThread
+from qtpy.QtCore import QObject
 from qtpy.QtCore import Signal
 
-class AIWorker(QThread):
+from core.controller.chat_controller import ChatController, ChatRequest, FanOut
+
+
+class AIWorker(QObject):
+    """
+    Ponte Qt de um envio do ChatController: os eventos chegam da thread do
+    RequestScheduler e são reemitidos como sinais, que alcançam os slots da
+    UI por conexão enfileirada.
+
+    Contrato de streaming: `chunk` é emitido a cada trecho (delta) recebido e
+    `finished` uma única vez, com o texto completo. Se a requisição for
+    cancelada (ou o prazo expirar), `cancelled` é emitido no lugar de
+    `finished`, com o motivo. Antes do primeiro trecho, `context_built`
+    entrega o ContextReport dos anexos (quando houver anexos).
+    """
+    context_built = Signal(object)
+    chunk = Signal(str)
     finished = Signal(str)
     error = Signal(Exception)
+    cancelled = Signal(str)
+
+    def __init__(self, controller: ChatController):
+        super().__init__()
+        self.controller = controller
+        self.handle: ChatRequest | None = None
+
+    def start(self, text: str, files: list[str] | None = None) -> ChatRequest:
+        """Grava a mensagem do usuário e enfileira o envio no controller."""
+        self.handle = self.controller.send(text, files, listener=self)
+        return self.handle
+
+    def cancel(self, reason: str = "cancelado pelo usuário"):
+        if self.handle is not None:
+            self.handle.cancel(reason)
+
+    # listener do ChatController (thread do scheduler)
+
+    def on_context_built(self, report):
+        self.context_built.emit(report)
+
+    def on_chunk(self, delta):
+        self.chunk.emit(delta)
+
+    def on_finished(self, text):
+        self.finished.emit(text)
+
+    def on_error(self, exc):
+        self.error.emit(exc)
+
+    def on_cancelled(self, reason):
+        self.cancelled.emit(reason)
 
-    def __init__(self, prompt, context_files):
+
+class FanOutWorker(QObject):
+    """
+    Ponte Qt de um fan-out (ChatController.fan_out): o mesmo prompt para
+    vários agentes em paralelo. Os sinais por agente levam o nome do agente
+    primeiro; `merge_chunk`/`merged` trazem a resposta combinada, quando
+    pedida, e `finished` é emitido uma única vez, com o FanOut, ao final.
+    """
+    agent_context_built = Signal(str, object)
+    agent_chunk = Signal(str, str)
+    agent_finished = Signal(str, str)
+    agent_error = Signal(str, object)
+    agent_cancelled = Signal(str, str)
+    merge_chunk = Signal(str)
+    merged = Signal(str)
+    merge_error = Signal(object)
+    finished = Signal(object)
+
+    def __init__(self, controller: ChatController):
         super().__init__()
-        self.prompt = prompt
-        self.context_files = context_files
-
-    def run(self):
-        try:
-            response = "Simulação de resposta da IA para o prompt: " + self.prompt
-            time.sleep(5)
-            self.finished.emit(response)
-        except Exception as e:
-            self.error.emit(e)
\ No newline at end of file
+        self.controller = controller
+        self.fan_out: FanOut | None = None
+
+    def start(self, text: str, agents: list[str], files: list[str] | None = None, merge: bool | None = None) -> FanOut:
+        self.fan_out = self.controller.fan_out(text, agents, files, listener=self, merge=merge)
+        return self.fan_out
+
+    def cancel(self, reason: str = "cancelado pelo usuário"):
+        if self.fan_out is not None:
+            self.fan_out.cancel(reason)
+
+    # listener do ChatController (thread do scheduler)
+
+    def on_agent_context_built(self, agent, report):
+        self.agent_context_built.emit(agent, report)
+
+    def on_agent_chunk(self, agent, delta):
+        self.agent_chunk.emit(agent, delta)
+
+    def on_agent_finished(self, agent, text):
+        self.agent_finished.emit(agent, text)
+
+    def on_agent_error(self, agent, exc):
+        self.agent_error.emit(agent, exc)
+
+    def on_agent_cancelled(self, agent, reason):
+        self.agent_cancelled.emit(agent, reason)
+
+    def on_merge_chunk(self, delta):
+        self.merge_chunk.emit(delta)
+
+    def on_merge_finished(self, text):
+        self.merged.emit(text)
+
+    def on_merge_error(self, cause):
+        self.merge_error.emit(cause)
+
+    def on_fan_out_finished(self, fan_out):
+        self.finished.emit(fan_out)
@@ -0,0 +1,188 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+import weakref
+
+logger = logging.getLogger("Cancellation")
+
+
+class RequestCancelled(Exception):
+    """A requisição foi cancelada antes de terminar."""
+
+
+class DeadlineExceeded(RequestCancelled):
+    """O prazo da requisição expirou."""
+
+
+class _DeadlineWatcher:
+    """
+    Uma única thread daemon que expira os tokens com prazo, em ordem de
+    vencimento (heap), em vez de um threading.Timer (uma thread) por token.
+    Tokens encerrados ou cancelados antes do prazo saem do heap de forma
+    preguiçosa; o heap é reconstruído quando eles passam de metade.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._dead = 0
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def add(self, token):
+        with self._cond:
+            heapq.heappush(self._heap, (token.deadline, next(self._seq), weakref.ref(token)))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="deadline-watcher", daemon=True)
+                self._thread.start()
+            elif self._heap[0][2]() is token:
+                self._cond.notify()
+
+    def discard(self):
+        """Um token do heap terminou antes do prazo."""
+        with self._cond:
+            self._dead += 1
+            if self._dead > len(self._heap) // 2:
+                self._heap = [entry for entry in self._heap if self._alive(entry[2]())]
+                heapq.heapify(self._heap)
+                self._dead = 0
+
+    @staticmethod
+    def _alive(token):
+        return token is not None and not token._closed and not token._event.is_set()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    while self._heap and not self._alive(self._heap[0][2]()):
+                        heapq.heappop(self._heap)
+                        self._dead = max(0, self._dead - 1)
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    delay = self._heap[0][0] - time.monotonic()
+                    if delay <= 0:
+                        token = heapq.heappop(self._heap)[2]()
+                        break
+                    self._cond.wait(delay)
+            if token is not None:
+                token._expire()
+
+
+# Thread única que expira os prazos de todos os tokens.
+_watcher = _DeadlineWatcher()
+
+
+class CancellationToken:
+    """
+    Sinal cooperativo de cancelamento, com prazo opcional.
+
+    O código que executa a requisição consulta `cancelled` /
+    `raise_if_cancelled()` entre etapas, espera com `wait()` em vez de
+    `time.sleep()` e registra em `on_cancel()` ações que interrompem
+    operações bloqueantes (ex.: fechar o socket de uma leitura em curso).
+
+    O prazo é verificado em `cancelled`, `wait()` e `raise_if_cancelled()`;
+    os callbacks de quem não está consultando o token são disparados no
+    vencimento pela thread compartilhada (_DeadlineWatcher).
+    """
+
+    def __init__(self, timeout: float | None = None):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self.reason = None
+        self.expired = False
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self._closed = False
+        if self.deadline is not None:
+            _watcher.add(self)
+
+    @property
+    def cancelled(self) -> bool:
+        self._check_deadline()
+        return self._event.is_set()
+
+    def remaining(self) -> float | None:
+        """Segundos até o prazo (None se não houver prazo)."""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def cancel(self, reason: str = "cancelado") -> None:
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        if self.deadline is not None and not self.expired and not self._closed:
+            _watcher.discard()
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"[CancellationToken] callback de cancelamento falhou: {e}", exc_info=True)
+
+    def on_cancel(self, callback):
+        """
+        Registra `callback`; executa imediatamente se já estiver cancelado.
+        Retorna uma função que cancela o registro (ex.: quando o recurso que
+        o callback interromperia é devolvido a um pool).
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._unregister(callback)
+        callback()
+        return lambda: None
+
+    def _unregister(self, callback):
+        with self._lock:
+            try:
+                self._callbacks.remove(callback)
+            except ValueError:
+                pass
+
+    def wait(self, seconds: float) -> bool:
+        """Espera até `seconds`; retorna True se foi cancelado nesse intervalo."""
+        remaining = self.remaining()
+        if remaining is not None and remaining < seconds:
+            if self._event.wait(remaining):
+                return True
+            self._check_deadline()
+            return self._event.is_set()
+        return self._event.wait(seconds)
+
+    def raise_if_cancelled(self) -> None:
+        self._check_deadline()
+        if self._event.is_set():
+            if self.expired:
+                raise DeadlineExceeded(self.reason)
+            raise RequestCancelled(self.reason)
+
+    def close(self) -> None:
+        """Retira o prazo do watcher quando a requisição termina normalmente."""
+        with self._lock:
+            self._callbacks = []
+            if self._closed:
+                return
+            self._closed = True
+            pending = self.deadline is not None and not self._event.is_set()
+        if pending:
+            _watcher.discard()
+
+    def _check_deadline(self):
+        if (self.deadline is not None and not self._closed and not self._event.is_set()
+                and time.monotonic() >= self.deadline):
+            self._expire()
+
+    def _expire(self):
+        with self._lock:
+            if self._event.is_set() or self._closed:
+                return
+            self.expired = True
+        self.cancel("prazo excedido")
@@ -0,0 +1,244 @@
+import itertools
+import logging
+import threading
+from collections import deque
+
+from core.workers.cancellation import CancellationToken, RequestCancelled
+
+logger = logging.getLogger("RequestScheduler")
+
+# Limite global de requisições executando ao mesmo tempo.
+MAX_WORKERS = 4
+
+
+class RequestTicket:
+    """Referência a uma requisição enfileirada no RequestScheduler."""
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+    def __init__(self, seq, owner, fn, args, kwargs, token, background=False):
+        self.seq = seq
+        self.owner = owner
+        self.background = background
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.token = token
+        self.state = self.PENDING
+        self.result = None
+        self.exception = None
+        self._done = threading.Event()
+
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout=None) -> bool:
+        return self._done.wait(timeout)
+
+    def __repr__(self):
+        return f"<RequestTicket #{self.seq} owner={self.owner} {self.state}>"
+
+
+class RequestScheduler:
+    """
+    Pool de threads compartilhado por todas as abas.
+
+    - Limite global: no máximo `max_workers` requisições simultâneas.
+    - FIFO por dono (aba): cada dono tem uma fila própria e executa uma
+      requisição por vez, na ordem de envio.
+    - Prioridade: a aba visível (`set_visible_owner`) é atendida primeiro;
+      entre as demais, vale a ordem de chegada da requisição mais antiga.
+      Um dono pode ser uma tupla `(aba, subfila)` (ex.: um agente do
+      fan-out): cada subfila roda em paralelo às outras e herda a
+      prioridade da aba. Requisições `background` (ex.: aquecimento do
+      cache) só rodam quando não há requisição normal elegível, mesmo que
+      sejam da aba visível.
+    - Cancelamento: requisições na fila são descartadas; as em execução têm
+      o token cancelado e liberam a vaga na hora, mesmo que a thread ainda
+      leve alguns instantes para retornar.
+    """
+
+    def __init__(self, max_workers: int = MAX_WORKERS):
+        self.max_workers = max_workers
+        self._queues = {}
+        self._running = {}
+        self._visible_owner = None
+        self._seq = itertools.count(1)
+        self._cond = threading.Condition()
+        self._threads = []
+        self._idle_threads = 0
+        self._abandoned = 0
+        self._shutdown = False
+
+    def submit(self, owner, fn, *args, token: CancellationToken | None = None, background: bool = False,
+               **kwargs) -> RequestTicket:
+        """
+        Enfileira `fn(*args, **kwargs)` na fila do dono. Com `background`, a
+        requisição fica atrás de todas as requisições normais.
+        """
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError("RequestScheduler encerrado")
+            ticket = RequestTicket(next(self._seq), owner, fn, args, kwargs, token, background)
+            self._queues.setdefault(owner, deque()).append(ticket)
+            self._ensure_workers()
+            self._cond.notify()
+        return ticket
+
+    def cancel(self, ticket: RequestTicket) -> bool:
+        """
+        Cancela a requisição. Retorna True se ela ainda estava na fila (e não
+        chegará a executar); False se já estava em execução ou terminada.
+        """
+        with self._cond:
+            queue = self._queues.get(ticket.owner)
+            if ticket.state == RequestTicket.PENDING and queue and ticket in queue:
+                queue.remove(ticket)
+                if not queue:
+                    del self._queues[ticket.owner]
+                ticket.state = RequestTicket.CANCELLED
+                ticket._done.set()
+                if ticket.token is not None:
+                    ticket.token.cancel()
+                return True
+            if ticket.state == RequestTicket.RUNNING:
+                self._release_running(ticket)
+        if ticket.token is not None:
+            ticket.token.cancel()
+        return False
+
+    def cancel_owner(self, owner) -> list[RequestTicket]:
+        """Cancela tudo do dono; retorna os tickets que ainda estavam na fila."""
+        with self._cond:
+            pending = list(self._queues.get(owner, ()))
+            running = self._running.get(owner)
+        for ticket in pending:
+            self.cancel(ticket)
+        if running is not None:
+            self.cancel(running)
+        return pending
+
+    def set_visible_owner(self, owner) -> None:
+        """Define o dono (aba visível) que tem prioridade na fila."""
+        with self._cond:
+            self._visible_owner = owner
+            self._cond.notify_all()
+
+    def pending_count(self, owner=None) -> int:
+        with self._cond:
+            if owner is not None:
+                return len(self._queues.get(owner, ()))
+            return sum(len(q) for q in self._queues.values())
+
+    def active_count(self) -> int:
+        with self._cond:
+            return len(self._running)
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Descarta a fila, cancela o que está em execução e encerra os workers."""
+        with self._cond:
+            self._shutdown = True
+            for queue in self._queues.values():
+                for ticket in queue:
+                    ticket.state = RequestTicket.CANCELLED
+                    ticket._done.set()
+            self._queues.clear()
+            running = list(self._running.values())
+            self._cond.notify_all()
+            threads = list(self._threads)
+        for ticket in running:
+            if ticket.token is not None:
+                ticket.token.cancel()
+        if wait:
+            for thread in threads:
+                thread.join()
+
+    def _release_running(self, ticket):
+        # chamado com o lock adquirido: a vaga do ticket cancelado é liberada
+        # já, e a thread que ainda o executa passa a contar como excedente
+        if self._running.get(ticket.owner) is ticket:
+            del self._running[ticket.owner]
+            ticket.state = RequestTicket.CANCELLED
+            self._abandoned += 1
+            self._ensure_workers()
+            self._cond.notify_all()
+
+    def _ensure_workers(self):
+        # chamado com o lock adquirido
+        if self._idle_threads == 0 and len(self._threads) < self.max_workers + self._abandoned:
+            thread = threading.Thread(
+                target=self._worker_loop,
+                name=f"RequestScheduler-{len(self._threads) + 1}",
+                daemon=True,
+            )
+            self._threads.append(thread)
+            thread.start()
+
+    def _next_ticket(self):
+        """Escolhe a próxima requisição elegível (chamado com o lock adquirido)."""
+        if len(self._running) >= self.max_workers:
+            return None
+        visible = self._visible_owner
+        best, best_key = None, None
+        for owner, queue in self._queues.items():
+            if queue and owner not in self._running:
+                tab = owner[0] if isinstance(owner, tuple) else owner
+                key = (queue[0].background, tab != visible, queue[0].seq)
+                if best is None or key < best_key:
+                    best, best_key = queue, key
+        return best.popleft() if best is not None else None
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                ticket = None
+                while not self._shutdown:
+                    ticket = self._next_ticket()
+                    if ticket is not None:
+                        break
+                    self._idle_threads += 1
+                    self._cond.wait()
+                    self._idle_threads -= 1
+                if ticket is None:
+                    self._threads.remove(threading.current_thread())
+                    return
+                self._running[ticket.owner] = ticket
+                if not self._queues[ticket.owner]:
+                    del self._queues[ticket.owner]
+                ticket.state = RequestTicket.RUNNING
+            try:
+                result = ticket.fn(*ticket.args, **ticket.kwargs)
+                with self._cond:
+                    ticket.result = result
+                    if ticket.state == RequestTicket.RUNNING:
+                        ticket.state = RequestTicket.DONE
+            except RequestCancelled as e:
+                with self._cond:
+                    ticket.exception = e
+                    ticket.state = RequestTicket.CANCELLED
+                logger.info(f"[RequestScheduler] {ticket} interrompido: {e}")
+            except Exception as e:
+                with self._cond:
+                    ticket.exception = e
+                    if ticket.state == RequestTicket.RUNNING:
+                        ticket.state = RequestTicket.FAILED
+                if ticket.state == RequestTicket.FAILED:
+                    logger.error(f"[RequestScheduler] falha em {ticket}: {e}", exc_info=True)
+            finally:
+                with self._cond:
+                    abandoned = False
+                    if self._running.get(ticket.owner) is ticket:
+                        del self._running[ticket.owner]
+                    elif ticket.state == RequestTicket.CANCELLED and self._abandoned:
+                        # thread excedente: encerra para voltar ao limite
+                        self._abandoned -= 1
+                        self._threads.remove(threading.current_thread())
+                        abandoned = True
+                    self._cond.notify_all()
+                ticket._done.set()
+            if abandoned:
+                return
@@ -0,0 +1,74 @@
+import hashlib
+import logging
+import os
+import threading
+from functools import lru_cache
+
+logger = logging.getLogger("FileCache")
+
+# Tamanho dos blocos lidos ao calcular o hash de um arquivo.
+READ_BLOCK = 1024 * 1024
+
+
+class FileSnapshot:
+    """Metadados derivados do conteúdo de um arquivo em um dado (mtime, size)."""
+
+    def __init__(self, path, mtime_ns, size, sha256):
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.sha256 = sha256
+
+
+class FileSnapshotCache:
+    """
+    Cache de metadados de arquivos chaveado por (path, mtime, size).
+
+    Enquanto o arquivo não muda no disco, o hash do conteúdo é calculado
+    uma única vez e reaproveitado entre envios e entre abas.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def snapshot(self, path: str) -> FileSnapshot:
+        stat = os.stat(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry.mtime_ns == stat.st_mtime_ns and entry.size == stat.st_size:
+                return entry
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(READ_BLOCK), b""):
+                digest.update(block)
+        entry = FileSnapshot(path, stat.st_mtime_ns, stat.st_size, digest.hexdigest())
+        with self._lock:
+            self._entries[path] = entry
+        return entry
+
+    def store(self, path: str, mtime_ns: int, size: int, sha256: str) -> None:
+        """Registra um hash já calculado por quem leu o arquivo inteiro."""
+        with self._lock:
+            self._entries[path] = FileSnapshot(path, mtime_ns, size, sha256)
+
+    def fingerprint(self, path: str) -> str:
+        """Hash sha256 do conteúdo (ou um marcador, se o arquivo não puder ser lido)."""
+        try:
+            return self.snapshot(path).sha256
+        except OSError as e:
+            logger.warning(f"[FileCache] não foi possível ler {path}: {e}")
+            return "unreadable"
+
+    def invalidate(self, path: str | None = None) -> None:
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(path, None)
+
+
+@lru_cache(maxsize=1)
+def get_file_cache() -> FileSnapshotCache:
+    """Instância compartilhada pelo processo."""
+    return FileSnapshotCache()
@@ -0,0 +1,122 @@
+import http.client
+import logging
+import ssl
+import threading
+import time
+from urllib.parse import urlsplit
+
+logger = logging.getLogger("HttpPool")
+
+# Conexões ociosas mantidas por host.
+MAX_IDLE_PER_HOST = 8
+# Tempo (s) após o qual uma conexão ociosa é descartada em vez de reutilizada.
+IDLE_TIMEOUT = 60.0
+
+
+class HttpConnectionPool:
+    """
+    Pool de conexões HTTP/1.1 keep-alive, por (scheme, host, port).
+
+    `acquire` devolve uma conexão ociosa do host (evitando novo handshake
+    TCP/TLS) ou abre uma nova; `release` a devolve ao pool se a resposta foi
+    lida por completo, ou a fecha caso contrário.
+    """
+
+    def __init__(self, max_idle_per_host=MAX_IDLE_PER_HOST, idle_timeout=IDLE_TIMEOUT,
+                 timeout=60.0, ssl_context=None):
+        self.max_idle_per_host = max_idle_per_host
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.ssl_context = ssl_context or ssl.create_default_context()
+        self._idle = {}
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+
+    @staticmethod
+    def _key(url):
+        parts = urlsplit(url)
+        scheme = parts.scheme or "http"
+        port = parts.port or (443 if scheme == "https" else 80)
+        return scheme, parts.hostname, port
+
+    def acquire(self, url):
+        """Retorna (conexão, reutilizada?) para o host da URL."""
+        key = self._key(url)
+        now = time.monotonic()
+        with self._lock:
+            stack = self._idle.get(key, [])
+            while stack:
+                conn, idle_since = stack.pop()
+                if now - idle_since <= self.idle_timeout:
+                    self.reused += 1
+                    return conn, True
+                conn.close()
+        scheme, host, port = key
+        if scheme == "https":
+            conn = http.client.HTTPSConnection(host, port, timeout=self.timeout, context=self.ssl_context)
+        else:
+            conn = http.client.HTTPConnection(host, port, timeout=self.timeout)
+        with self._lock:
+            self.created += 1
+        logger.info(f"[HttpPool] nova conexão {scheme}://{host}:{port}")
+        return conn, False
+
+    def release(self, url, conn, reusable=True):
+        """Devolve a conexão ao pool (ou a fecha, se não puder ser reutilizada)."""
+        if not reusable or conn.sock is None:
+            conn.close()
+            return
+        key = self._key(url)
+        with self._lock:
+            stack = self._idle.setdefault(key, [])
+            if len(stack) < self.max_idle_per_host:
+                stack.append((conn, time.monotonic()))
+                return
+        conn.close()
+
+    def request(self, method, url, body=None, headers=None):
+        """
+        Envia a requisição e retorna (conexão, resposta). Uma conexão
+        reutilizada que o servidor já tenha fechado é substituída uma vez,
+        de forma transparente. O chamador deve consumir a resposta e
+        chamar `release`.
+        """
+        parts = urlsplit(url)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        conn, reused = self.acquire(url)
+        try:
+            conn.request(method, path, body=body, headers=headers or {})
+            return conn, conn.getresponse()
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError) as e:
+            conn.close()
+            if not reused:
+                raise
+            logger.info(f"[HttpPool] conexão ociosa encerrada pelo servidor, reconectando: {e}")
+            conn, _ = self.acquire_new(url)
+            try:
+                conn.request(method, path, body=body, headers=headers or {})
+                return conn, conn.getresponse()
+            except Exception:
+                conn.close()
+                raise
+        except Exception:
+            conn.close()
+            raise
+
+    def acquire_new(self, url):
+        """Abre sempre uma conexão nova, ignorando as ociosas."""
+        with self._lock:
+            idle = self._idle.pop(self._key(url), [])
+        for conn, _ in idle:
+            conn.close()
+        return self.acquire(url)
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for stack in idle.values():
+            for conn, _ in stack:
+                conn.close()
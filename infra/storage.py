@@ -0,0 +1,669 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger("Storage")
+
+# Número de registros no journal que dispara a compactação em snapshot.
+COMPACT_EVERY = 500
+
+# Índice com o resumo de todas as sessões do JsonJournalStorage.
+MANIFEST_FILE = "manifest.json"
+
+# Medições de envio (telemetria) mantidas por chat; as mais antigas são descartadas.
+METRICS_PER_CHAT = 500
+
+
+def empty_session():
+    return {
+        "history": [], "files": [], "title": None, "file_states": {}, "summary": None,
+        "contexts": {}, "metrics": [], "seq": 0,
+    }
+
+
+def apply_record(data, record):
+    """Aplica um registro de mutação (journal) sobre os dados de uma sessão."""
+    op = record.get("op")
+    if op == "message":
+        data["history"].append(record["value"])
+    elif op == "file_add":
+        # um anexo aparece uma vez só, como no SqliteStorage (chave chat_id + path)
+        if record["path"] not in data["files"]:
+            data["files"].append(record["path"])
+    elif op == "file_remove":
+        if record["path"] in data["files"]:
+            data["files"].remove(record["path"])
+    elif op == "file_state":
+        data["file_states"][record["path"]] = record["value"]
+    elif op == "file_state_remove":
+        data["file_states"].pop(record["path"], None)
+    elif op == "title":
+        data["title"] = record["value"]
+    elif op == "summary":
+        data["summary"] = {"upto": record["upto"], "text": record["text"]}
+    elif op == "context":
+        # chaves em texto para sobreviver ao snapshot JSON
+        data["contexts"][str(record["turn"])] = {"text": record["text"], "chunks": record["chunks"]}
+    elif op == "metrics":
+        data["metrics"].append(record["value"])
+        del data["metrics"][:-METRICS_PER_CHAT]
+    else:
+        logger.warning(f"[Storage] registro desconhecido: {op}")
+
+
+class SessionStorage:
+    """
+    Contrato dos backends de persistência usados pelo SessionService.
+
+    As sessões são lidas inteiras com `load` e alteradas por registros de
+    mutação (`{"op": ..., ...}`) entregues em lote para `append`.
+    """
+
+    def list_chats(self) -> list[str]:
+        raise NotImplementedError
+
+    def list_summaries(self) -> list[dict]:
+        """
+        Resumo de cada sessão: chat_id, title, created_at, updated_at,
+        message_count e size (bytes). Implementação genérica (lenta): carrega
+        todas as sessões; os backends mantêm índices próprios.
+        """
+        summaries = []
+        for chat_id in self.list_chats():
+            data = self.load(chat_id)
+            summaries.append({
+                "chat_id": chat_id,
+                "title": data.get("title"),
+                "created_at": 0.0,
+                "updated_at": 0.0,
+                "message_count": len(data["history"]),
+                "size": 0,
+            })
+        return summaries
+
+    def create_chat(self, chat_id: str, data: dict) -> None:
+        raise NotImplementedError
+
+    def load(self, chat_id: str) -> dict:
+        raise NotImplementedError
+
+    def load_history(self, chat_id: str, before: int | None = None, limit: int | None = None) -> list[str]:
+        """
+        Página do histórico em ordem cronológica: até `limit` mensagens
+        anteriores ao índice `before` (None = fim). Implementação genérica:
+        carrega a sessão inteira; o SQLite consulta só a página.
+        """
+        history = self.load(chat_id)["history"]
+        end = len(history) if before is None else max(0, min(before, len(history)))
+        start = 0 if limit is None else max(0, end - limit)
+        return history[start:end]
+
+    def history_count(self, chat_id: str) -> int:
+        return len(self.load(chat_id)["history"])
+
+    def append(self, chat_id: str, records: list[dict]) -> None:
+        """Grava o lote; levanta a exceção se ele não pôde ser gravado, para nova tentativa."""
+        raise NotImplementedError
+
+    def delete_chat(self, chat_id: str) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class JsonJournalStorage(SessionStorage):
+    """
+    Um snapshot (`<chat_id>.json`) e um journal append-only
+    (`<chat_id>.journal`, um registro JSON por linha) por chat. O snapshot
+    é reescrito somente na compactação, a cada `compact_every` registros.
+
+    O manifesto (MANIFEST_FILE) guarda o resumo de todas as sessões, de
+    modo que listar os chats não exige abrir nenhum arquivo de sessão. As
+    gravações atualizam só a entrada do chat em memória; o arquivo é
+    reescrito ao criar/remover chats e em `close()`. Após uma queda, as
+    entradas cujo `size` não bate com snapshot + journal em disco são
+    recalculadas na abertura.
+    """
+
+    def __init__(self, storage_path="sessions", compact_every=COMPACT_EVERY):
+        os.makedirs(storage_path, exist_ok=True)
+        self.storage_path = storage_path
+        self.compact_every = compact_every
+        self._seq = {}
+        self._journal_len = {}
+        self._lock = threading.RLock()
+        self._manifest = None
+        self._manifest_dirty = False
+
+    def _path(self, chat_id):
+        return os.path.join(self.storage_path, f"{chat_id}.json")
+
+    def _journal_path(self, chat_id):
+        return os.path.join(self.storage_path, f"{chat_id}.journal")
+
+    def _manifest_path(self):
+        return os.path.join(self.storage_path, MANIFEST_FILE)
+
+    def list_chats(self):
+        return [
+            fname.replace(".json", "")
+            for fname in os.listdir(self.storage_path)
+            if fname.endswith(".json") and fname != MANIFEST_FILE
+        ]
+
+    def list_summaries(self):
+        with self._lock:
+            return [dict(entry) for entry in self._get_manifest().values()]
+
+    def create_chat(self, chat_id, data):
+        with self._lock:
+            self._save(chat_id, dict(data, seq=0))
+            self._seq[chat_id] = 0
+            self._journal_len[chat_id] = 0
+            now = time.time()
+            self._get_manifest()[chat_id] = {
+                "chat_id": chat_id,
+                "title": data.get("title"),
+                "created_at": now,
+                "updated_at": now,
+                "message_count": len(data.get("history", [])),
+                "size": os.path.getsize(self._path(chat_id)),
+            }
+            self._write_manifest()
+
+    def history_count(self, chat_id):
+        """Lido do manifesto, sem abrir a sessão."""
+        with self._lock:
+            entry = self._get_manifest().get(chat_id)
+        return entry["message_count"] if entry is not None else super().history_count(chat_id)
+
+    def load(self, chat_id):
+        with self._lock:
+            try:
+                with open(self._path(chat_id), "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                    data.setdefault("history", [])
+                    data.setdefault("files", [])
+                    data.setdefault("title", None)
+                    data.setdefault("file_states", {})
+                    data.setdefault("summary", None)
+                    data.setdefault("contexts", {})
+                    data.setdefault("metrics", [])
+                    data.setdefault("seq", 0)
+                return self._replay(chat_id, data)
+            except Exception as e:
+                logger.error(f"[JsonJournalStorage] falha ao carregar {chat_id}: {e}", exc_info=True)
+            # snapshot ilegível: recupera o que houver no journal, e os próximos
+            # registros continuam a numeração dele
+            try:
+                return self._replay(chat_id, empty_session())
+            except Exception as e:
+                logger.error(f"[JsonJournalStorage] journal de {chat_id} também ilegível: {e}", exc_info=True)
+                self._seq.setdefault(chat_id, 0)
+                self._journal_len.setdefault(chat_id, 0)
+                return empty_session()
+
+    def append(self, chat_id, records):
+        """Acrescenta registros ao journal do chat; custo independe do histórico."""
+        with self._lock:
+            try:
+                if chat_id not in self._seq:
+                    self.load(chat_id)
+                seq = self._seq.get(chat_id, 0)
+                lines = []
+                for record in records:
+                    seq += 1
+                    lines.append(json.dumps(dict(record, seq=seq), ensure_ascii=False) + "\n")
+                payload = "".join(lines)
+                with open(self._journal_path(chat_id), "a", encoding="utf-8") as f:
+                    f.write(payload)
+                self._seq[chat_id] = seq
+                self._journal_len[chat_id] = self._journal_len.get(chat_id, 0) + len(lines)
+                self._update_manifest(chat_id, records, len(payload.encode("utf-8")))
+            except Exception as e:
+                # registros regravados com o mesmo seq são ignorados no replay
+                logger.error(f"[JsonJournalStorage] falha ao gravar journal de {chat_id}: {e}")
+                raise
+            if self._journal_len[chat_id] >= self.compact_every:
+                self.compact(chat_id)
+
+    def delete_chat(self, chat_id):
+        with self._lock:
+            os.remove(self._path(chat_id))
+            if os.path.exists(self._journal_path(chat_id)):
+                os.remove(self._journal_path(chat_id))
+            self._seq.pop(chat_id, None)
+            self._journal_len.pop(chat_id, None)
+            if self._get_manifest().pop(chat_id, None) is not None:
+                self._write_manifest()
+
+    def close(self):
+        """Grava o manifesto se houve gravações desde a última escrita."""
+        with self._lock:
+            if self._manifest_dirty:
+                self._write_manifest()
+
+    def compact(self, chat_id):
+        """Consolida snapshot + journal em um novo snapshot e zera o journal."""
+        with self._lock:
+            try:
+                data = self.load(chat_id)
+                if not self._save(chat_id, data):
+                    return
+                with open(self._journal_path(chat_id), "w", encoding="utf-8"):
+                    pass
+                self._journal_len[chat_id] = 0
+                entry = self._get_manifest().get(chat_id)
+                if entry is not None:
+                    entry["size"] = os.path.getsize(self._path(chat_id))
+                    self._manifest_dirty = True
+                logger.info(f"[JsonJournalStorage] sessão {chat_id} compactada (seq={data['seq']})")
+            except Exception as e:
+                logger.error(f"[JsonJournalStorage] falha ao compactar {chat_id}: {e}", exc_info=True)
+
+    def _get_manifest(self):
+        """Carrega o manifesto e o reconcilia com os arquivos presentes no diretório."""
+        if self._manifest is None:
+            try:
+                with open(self._manifest_path(), "r", encoding="utf-8") as f:
+                    self._manifest = json.load(f)
+            except FileNotFoundError:
+                self._manifest = {}
+            except Exception as e:
+                logger.error(f"[JsonJournalStorage] manifesto inválido, reconstruindo: {e}", exc_info=True)
+                self._manifest = {}
+            on_disk = set(self.list_chats())
+            stale = set(self._manifest) - on_disk
+            missing = on_disk - set(self._manifest)
+            # entradas não gravadas antes de uma queda: o tamanho em disco difere
+            outdated = {chat_id for chat_id in on_disk - missing
+                        if self._manifest[chat_id].get("size") != self._disk_size(chat_id)}
+            for chat_id in stale:
+                del self._manifest[chat_id]
+            for chat_id in missing | outdated:
+                entry = self._summarize(chat_id)
+                if chat_id in outdated:
+                    entry["created_at"] = self._manifest[chat_id].get("created_at", entry["created_at"])
+                self._manifest[chat_id] = entry
+            if stale or missing or outdated:
+                logger.info(f"[JsonJournalStorage] manifesto reconciliado "
+                            f"(+{len(missing)} / -{len(stale)} / ~{len(outdated)})")
+                self._write_manifest()
+        return self._manifest
+
+    def _summarize(self, chat_id):
+        """Resumo de uma sessão ausente do manifesto (requer carregá-la)."""
+        data = self.load(chat_id)
+        stat = os.stat(self._path(chat_id))
+        size = self._disk_size(chat_id)
+        return {
+            "chat_id": chat_id,
+            "title": data.get("title"),
+            "created_at": stat.st_ctime,
+            "updated_at": stat.st_mtime,
+            "message_count": len(data["history"]),
+            "size": size,
+        }
+
+    def _disk_size(self, chat_id):
+        """Bytes do snapshot + journal do chat (só stat, sem ler os arquivos)."""
+        size = os.path.getsize(self._path(chat_id))
+        if os.path.exists(self._journal_path(chat_id)):
+            size += os.path.getsize(self._journal_path(chat_id))
+        return size
+
+    def _update_manifest(self, chat_id, records, written):
+        """Atualiza só a entrada do chat; o arquivo é gravado em close()."""
+        manifest = self._get_manifest()
+        entry = manifest.get(chat_id)
+        if entry is None:
+            return
+        for record in records:
+            if record.get("op") == "message":
+                entry["message_count"] += 1
+            elif record.get("op") == "title":
+                entry["title"] = record["value"]
+        entry["size"] += written
+        entry["updated_at"] = time.time()
+        self._manifest_dirty = True
+
+    def _write_manifest(self):
+        try:
+            tmp_path = self._manifest_path() + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._manifest, f, ensure_ascii=False)
+            os.replace(tmp_path, self._manifest_path())
+            self._manifest_dirty = False
+        except Exception as e:
+            logger.error(f"[JsonJournalStorage] falha ao gravar manifesto: {e}", exc_info=True)
+
+    def _replay(self, chat_id, data):
+        """Reaplica o journal sobre o snapshot, ignorando registros já compactados."""
+        count = 0
+        path = self._journal_path(chat_id)
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # linha truncada por queda durante a escrita
+                        logger.warning(f"[JsonJournalStorage] registro corrompido ignorado em {chat_id}")
+                        continue
+                    count += 1
+                    if record.get("seq", 0) <= data["seq"]:
+                        continue
+                    apply_record(data, record)
+                    data["seq"] = record["seq"]
+        self._seq[chat_id] = data["seq"]
+        self._journal_len[chat_id] = count
+        return data
+
+    def _save(self, chat_id, data):
+        """Grava o snapshot de forma atômica (arquivo temporário + rename)."""
+        try:
+            tmp_path = self._path(chat_id) + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self._path(chat_id))
+            return True
+        except Exception as e:
+            logger.error(f"[JsonJournalStorage] falha ao salvar {chat_id}: {e}", exc_info=True)
+            return False
+
+
+class SqliteStorage(SessionStorage):
+    """
+    Todas as sessões em um único banco SQLite em modo WAL.
+
+    As instruções são constantes parametrizadas, reaproveitadas pelo cache
+    de statements preparados do módulo sqlite3.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS chats (
+            chat_id       TEXT PRIMARY KEY,
+            title         TEXT,
+            created_at    REAL NOT NULL,
+            updated_at    REAL NOT NULL,
+            message_count INTEGER NOT NULL DEFAULT 0,
+            size_bytes    INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS messages (
+            chat_id    TEXT NOT NULL REFERENCES chats(chat_id) ON DELETE CASCADE,
+            seq        INTEGER NOT NULL,
+            content    TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            PRIMARY KEY (chat_id, seq)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS attachments (
+            chat_id  TEXT NOT NULL REFERENCES chats(chat_id) ON DELETE CASCADE,
+            path     TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            PRIMARY KEY (chat_id, path)
+        );
+        CREATE TABLE IF NOT EXISTS file_states (
+            chat_id TEXT NOT NULL REFERENCES chats(chat_id) ON DELETE CASCADE,
+            path    TEXT NOT NULL,
+            active  INTEGER NOT NULL,
+            PRIMARY KEY (chat_id, path)
+        );
+        CREATE TABLE IF NOT EXISTS summaries (
+            chat_id    TEXT PRIMARY KEY REFERENCES chats(chat_id) ON DELETE CASCADE,
+            upto       INTEGER NOT NULL,
+            text       TEXT NOT NULL,
+            updated_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS contexts (
+            chat_id TEXT NOT NULL REFERENCES chats(chat_id) ON DELETE CASCADE,
+            turn    INTEGER NOT NULL,
+            text    TEXT NOT NULL,
+            chunks  TEXT NOT NULL,
+            PRIMARY KEY (chat_id, turn)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS metrics (
+            chat_id TEXT NOT NULL REFERENCES chats(chat_id) ON DELETE CASCADE,
+            seq     INTEGER NOT NULL,
+            data    TEXT NOT NULL,
+            PRIMARY KEY (chat_id, seq)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_chats_updated ON chats(updated_at DESC);
+        CREATE INDEX IF NOT EXISTS idx_attachments_position ON attachments(chat_id, position);
+    """
+
+    SQL_LIST_CHATS = "SELECT chat_id FROM chats ORDER BY created_at"
+    SQL_LIST_SUMMARIES = (
+        "SELECT chat_id, title, created_at, updated_at, message_count, size_bytes "
+        "FROM chats ORDER BY updated_at DESC"
+    )
+    SQL_INSERT_CHAT = "INSERT INTO chats (chat_id, title, created_at, updated_at) VALUES (?, ?, ?, ?)"
+    SQL_SELECT_CHAT = "SELECT title, message_count FROM chats WHERE chat_id = ?"
+    SQL_SELECT_MESSAGES = "SELECT content FROM messages WHERE chat_id = ? ORDER BY seq"
+    SQL_SELECT_MESSAGE_PAGE = (
+        "SELECT content FROM messages WHERE chat_id = ? AND seq < ? ORDER BY seq DESC LIMIT ?"
+    )
+    SQL_SELECT_ATTACHMENTS = "SELECT path FROM attachments WHERE chat_id = ? ORDER BY position"
+    SQL_SELECT_FILE_STATES = "SELECT path, active FROM file_states WHERE chat_id = ?"
+    SQL_INSERT_MESSAGE = (
+        "INSERT INTO messages (chat_id, seq, content, created_at) "
+        "VALUES (?, (SELECT message_count FROM chats WHERE chat_id = ?), ?, ?)"
+    )
+    SQL_BUMP_MESSAGE_COUNT = (
+        "UPDATE chats SET message_count = message_count + 1, size_bytes = size_bytes + ?, "
+        "updated_at = ? WHERE chat_id = ?"
+    )
+    SQL_TOUCH_CHAT = "UPDATE chats SET updated_at = ? WHERE chat_id = ?"
+    SQL_SET_TITLE = "UPDATE chats SET title = ?, updated_at = ? WHERE chat_id = ?"
+    SQL_INSERT_ATTACHMENT = (
+        "INSERT OR IGNORE INTO attachments (chat_id, path, position) VALUES "
+        "(?, ?, (SELECT COALESCE(MAX(position), 0) + 1 FROM attachments WHERE chat_id = ?))"
+    )
+    SQL_DELETE_ATTACHMENT = "DELETE FROM attachments WHERE chat_id = ? AND path = ?"
+    SQL_UPSERT_FILE_STATE = (
+        "INSERT INTO file_states (chat_id, path, active) VALUES (?, ?, ?) "
+        "ON CONFLICT(chat_id, path) DO UPDATE SET active = excluded.active"
+    )
+    SQL_DELETE_FILE_STATE = "DELETE FROM file_states WHERE chat_id = ? AND path = ?"
+    SQL_SELECT_SUMMARY = "SELECT upto, text FROM summaries WHERE chat_id = ?"
+    SQL_UPSERT_SUMMARY = (
+        "INSERT INTO summaries (chat_id, upto, text, updated_at) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(chat_id) DO UPDATE SET upto = excluded.upto, text = excluded.text, "
+        "updated_at = excluded.updated_at"
+    )
+    SQL_SELECT_CONTEXTS = "SELECT turn, text, chunks FROM contexts WHERE chat_id = ?"
+    SQL_UPSERT_CONTEXT = (
+        "INSERT INTO contexts (chat_id, turn, text, chunks) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(chat_id, turn) DO UPDATE SET text = excluded.text, chunks = excluded.chunks"
+    )
+    SQL_SELECT_METRICS = "SELECT data FROM metrics WHERE chat_id = ? ORDER BY seq"
+    SQL_INSERT_METRICS = (
+        "INSERT INTO metrics (chat_id, seq, data) VALUES "
+        "(?, (SELECT COALESCE(MAX(seq), 0) + 1 FROM metrics WHERE chat_id = ?), ?)"
+    )
+    SQL_TRIM_METRICS = (
+        "DELETE FROM metrics WHERE chat_id = ? AND seq <= (SELECT MAX(seq) FROM metrics WHERE chat_id = ?) - ?"
+    )
+    SQL_DELETE_CHAT = "DELETE FROM chats WHERE chat_id = ?"
+
+    def __init__(self, storage_path="sessions", db_name="sessions.db"):
+        os.makedirs(storage_path, exist_ok=True)
+        self.db_path = os.path.join(storage_path, db_name)
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(
+            self.db_path,
+            check_same_thread=False,
+            isolation_level=None,
+            cached_statements=256,
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(self.SCHEMA)
+        self._migrate()
+        logger.info(f"[SqliteStorage] banco aberto em {self.db_path}")
+
+    def list_chats(self):
+        with self._lock:
+            return [row[0] for row in self._conn.execute(self.SQL_LIST_CHATS)]
+
+    def list_summaries(self):
+        with self._lock:
+            return [
+                {
+                    "chat_id": chat_id,
+                    "title": title,
+                    "created_at": created_at,
+                    "updated_at": updated_at,
+                    "message_count": message_count,
+                    "size": size,
+                }
+                for chat_id, title, created_at, updated_at, message_count, size
+                in self._conn.execute(self.SQL_LIST_SUMMARIES)
+            ]
+
+    def create_chat(self, chat_id, data):
+        now = time.time()
+        with self._lock, self._transaction():
+            self._conn.execute(self.SQL_INSERT_CHAT, (chat_id, data.get("title"), now, now))
+
+    def load(self, chat_id):
+        with self._lock:
+            try:
+                row = self._conn.execute(self.SQL_SELECT_CHAT, (chat_id,)).fetchone()
+                if row is None:
+                    logger.error(f"[SqliteStorage] sessão inexistente: {chat_id}")
+                    return empty_session()
+                data = empty_session()
+                data["title"] = row[0]
+                data["history"] = [r[0] for r in self._conn.execute(self.SQL_SELECT_MESSAGES, (chat_id,))]
+                data["files"] = [r[0] for r in self._conn.execute(self.SQL_SELECT_ATTACHMENTS, (chat_id,))]
+                data["file_states"] = {
+                    path: bool(active)
+                    for path, active in self._conn.execute(self.SQL_SELECT_FILE_STATES, (chat_id,))
+                }
+                summary = self._conn.execute(self.SQL_SELECT_SUMMARY, (chat_id,)).fetchone()
+                if summary is not None:
+                    data["summary"] = {"upto": summary[0], "text": summary[1]}
+                data["contexts"] = {
+                    str(turn): {"text": text, "chunks": json.loads(chunks)}
+                    for turn, text, chunks in self._conn.execute(self.SQL_SELECT_CONTEXTS, (chat_id,))
+                }
+                data["metrics"] = [json.loads(r[0]) for r in self._conn.execute(self.SQL_SELECT_METRICS, (chat_id,))]
+                return data
+            except Exception as e:
+                logger.error(f"[SqliteStorage] falha ao carregar {chat_id}: {e}", exc_info=True)
+                return empty_session()
+
+    def load_history(self, chat_id, before=None, limit=None):
+        """Só a página pedida, pela chave primária (chat_id, seq); seq é o índice da mensagem."""
+        with self._lock:
+            end = self.history_count(chat_id) if before is None else before
+            rows = self._conn.execute(
+                self.SQL_SELECT_MESSAGE_PAGE, (chat_id, end, -1 if limit is None else limit)
+            ).fetchall()
+        return [row[0] for row in reversed(rows)]
+
+    def history_count(self, chat_id):
+        with self._lock:
+            row = self._conn.execute(self.SQL_SELECT_CHAT, (chat_id,)).fetchone()
+        return row[1] if row is not None else 0
+
+    def append(self, chat_id, records):
+        """Aplica o lote de registros em uma única transação."""
+        now = time.time()
+        with self._lock:
+            try:
+                with self._transaction():
+                    for record in records:
+                        self._execute_record(chat_id, record, now)
+                    self._conn.execute(self.SQL_TOUCH_CHAT, (now, chat_id))
+            except Exception as e:
+                logger.error(f"[SqliteStorage] falha ao gravar em {chat_id}: {e}")
+                raise
+
+    def delete_chat(self, chat_id):
+        with self._lock, self._transaction():
+            self._conn.execute(self.SQL_DELETE_CHAT, (chat_id,))
+
+    def close(self):
+        with self._lock:
+            try:
+                self._conn.close()
+            except Exception as e:
+                logger.error(f"[SqliteStorage] falha ao fechar banco: {e}", exc_info=True)
+
+    def _migrate(self):
+        """Adiciona colunas criadas depois da primeira versão do schema."""
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(chats)")}
+        if "size_bytes" not in columns:
+            self._conn.execute("ALTER TABLE chats ADD COLUMN size_bytes INTEGER NOT NULL DEFAULT 0")
+            self._conn.execute(
+                "UPDATE chats SET size_bytes = (SELECT COALESCE(SUM(LENGTH(CAST(content AS BLOB))), 0) "
+                "FROM messages WHERE messages.chat_id = chats.chat_id)"
+            )
+
+    def _execute_record(self, chat_id, record, now):
+        op = record.get("op")
+        execute = self._conn.execute
+        if op == "message":
+            execute(self.SQL_INSERT_MESSAGE, (chat_id, chat_id, record["value"], now))
+            execute(self.SQL_BUMP_MESSAGE_COUNT, (len(record["value"].encode("utf-8")), now, chat_id))
+        elif op == "file_add":
+            execute(self.SQL_INSERT_ATTACHMENT, (chat_id, record["path"], chat_id))
+        elif op == "file_remove":
+            execute(self.SQL_DELETE_ATTACHMENT, (chat_id, record["path"]))
+        elif op == "file_state":
+            execute(self.SQL_UPSERT_FILE_STATE, (chat_id, record["path"], int(bool(record["value"]))))
+        elif op == "file_state_remove":
+            execute(self.SQL_DELETE_FILE_STATE, (chat_id, record["path"]))
+        elif op == "title":
+            execute(self.SQL_SET_TITLE, (record["value"], now, chat_id))
+        elif op == "summary":
+            execute(self.SQL_UPSERT_SUMMARY, (chat_id, record["upto"], record["text"], now))
+        elif op == "context":
+            execute(self.SQL_UPSERT_CONTEXT, (chat_id, record["turn"], record["text"], json.dumps(record["chunks"])))
+        elif op == "metrics":
+            execute(self.SQL_INSERT_METRICS, (chat_id, chat_id, json.dumps(record["value"])))
+            execute(self.SQL_TRIM_METRICS, (chat_id, chat_id, METRICS_PER_CHAT))
+        else:
+            logger.warning(f"[SqliteStorage] registro desconhecido: {op}")
+
+    def _transaction(self):
+        return _Transaction(self._conn)
+
+
+class _Transaction:
+    """BEGIN/COMMIT explícitos (a conexão opera em autocommit)."""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __enter__(self):
+        self._conn.execute("BEGIN")
+        return self._conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self._conn.execute("COMMIT")
+        else:
+            self._conn.execute("ROLLBACK")
+        return False
+
+
+def create_storage(backend: str | None = None, storage_path: str = "sessions") -> SessionStorage:
+    """
+    Instancia o backend de sessões. Sem `backend` explícito, usa a variável
+    de ambiente CHATBOT_SESSION_BACKEND ("json" por padrão, ou "sqlite").
+    """
+    backend = (backend or os.environ.get("CHATBOT_SESSION_BACKEND") or "json").lower()
+    if backend == "sqlite":
+        return SqliteStorage(storage_path)
+    if backend != "json":
+        logger.warning(f"[Storage] backend desconhecido '{backend}', usando json")
+    return JsonJournalStorage(storage_path)
@@ -88,6 +88,7 @@ if __name__ == "__main__":
         app = QApplication(sys.argv)
         logger.info("[Bootstrap] QApplication iniciada.")
         core = MainWindow()
+        app.aboutToQuit.connect(core.shutdown)
         logger.info("[Bootstrap] MainWindow criada.")
 
         shell = FuturisticWindow(core)
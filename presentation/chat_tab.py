@@ -1,15 +1,18 @@
 import json
 import logging
 import os
+import time
 
 from qtpy.QtWidgets import (
     QWidget, QHBoxLayout, QVBoxLayout, QTextEdit, QMenu, QFileDialog,
-    QLabel, QAction, QMessageBox, QSizePolicy, QPushButton
+    QLabel, QAction, QMessageBox, QSizePolicy, QPushButton, QInputDialog
 )
-from qtpy.QtCore import Qt, QEvent
+from qtpy.QtCore import Qt, QEvent, QTimer
 import qtawesome as qta
 
-from core.workers.ai_worker import AIWorker
+from core.controller.chat_controller import ChatController
+from core.service.knowledge_base import SCOPES as KB_SCOPES
+from core.workers.ai_worker import AIWorker, FanOutWorker
 from presentation.advanced_selection import AdvancedSelectionDialog
 from presentation.custom_web_engine_view import CustomWebEngineView
 from presentation.file_view import FilePanel
@@ -20,20 +23,39 @@ from utils.utilities import COLOR_VARS, get_base_path
 
 logger = logging.getLogger("ChatTab")
 
+# Pausa na digitação (ms) antes de aquecer o contexto do próximo envio.
+PREFETCH_DEBOUNCE_MS = 400
+# Janela (ms) em que um envio com o mesmo texto é tratado como Enter repetido e ignorado.
+RESEND_GUARD_MS = 500
+
 
 class ChatTab(QWidget):
-    """Abas de chat com histórico, entrada de texto, botões e anexos."""
+    """
+    Abas de chat com histórico, entrada de texto, botões e anexos.
+
+    A orquestração (sessão, contexto e envio à IA) fica no ChatController;
+    a aba só traduz eventos de widgets e renderiza o WebView.
+    """
 
-    def __init__(self, chat_id: str, session_service) -> None:
+    def __init__(self, chat_id: str, session_service, ai_service=None, scheduler=None) -> None:
         super().__init__()
         self.chat_id = chat_id
         self.session = session_service
+        self.controller = ChatController(chat_id, session_service, ai_service, scheduler)
 
         # estados de menus auxiliares
         self.worker = None
+        self._stream_seq = 0
+        self._streams = {}
+        self._merging = set()
+        self._workers = []
         self.kb_source_menu = None
         self.agent_menu = None
         self.conversation_menu = None
+        # o WebView (e com ele o histórico) só é carregado na primeira exibição
+        self._history_loaded = False
+        # (texto, instante) do último envio, para o guarda de Enter repetido
+        self._last_send = (None, 0.0)
 
         # inicializa UI
         self._create_widgets()
@@ -45,8 +67,8 @@ class ChatTab(QWidget):
         # Web view para o histórico
         self.history = CustomWebEngineView()
         self.history.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
-        self._load_html()
         self.history.loadFinished.connect(self._load_history)
+        self.history.bridge.older_history_requested.connect(self._load_older_history)
 
         # Campo de entrada de texto
         self.input = QTextEdit()
@@ -57,6 +79,10 @@ class ChatTab(QWidget):
         self.input.setVerticalScrollBarPolicy(Qt.ScrollBarAsNeeded)
         self.input.installEventFilter(self)
 
+        self._prefetch_timer = QTimer(self)
+        self._prefetch_timer.setSingleShot(True)
+        self._prefetch_timer.setInterval(PREFETCH_DEBOUNCE_MS)
+
         # Painel de arquivos
         self.file_panel = FilePanel(self.session, self.chat_id)
 
@@ -67,8 +93,10 @@ class ChatTab(QWidget):
         self.send_btn = self._make_button(
             icon_name="fa5s.paper-plane",
             tooltip="Enviar",
-            handler=self.on_send
+            handler=self.on_send,
+            cancellable=True
         )
+        self.send_btn.cancelRequested.connect(self.on_cancel)
 
         # Configurações dos botões do header
         self._header_buttons = [
@@ -129,8 +157,24 @@ class ChatTab(QWidget):
         self.history.load_finished_signal.connect(
             lambda: logger.info("[ChatTab] WebView carregado")
         )
+        self.input.textChanged.connect(self._on_input_changed)
+        self._prefetch_timer.timeout.connect(self._prefetch)
+
+    def _on_input_changed(self) -> None:
+        """Reinicia a espera do aquecimento a cada alteração do texto."""
+        if self.input.hasFocus() and self.input.toPlainText().strip():
+            self._prefetch_timer.start()
+        else:
+            self._prefetch_timer.stop()
+
+    def _prefetch(self) -> None:
+        """Aquece anexos, contagens e consulta com o texto atual, enquanto o usuário digita."""
+        try:
+            self.controller.prefetch(self.input.toPlainText(), self.get_active_files())
+        except Exception as e:
+            logger.error("[ChatTab] erro no aquecimento de contexto: %s", e, exc_info=True)
 
-    def _make_button(self, icon_name: str, tooltip: str, handler) -> LoadingButton:
+    def _make_button(self, icon_name: str, tooltip: str, handler, cancellable: bool = False) -> LoadingButton:
         """Helper para criar LoadingButton com ícone do qtawesome."""
         btn = LoadingButton(
             text="",
@@ -139,12 +183,23 @@ class ChatTab(QWidget):
             icon=qta.icon(icon_name, color=COLOR_VARS["accent"]),
             spinner_size=20,
             spinner_thickness=3,
-            colors=("#FF4081", "#7C4DFF")
+            colors=("#FF4081", "#7C4DFF"),
+            cancellable=cancellable
         )
         if handler:
             btn.clicked.connect(handler)
         return btn
 
+    def showEvent(self, event) -> None:
+        """
+        Carrega o WebView e o histórico na primeira exibição: abas
+        restauradas que nunca forem abertas não leem a sessão do disco.
+        """
+        if not self._history_loaded:
+            self._history_loaded = True
+            self._load_html()
+        super().showEvent(event)
+
     def _load_html(self) -> None:
         """Carrega o HTML do chat view de forma assíncrona."""
         try:
@@ -156,19 +211,41 @@ class ChatTab(QWidget):
             logger.error("[ChatTab] erro ao carregar HTML: %s", e, exc_info=True)
 
     def _load_history(self) -> None:
-        """Injeta o histórico salvo na sessão dentro do WebView."""
+        """Injeta a página mais recente do histórico salvo dentro do WebView."""
         try:
-            for msg in self.session.load_history(self.chat_id):
-                if msg.startswith("Você: "):
-                    self._append_message(msg[len("Você: "):], True)
-                elif msg.startswith("AI: "):
-                    self._append_message(msg[len("AI: "):], False)
-                else:
-                    self._append_message(msg, False)
+            page, has_more = self.controller.load_latest_history()
+            messages = [self._to_view_message(msg) for msg in page]
+            has_more = str(has_more).lower()
+            self.history.page().runJavaScript(
+                f"addMessages({json.dumps(messages)}); setHasMoreHistory({has_more});"
+            )
         except Exception as e:
             logger.error("[ChatTab] erro ao carregar histórico: %s", e, exc_info=True)
             QMessageBox.critical(self, "Erro", "Não foi possível carregar o histórico.")
 
+    def _load_older_history(self) -> None:
+        """Carrega a página anterior do histórico quando o usuário rola até o topo."""
+        try:
+            page, has_more = self.controller.load_older_history()
+            if not page:
+                return
+            messages = [self._to_view_message(msg) for msg in page]
+            self.history.page().runJavaScript(
+                f"prependMessages({json.dumps(messages)}, {str(has_more).lower()});"
+            )
+            logger.info(f"[ChatTab] página anterior carregada ({len(page)} mensagens)")
+        except Exception as e:
+            logger.error("[ChatTab] erro ao carregar página anterior: %s", e, exc_info=True)
+
+    @staticmethod
+    def _to_view_message(msg: str) -> dict:
+        """Converte uma entrada salva ("Você: ..."/"AI: ...") no formato do WebView."""
+        if msg.startswith("Você: "):
+            return {"text": msg[len("Você: "):], "isUser": True}
+        if msg.startswith("AI: "):
+            return {"text": msg[len("AI: "):], "isUser": False}
+        return {"text": msg, "isUser": False}
+
     def _append_message(self, text: str, is_user: bool) -> None:
         """Injeta uma mensagem no WebView via JavaScript."""
         try:
@@ -177,9 +254,19 @@ class ChatTab(QWidget):
         except Exception as e:
             logger.error("[ChatTab] erro ao injetar mensagem: %s", e, exc_info=True)
 
+    def _append_messages(self, messages: list[dict]) -> None:
+        """Injeta várias mensagens ({text, isUser}) com uma única chamada JavaScript."""
+        if not messages:
+            return
+        try:
+            self.history.page().runJavaScript(f"addMessages({json.dumps(messages)});")
+        except Exception as e:
+            logger.error("[ChatTab] erro ao injetar mensagens: %s", e, exc_info=True)
+
     def get_active_files(self) -> list[str]:
         """Retorna lista de paths dos arquivos marcados como ativos."""
         try:
+            self.file_panel.ensure_loaded()
             files = []
             for i in range(self.file_panel.file_list.count()):
                 item = self.file_panel.file_list.item(i)
@@ -193,6 +280,14 @@ class ChatTab(QWidget):
     def _show_config_menu(self) -> None:
         menu = QMenu(self)
         menu.addAction("Anexar arquivos...", self.on_attach_files)
+        bypass = menu.addAction("Próximo envio sem cache")
+        bypass.setCheckable(True)
+        bypass.setChecked(self.controller.bypass_cache_once)
+        bypass.toggled.connect(lambda checked: setattr(self.controller, "bypass_cache_once", checked))
+        merge = menu.addAction("Combinar respostas dos agentes")
+        merge.setCheckable(True)
+        merge.setChecked(self.controller.merge_agents)
+        merge.toggled.connect(lambda checked: setattr(self.controller, "merge_agents", checked))
         menu.exec_(self.send_btn.mapToGlobal(self.send_btn.rect().bottomRight()))
 
     def show_stackspot_menu(self) -> None:
@@ -211,33 +306,46 @@ class ChatTab(QWidget):
             paths, _ = QFileDialog.getOpenFileNames(self, "Selecionar arquivos")
             if not paths:
                 return
-            for p in paths:
-                self.session.add_file(self.chat_id, p)
-                self._append_message(f"[Arquivo anexado] {os.path.basename(p)}", False)
+            self.controller.attach_files(paths)
+            self._append_messages([
+                {"text": f"[Arquivo anexado] {os.path.basename(p)}", "isUser": False}
+                for p in paths
+            ])
             self.file_panel.load_files()
         except Exception as e:
             logger.error("[ChatTab] erro ao anexar arquivos: %s", e, exc_info=True)
             QMessageBox.warning(self, "Erro", "Falha ao anexar arquivos.")
 
     def on_send(self) -> None:
-        """Envia o prompt ao AIWorker e injeta no WebView."""
+        """Envia o prompt pelo ChatController e injeta no WebView."""
         text = self.input.toPlainText().strip()
         if not text:
             return
+        now = time.monotonic()
+        last_text, last_at = self._last_send
+        if text == last_text and (now - last_at) * 1000 < RESEND_GUARD_MS:
+            logger.info("[ChatTab] Enter repetido ignorado")
+            return
+        self._last_send = (text, now)
 
         self.send_btn.setLoading(True)
         try:
-            # salvar e exibir usuário
-            self.session.save_message(self.chat_id, f"Você: {text}")
+            # exibir usuário e enfileirar (o controller salva as mensagens)
             self._append_message(text, True)
-
-            # preparar IA
-            files = self.get_active_files()
             self.loading.start()
-            self.worker = AIWorker(text, files)
+            agents = self.controller.selected_agents
+            if len(agents) > 1:
+                self._send_fan_out(text, agents)
+                self.input.clear()
+                return
+            self.worker = AIWorker(self.controller)
+            self.worker.context_built.connect(self.on_context_built)
+            self.worker.chunk.connect(self.on_chunk)
             self.worker.finished.connect(self.on_response)
             self.worker.error.connect(self.on_error)
-            self.worker.start()
+            self.worker.cancelled.connect(self.on_cancelled)
+            self._workers.append(self.worker)
+            self.worker.start(text, self.get_active_files())
 
             # limpar input
             self.input.clear()
@@ -245,15 +353,57 @@ class ChatTab(QWidget):
         except Exception as e:
             logger.error("[ChatTab] erro em on_send: %s", e, exc_info=True)
             QMessageBox.critical(self, "Erro", "Falha ao enviar mensagem.")
+            self._request_done(self.worker)
             self.send_btn.setLoading(False)
 
+    def _send_fan_out(self, text: str, agents: list[str]) -> None:
+        """Mesmo prompt para vários agentes: uma bolha com uma sub-bolha por agente."""
+        self.worker = FanOutWorker(self.controller)
+        self.worker.agent_context_built.connect(lambda agent, report: self.on_context_built(report))
+        self.worker.agent_chunk.connect(self.on_agent_chunk)
+        self.worker.agent_finished.connect(self.on_agent_finished)
+        self.worker.agent_error.connect(self.on_agent_error)
+        self.worker.agent_cancelled.connect(self.on_agent_cancelled)
+        self.worker.merge_chunk.connect(self.on_merge_chunk)
+        self.worker.merged.connect(self.on_merged)
+        self.worker.merge_error.connect(self.on_merge_error)
+        self.worker.finished.connect(self.on_fan_out_finished)
+        self._workers.append(self.worker)
+        self._stream_seq += 1
+        group_id = f"g{self._stream_seq}"
+        self._streams[self.worker] = group_id
+        self.history.page().runJavaScript(f"beginAgentGroup({json.dumps(group_id)}, {json.dumps(agents)});")
+        self.worker.start(text, agents, self.get_active_files())
+
+    def on_context_built(self, report) -> None:
+        """Registra quais anexos entraram no contexto do envio."""
+        logger.info(f"[ChatTab] contexto: {report.summary()}")
+        if report.omitted or report.truncated:
+            logger.warning(f"[ChatTab] anexos cortados pelo orçamento: truncados={report.truncated} omitidos={report.omitted}")
+
+    def on_chunk(self, delta: str) -> None:
+        """Renderiza um trecho da resposta na bolha em andamento."""
+        if self.sender() not in self._workers:
+            return
+        try:
+            stream_id = self._streams.get(self.sender())
+            if stream_id is None:
+                self._stream_seq += 1
+                stream_id = self._streams[self.sender()] = f"s{self._stream_seq}"
+                self.history.page().runJavaScript(f"beginStreamMessage({json.dumps(stream_id)});")
+            self.history.page().runJavaScript(
+                f"appendStreamChunk({json.dumps(stream_id)}, {json.dumps(delta)});"
+            )
+        except Exception as e:
+            logger.error("[ChatTab] erro em on_chunk: %s", e, exc_info=True)
+
     def on_response(self, text: str) -> None:
-        """Recebe resposta da IA e injeta no WebView."""
+        """Recebe a resposta completa da IA e finaliza a bolha no WebView."""
+        worker = self.sender()
+        if not self._request_done(worker):
+            return
         try:
-            self.loading.stop()
-            self.send_btn.setLoading(False)
-            self.session.save_message(self.chat_id, f"AI: {text}")
-            self._append_message(text, False)
+            self._end_stream(worker, text)
 
         except Exception as e:
             logger.error("[ChatTab] erro em on_response: %s", e, exc_info=True)
@@ -264,10 +414,109 @@ class ChatTab(QWidget):
     def on_error(self, exc: Exception) -> None:
         """Tratamento de erro do AIWorker."""
         logger.error("[ChatTab] erro na IA: %s", exc, exc_info=True)
+        worker = self.sender()
+        if not self._request_done(worker):
+            return
         QMessageBox.critical(self, "Erro", "Erro na comunicação com IA.")
-        self._append_message("Erro ao obter resposta da IA", False)
+        self._end_stream(worker, "Erro ao obter resposta da IA")
         self.send_btn.setEnabled(True)
 
+    def on_cancel(self) -> None:
+        """Cancela as requisições da aba (em execução e na fila)."""
+        count = self.controller.cancel_all()
+        logger.info(f"[ChatTab] {count} requisição(ões) cancelada(s) no chat {self.chat_id}")
+
+    def on_cancelled(self, reason: str) -> None:
+        """Finaliza a bolha da requisição cancelada ou expirada."""
+        worker = self.sender()
+        if not self._request_done(worker):
+            return
+        logger.info(f"[ChatTab] requisição encerrada: {reason}")
+        self._end_stream(worker, f"Resposta interrompida ({reason})")
+
+    def _agent_stream(self, worker, agent: str) -> str | None:
+        group_id = self._streams.get(worker) if worker in self._workers else None
+        return f"{group_id}:{agent}" if group_id is not None else None
+
+    def on_agent_chunk(self, agent: str, delta: str) -> None:
+        stream_id = self._agent_stream(self.sender(), agent)
+        if stream_id is not None:
+            self.history.page().runJavaScript(f"appendStreamChunk({json.dumps(stream_id)}, {json.dumps(delta)});")
+
+    def on_agent_finished(self, agent: str, text: str) -> None:
+        stream_id = self._agent_stream(self.sender(), agent)
+        if stream_id is not None:
+            self.history.page().runJavaScript(f"endStreamMessage({json.dumps(stream_id)}, {json.dumps(text)});")
+
+    def on_agent_error(self, agent: str, exc) -> None:
+        logger.error(f"[ChatTab] erro no agente {agent}: {exc}")
+        self.on_agent_finished(agent, "Erro ao obter resposta da IA")
+
+    def on_agent_cancelled(self, agent: str, reason: str) -> None:
+        self.on_agent_finished(agent, f"Resposta interrompida ({reason})")
+
+    def on_merge_chunk(self, delta: str) -> None:
+        worker = self.sender()
+        stream_id = self._agent_stream(worker, "merge")
+        if stream_id is None:
+            return
+        if worker not in self._merging:
+            self._merging.add(worker)
+            self.history.page().runJavaScript(
+                f"beginMergeStream({json.dumps(self._streams[worker])}, {json.dumps('Resposta combinada')});"
+            )
+        self.history.page().runJavaScript(f"appendStreamChunk({json.dumps(stream_id)}, {json.dumps(delta)});")
+
+    def on_merged(self, text: str) -> None:
+        self.on_agent_finished("merge", text)
+
+    def on_merge_error(self, cause) -> None:
+        logger.warning(f"[ChatTab] fusão das respostas falhou: {cause}")
+        self.on_agent_finished("merge", "Não foi possível combinar as respostas")
+
+    def on_fan_out_finished(self, fan_out) -> None:
+        worker = self.sender()
+        if self._request_done(worker):
+            self._streams.pop(worker, None)
+            self._merging.discard(worker)
+            logger.info(f"[ChatTab] fan-out concluído: {len(fan_out.results)}/{len(fan_out.agents)} agente(s)")
+
+    def shutdown(self) -> None:
+        """Cancela as requisições pendentes antes de a aba ser destruída."""
+        self._prefetch_timer.stop()
+        workers, self._workers = self._workers, []
+        for worker in workers:
+            try:
+                worker.blockSignals(True)
+            except RuntimeError:
+                pass
+        self._streams.clear()
+        self._merging.clear()
+        self.controller.shutdown("aba fechada")
+
+    def _end_stream(self, worker, text: str) -> None:
+        """Fecha a bolha em streaming do worker (se houver) com `text`, ou injeta uma nova."""
+        stream_id = self._streams.pop(worker, None)
+        if stream_id is not None:
+            self.history.page().runJavaScript(
+                f"endStreamMessage({json.dumps(stream_id)}, {json.dumps(text)});"
+            )
+        else:
+            self._append_message(text, False)
+
+    def _request_done(self, worker) -> bool:
+        """
+        Remove o worker da aba e encerra o indicador de carregamento quando não
+        há mais requisições. Retorna False para sinais de workers já descartados.
+        """
+        if worker not in self._workers:
+            return False
+        self._workers.remove(worker)
+        if not self._workers:
+            self.loading.stop()
+            self.send_btn.setLoading(False)
+        return True
+
     def eventFilter(self, source, event) -> bool:
         """Captura Enter no QTextEdit para enviar."""
         if source is self.input and event.type() == QEvent.KeyPress:
@@ -284,37 +533,26 @@ class ChatTab(QWidget):
                 self.kb_source_menu.deleteLater()
             except: pass
 
+        kbs = self.controller.knowledge_bases
         lists_data = [
-            [{"name": n, "description": d} for n, d in [
-                ("Maçã","Uma fruta vermelha e doce"),("Banana","Fruta amarela rica em potássio"),
-                ("Laranja","Suco cítrico refrescante"),("Uva","Pequena fruta roxa ou verde"),
-                ("Manga","Fruta tropical suculenta"),("Abacaxi","Fruta com casca espinhosa"),
-                ("Morango","Fruta vermelha com sementes"),("Pera","Fruta doce e suculenta"),
-                ("Kiwi","Fruta pequena e peluda"),("Melancia","Fruta grande e refrescante")
-            ]],
-            [{"name": n, "description": d} for n, d in [
-                ("Cachorro","Amigo leal do homem"),("Gato","Animal doméstico independente"),
-                ("Papagaio","Ave que imita sons")
-            ]],
-            [{"name": n, "description": d} for n, d in [
-                ("Carro","Veículo motorizado"),("Bicicleta","Veículo de duas rodas"),
-                ("Avião","Veículo aéreo")
-            ]]
+            [kb.summary() for kb in kbs.list_bases(scope)] if kbs is not None else []
+            for scope in KB_SCOPES
         ]
-        modes = [AdvancedSelectionDialog.SelectionMode.MULTI_SELECTION]*3
-        titles = ["Pessoal","Compartilhada","Comunidade"]
+        modes = [AdvancedSelectionDialog.SelectionMode.MULTI_SELECTION]*len(KB_SCOPES)
+        titles = KB_SCOPES
         self.kb_source_menu = AdvancedSelectionDialog(lists_data, modes, titles)
         self.kb_source_menu.setWindowTitle("Seleção de Fontes de Conhecimento")
         self.kb_source_menu.actionSelected.connect(
             lambda idx, action, item: logger.info(f"KB action: {action} em {item} na lista {idx}")
         )
+        self.kb_source_menu.itemSelected.connect(self._on_kb_sources_selected)
 
         # botões de cabeçalho extra
         h = QHBoxLayout()
         for icon, tip, cb in [
-            ("fa5s.plus","Criar", lambda: QMessageBox.information(self,"Criar Fonte","Não implementado")),
-            ("fa5s.trash","Excluir",lambda: QMessageBox.information(self,"Excluir Fonte","Não implementado")),
-            ("fa5s.sync","Atualizar",lambda: QMessageBox.information(self,"Atualizar Fonte","Não implementado"))
+            ("fa5s.plus","Criar", self._on_kb_create),
+            ("fa5s.trash","Excluir", self._on_kb_delete),
+            ("fa5s.sync","Atualizar", self._on_kb_refresh)
         ]:
             btn = QPushButton("")
             btn.setIcon(qta.icon(icon, color=COLOR_VARS["accent"]))
@@ -345,13 +583,15 @@ class ChatTab(QWidget):
              {"name":"Gato","description":"..."},{"name":"Papagaio","description":"..."}],
             [{"name":"Carro","description":"..."},{"name":"Bicicleta","description":"..."},{"name":"Avião","description":"..."}]
         ]
-        modes = [AdvancedSelectionDialog.SelectionMode.SINGLE_GLOBAL_SELECTION]
+        # vários agentes marcados: o envio vai a todos em paralelo (fan-out)
+        modes = [AdvancedSelectionDialog.SelectionMode.MULTI_SELECTION]
         titles = ["Padrão","Pessoal","Compartilhada","Comunidade"]
         self.agent_menu = AdvancedSelectionDialog(lists_data, modes, titles)
         self.agent_menu.setWindowTitle("Seleção de Agentes")
         self.agent_menu.actionSelected.connect(
             lambda idx, action, item: logger.info(f"Agent action: {action} em {item} na lista {idx}")
         )
+        self.agent_menu.itemSelected.connect(self._on_agent_selected)
 
         h = QHBoxLayout()
         for icon, tip, cb in [
@@ -367,6 +607,58 @@ class ChatTab(QWidget):
         self.agent_menu.add_header_widget(h)
         self.agent_menu.show()
 
+    def _on_kb_create(self) -> None:
+        """Cria uma base a partir de uma pasta e dispara a indexação em segundo plano."""
+        kbs = self.controller.knowledge_bases
+        if kbs is None:
+            return
+        try:
+            directory = QFileDialog.getExistingDirectory(self, "Pasta de documentos")
+            if not directory:
+                return
+            name, ok = QInputDialog.getText(self, "Criar Fonte", "Nome da base:", text=os.path.basename(directory))
+            if not ok or not name.strip():
+                return
+            kbs.create(name.strip(), [directory])
+            self.controller.refresh_knowledge_bases([name.strip()])
+            self.on_kb_source_action()
+        except ValueError as e:
+            QMessageBox.warning(self, "Criar Fonte", str(e))
+        except Exception as e:
+            logger.error("[ChatTab] erro ao criar base: %s", e, exc_info=True)
+            QMessageBox.warning(self, "Erro", "Falha ao criar a base de conhecimento.")
+
+    def _on_kb_delete(self) -> None:
+        """Exclui as bases marcadas no seletor."""
+        kbs = self.controller.knowledge_bases
+        names = self.controller.kb_sources
+        if kbs is None or not names:
+            QMessageBox.information(self, "Excluir Fonte", "Marque as bases que deseja excluir.")
+            return
+        answer = QMessageBox.question(self, "Excluir Fonte", f"Excluir {', '.join(names)}?")
+        if answer != QMessageBox.Yes:
+            return
+        for name in names:
+            kbs.delete(name)
+            self.controller.forget_kb_source(name)
+        self.on_kb_source_action()
+
+    def _on_kb_refresh(self) -> None:
+        """Reindexa (só o que mudou) as bases marcadas, ou todas se nada estiver marcado."""
+        tickets = self.controller.refresh_knowledge_bases(self.controller.kb_sources or None)
+        logger.info(f"[ChatTab] {len(tickets)} base(s) em atualização")
+
+    def _on_kb_sources_selected(self, idx: int, items: list) -> None:
+        """Guarda as fontes de conhecimento marcadas em cada lista do diálogo."""
+        names = [item.get("name") for item in items]
+        self.controller.select_kb_sources(idx, names)
+        logger.info(f"[ChatTab] fontes selecionadas na lista {idx}: {names}")
+
+    def _on_agent_selected(self, idx: int, items: list) -> None:
+        """Guarda os agentes marcados em cada lista do diálogo."""
+        self.controller.select_agents(idx, [item.get("name") for item in items])
+        logger.info(f"[ChatTab] agentes selecionados: {self.controller.selected_agents}")
+
     def on_conversation_action(self) -> None:
         """Menu de seleção de conversação."""
         if self.conversation_menu:
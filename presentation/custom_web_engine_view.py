@@ -1,6 +1,6 @@
 import logging
 
-from qtpy.QtCore import Signal, Qt, QObject, QThread
+from qtpy.QtCore import Signal, Slot, Qt, QObject, QThread
 from qtpy.QtWebChannel import QWebChannel
 from qtpy.QtWidgets import QMenu, QAction
 
@@ -25,6 +25,14 @@ class HTMLLoaderWorker(QObject):
             html_content = f"<html><body><h1>Erro ao carregar HTML: {e}</h1></body></html>"
         self.finished.emit(html_content)
 
+class ChatBridge(QObject):
+    """Objeto exposto ao JavaScript via QWebChannel (nome "bridge")."""
+    older_history_requested = Signal()
+
+    @Slot()
+    def requestOlderHistory(self):
+        self.older_history_requested.emit()
+
 class CustomWebEngineView(QWebEngineView):
     save_file_signal = Signal(str)
     load_finished_signal = Signal()
@@ -39,6 +47,8 @@ class CustomWebEngineView(QWebEngineView):
         self.setAcceptDrops(False)
 
         self.channel = QWebChannel(self.page())
+        self.bridge = ChatBridge(self)
+        self.channel.registerObject("bridge", self.bridge)
         self.page().setWebChannel(self.channel)
 
     def on_load_finished(self, success):
@@ -26,10 +26,10 @@ class FilePanel(QWidget):
         self.chat_id = chat_id
         self.file_list = QListWidget()
         self.setAcceptDrops(True)
+        # a lista só é lida da sessão na primeira exibição (ver ensure_loaded)
+        self._loaded = False
 
         self._create_ui()
-        self.load_files()
-        self.update_toggle_btn()
 
         self.file_window = QMainWindow()
         self.theme_mgr = ThemeManager(self.file_window)
@@ -85,9 +85,23 @@ class FilePanel(QWidget):
         layout.addLayout(header)
         layout.addWidget(self.file_list)
 
+    def showEvent(self, event) -> None:
+        self.ensure_loaded()
+        super().showEvent(event)
+
+    def ensure_loaded(self) -> None:
+        """
+        Carrega a lista na primeira necessidade (exibição ou leitura dos
+        anexos ativos), para que abas restauradas e nunca abertas não
+        carreguem a sessão inteira na inicialização.
+        """
+        if not self._loaded:
+            self.load_files()
+
     def load_files(self) -> None:
         """Carrega itens da sessão e seus estados para a lista."""
         try:
+            self._loaded = True
             self.file_list.clear()
             for path in self.session.get_files(self.chat_id):
                 try:
@@ -108,6 +122,7 @@ class FilePanel(QWidget):
 
     def _add_file_item(self, path: str, state: bool = True) -> None:
         """Insere um item na lista e salva estado na sessão."""
+        self.ensure_loaded()
         for index in range(self.file_list.count()):
             if self.file_list.item(index).toolTip() == path:
                 return
@@ -1,15 +1,22 @@
 import logging
 
-from qtpy.QtCore import Qt, QTimer, QSize
+from qtpy.QtCore import Qt, QTimer, QSize, Signal
 from qtpy.QtGui import QPainter, QPen, QConicalGradient, QColor, QIcon
 from qtpy.QtWidgets import QPushButton
 
 logger = logging.getLogger("LoadingButton")
 
 class LoadingButton(QPushButton):
+    """
+    Botão com spinner de carregamento. Com `cancellable=True`, continua
+    clicável enquanto carrega: o clique emite `cancelRequested` (e não
+    `clicked`) e um quadrado de "parar" é desenhado no centro do spinner.
+    """
+    cancelRequested = Signal()
+
     def __init__(self, text: str = "", tooltip="", parent=None, icon=None,
                  spinner_size: int = 16, spinner_thickness: int = 2,
-                 colors=("#FF4081", "#7C4DFF")):
+                 colors=("#FF4081", "#7C4DFF"), cancellable: bool = False):
         super().__init__(text, parent)
         self._orig_hint: QSize = super().sizeHint()
         try:
@@ -20,6 +27,8 @@ class LoadingButton(QPushButton):
                 self._default_icon = self.icon()
 
             self.setToolTip(tooltip)
+            self._tooltip = tooltip
+            self._cancellable = cancellable
             self._spinner_size = spinner_size
             self._spinner_thickness = spinner_thickness
             self._colors = colors
@@ -36,18 +45,33 @@ class LoadingButton(QPushButton):
         try:
             if loading:
                 self._loading = True
-                super().setEnabled(False)
+                super().setEnabled(self._cancellable)
+                if self._cancellable:
+                    self.setToolTip("Cancelar")
                 self.setIcon(QIcon())
                 self._timer.start()
             else:
                 self._timer.stop()
                 self._loading = False
                 super().setEnabled(True)
+                self.setToolTip(self._tooltip)
                 self.setIcon(self._default_icon)
                 self.update()
         except Exception as e:
             logger.error(f"[LoadingButton] setLoading failed: {e}", exc_info=True)
 
+    def isLoading(self) -> bool:
+        return self._loading
+
+    def mouseReleaseEvent(self, event):
+        if self._loading and self._cancellable and event.button() == Qt.LeftButton:
+            self.setDown(False)
+            if self.rect().contains(event.pos()):
+                self.cancelRequested.emit()
+            event.accept()
+            return
+        super().mouseReleaseEvent(event)
+
     def _on_timeout(self):
         self._angle = (self._angle + 10) % 360
         self.update()
@@ -74,6 +98,12 @@ class LoadingButton(QPushButton):
                 pen.setCapStyle(Qt.RoundCap)
                 painter.setPen(pen)
                 painter.drawArc(x, y, size, size, 1 * 16, 320 * 16)
+
+                if self._cancellable:
+                    stop = max(4, size // 3)
+                    painter.setPen(Qt.NoPen)
+                    painter.setBrush(QColor(self._colors[0]))
+                    painter.drawRect((w - stop) // 2, (h - stop) // 2, stop, stop)
         except Exception as e:
             logger.error(f"[LoadingButton] paintEvent error: {e}", exc_info=True)
 
@@ -14,8 +14,12 @@ from qtpy.QtWidgets import (
 from qtpy.QtCore import Qt, QTimer, Signal, QObject
 from qtpy.QtGui import QColor, QBrush, QCursor
 import qtawesome as qta
+from core.service.telemetry import FIELDS, PERCENTILES, aggregate, format_value, get_telemetry
 from utils.utilities import get_style_sheet, COLOR_VARS, logger
 
+# Intervalo (ms) de atualização do painel de telemetria.
+TELEMETRY_REFRESH_MS = 2000
+
 
 class LogEntry:
     """Classe simples para armazenar logs lidos do arquivo."""
@@ -248,10 +252,98 @@ class LiveLogPage(LogPage):
         self.rate_label.setText(f"Logs/s: {count}")
 
 
+class TelemetryPage(QWidget):
+    """Percentis de latência dos envios à IA: do processo atual ou de um chat gravado."""
+    def __init__(self, session_service=None):
+        super().__init__()
+        self.session_service = session_service
+        self._init_ui()
+        self._load_chats()
+        self.refresh()
+        self._timer = QTimer(self)
+        self._timer.timeout.connect(self.refresh)
+        self._timer.start(TELEMETRY_REFRESH_MS)
+
+    def _init_ui(self):
+        layout = QVBoxLayout(self)
+
+        top = QHBoxLayout()
+        self.chat_combo = QComboBox()
+        self.chat_combo.currentIndexChanged.connect(self.refresh)
+        top.addWidget(QLabel("Origem:"))
+        top.addWidget(self.chat_combo)
+        self.reload_button = QPushButton("Atualizar")
+        self.reload_button.setIcon(qta.icon("fa5s.sync", color=COLOR_VARS["accent"]))
+        self.reload_button.clicked.connect(self._reload)
+        top.addWidget(self.reload_button)
+        self.states_label = QLabel("")
+        self.states_label.setStyleSheet(f"color: {COLOR_VARS['text']};")
+        top.addWidget(self.states_label)
+        top.addStretch()
+        layout.addLayout(top)
+
+        headers = ["Métrica"] + [f"p{pct}" for pct in PERCENTILES] + ["Média", "Máx", "N"]
+        self.table = QTableWidget(len(FIELDS), len(headers))
+        self.table.setHorizontalHeaderLabels(headers)
+        self.table.verticalHeader().setVisible(False)
+        self.table.setAlternatingRowColors(True)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        for row, (_, label, _) in enumerate(FIELDS):
+            self.table.setItem(row, 0, QTableWidgetItem(label))
+        layout.addWidget(self.table)
+
+    def _load_chats(self):
+        """Primeira opção: envios deste processo; depois, os chats gravados."""
+        self.chat_combo.blockSignals(True)
+        current = self.chat_combo.currentData()
+        self.chat_combo.clear()
+        self.chat_combo.addItem("Todos os chats (desde a abertura)", None)
+        if self.session_service is not None:
+            try:
+                for summary in self.session_service.list_chat_summaries():
+                    chat_id = summary["chat_id"]
+                    self.chat_combo.addItem(summary.get("title") or chat_id, chat_id)
+            except Exception as e:
+                logger.error(f"[TelemetryPage] falha ao listar chats: {e}", exc_info=True)
+        index = self.chat_combo.findData(current)
+        self.chat_combo.setCurrentIndex(max(0, index))
+        self.chat_combo.blockSignals(False)
+
+    def _reload(self):
+        self._load_chats()
+        self.refresh()
+
+    def _records(self):
+        chat_id = self.chat_combo.currentData()
+        if chat_id is None or self.session_service is None:
+            return get_telemetry().recent()
+        return self.session_service.get_metrics(chat_id)
+
+    def refresh(self):
+        try:
+            summaries, states = aggregate(self._records())
+        except Exception as e:
+            logger.error(f"[TelemetryPage] falha ao agregar telemetria: {e}", exc_info=True)
+            return
+        total = sum(states.values())
+        self.states_label.setText(
+            f"{total} envio(s): " + " ".join(f"{state}={count}" for state, count in sorted(states.items()))
+        )
+        for row, (name, _, unit) in enumerate(FIELDS):
+            summary = summaries[name]
+            values = [summary.percentiles[pct] for pct in PERCENTILES] + [summary.mean, summary.max]
+            cells = [format_value(value, unit) if summary.count else "-" for value in values]
+            cells.append(str(summary.count))
+            for col, text in enumerate(cells, start=1):
+                self.table.setItem(row, col, QTableWidgetItem(text))
+
+
 class LogViewerDialog(QDialog):
     """Diálogo principal com abas para múltiplos arquivos e logs ao vivo."""
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, session_service=None):
         super().__init__(parent)
+        self.session_service = session_service
         flags = self.windowFlags()
         flags |= Qt.WindowMinimizeButtonHint | Qt.WindowMaximizeButtonHint
         self.setWindowFlags(flags)
@@ -273,6 +365,7 @@ class LogViewerDialog(QDialog):
         self.tabs.tabCloseRequested.connect(self._close_tab)
         self.layout.addWidget(self.tabs)
         self.add_live_tab()
+        self.tabs.addTab(TelemetryPage(self.session_service), "Telemetria")
         default_path = os.path.join(os.getcwd(), "logs", "app.log")
         self.add_log_tab("app.log", default_path)
 
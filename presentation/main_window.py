@@ -5,7 +5,11 @@ from qtpy.QtWidgets import (
     QMainWindow, QTabWidget, QMenu, QInputDialog, QMessageBox, QToolButton
 )
 
+from core.service.ai_service import AIService
+from core.service.knowledge_base import KnowledgeBaseService
+from core.service.response_cache import ResponseCache
 from core.service.session_service import SessionService
+from core.workers.request_scheduler import RequestScheduler
 from presentation.chat_tab import ChatTab
 from presentation.log_viewer import LogViewerDialog
 from utils.utilities import COLOR_VARS
@@ -24,6 +28,7 @@ class MainWindow(QMainWindow):
             self.tabs = QTabWidget()
             self.tabs.setTabsClosable(True)
             self.tabs.tabCloseRequested.connect(self.close_tab)
+            self.tabs.currentChanged.connect(self.on_current_tab_changed)
             self.tabs.tabBar().installEventFilter(self)
 
             self.logs_button = QToolButton()
@@ -37,24 +42,45 @@ class MainWindow(QMainWindow):
             self.setCentralWidget(self.tabs)
 
             self.session_service = SessionService()
-            chats = self.session_service.list_chats()
+            self.ai_service = AIService.from_env(
+                response_cache=ResponseCache(),
+                knowledge_bases=KnowledgeBaseService(),
+            )
+            self.scheduler = RequestScheduler()
+            chats = self.session_service.list_chat_summaries()
 
             if not chats:
                 self.new_chat()
             else:
-                for idx, chat_id in enumerate(chats, start=1):
-                    saved = self.session_service.get_chat_title(chat_id)
+                for idx, summary in enumerate(chats, start=1):
+                    chat_id = summary["chat_id"]
+                    saved = summary.get("title")
                     title = saved if saved else f"Chat {idx}"
                     logger.info(f"[MainWindow] restaurando sessão {chat_id} como '{title}'")
-                    tab = ChatTab(chat_id, self.session_service)
+                    tab = ChatTab(chat_id, self.session_service, self.ai_service, self.scheduler)
                     self.tabs.addTab(tab, title)
         except Exception as e:
             logger.error(f"[MainWindow] erro ao inicializar UI: {e}", exc_info=True)
 
+    def shutdown(self):
+        """Descarrega as sessões pendentes antes de encerrar a aplicação."""
+        try:
+            self.scheduler.shutdown(wait=False)
+            self.session_service.close()
+            self.ai_service.close()
+            logger.info("[MainWindow] sessões gravadas no encerramento")
+        except Exception as e:
+            logger.error(f"[MainWindow] erro ao encerrar sessões: {e}", exc_info=True)
+
+    def on_current_tab_changed(self, index):
+        """Dá prioridade no scheduler às requisições da aba visível."""
+        widget = self.tabs.widget(index)
+        self.scheduler.set_visible_owner(getattr(widget, 'chat_id', None))
+
     def show_logs(self):
         """Abre o diálogo de visualização de logs com abas."""
         try:
-            self.log_viewer = LogViewerDialog()
+            self.log_viewer = LogViewerDialog(session_service=self.session_service)
             self.log_viewer.show()
         except Exception as e:
             logger.error(f"[MainWindow] erro ao abrir Visualizador de Logs: {e}", exc_info=True)
@@ -63,6 +89,8 @@ class MainWindow(QMainWindow):
         """Fecha a aba no índice especificado e remove sessão."""
         try:
             widget = self.tabs.widget(index)
+            if hasattr(widget, 'shutdown'):
+                widget.shutdown()
             chat_id = getattr(widget, 'chat_id', None)
             if chat_id:
                 try:
@@ -85,7 +113,7 @@ class MainWindow(QMainWindow):
             title = f"Chat {count}"
             self.session_service.rename_chat(chat_id, title)
 
-            tab = ChatTab(chat_id, self.session_service)
+            tab = ChatTab(chat_id, self.session_service, self.ai_service, self.scheduler)
             self.tabs.addTab(tab, title)
             self.tabs.setCurrentWidget(tab)
         except Exception as e:
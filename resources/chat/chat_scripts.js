@@ -1,3 +1,15 @@
+// Distância (px) do topo que dispara o carregamento da página anterior.
+const HISTORY_SCROLL_THRESHOLD = 80;
+
+let bridge = null;
+let hasMoreHistory = false;
+let loadingOlderHistory = false;
+
+// Mensagens em streaming, por id: {messageDiv, contentDiv, pending, frame}.
+const streams = {};
+// Bolhas de fan-out (vários agentes), por id do grupo.
+const agentGroups = {};
+
 document.addEventListener("DOMContentLoaded", () => {
     const scrollToBottomBtn = document.getElementById("scroll-to-bottom-btn");
     scrollToBottomBtn.addEventListener("click", () => {
@@ -9,17 +21,74 @@ document.addEventListener("DOMContentLoaded", () => {
         }
     });
 
+    if (typeof QWebChannel !== "undefined" && typeof qt !== "undefined") {
+        new QWebChannel(qt.webChannelTransport, channel => {
+            bridge = channel.objects.bridge;
+            onHistoryScroll();
+        });
+    }
+
+    window.addEventListener("scroll", onHistoryScroll, { passive: true });
 
     updateButtonVisibility();
 });
 
+function scrollingElement() {
+    return document.scrollingElement || document.documentElement;
+}
+
+function updateButtonVisibility() {
+    const btn = document.getElementById("scroll-to-bottom-btn");
+    if (!btn) {
+        return;
+    }
+    const el = scrollingElement();
+    const distance = el.scrollHeight - el.scrollTop - el.clientHeight;
+    btn.style.display = distance > 100 ? "flex" : "none";
+}
+
+function onHistoryScroll() {
+    updateButtonVisibility();
+    if (!hasMoreHistory || loadingOlderHistory || !bridge) {
+        return;
+    }
+    if (scrollingElement().scrollTop <= HISTORY_SCROLL_THRESHOLD) {
+        loadingOlderHistory = true;
+        bridge.requestOlderHistory();
+    }
+}
+
+function setHasMoreHistory(hasMore) {
+    hasMoreHistory = hasMore;
+    loadingOlderHistory = false;
+    // página que não preenche a tela não gera scroll: busca a anterior já
+    requestAnimationFrame(onHistoryScroll);
+}
+
+/**
+ * Insere uma página de mensagens antigas no topo, preservando a posição
+ * de leitura atual. `messages` é uma lista de {text, isUser}.
+ */
+function prependMessages(messages, hasMore) {
+    const messagesDiv = document.getElementById("messages");
+    const el = scrollingElement();
+    const previousHeight = el.scrollHeight;
+
+    const fragment = document.createDocumentFragment();
+    messages.forEach(msg => fragment.appendChild(buildMessage(msg.text, msg.isUser, msg.files)));
+    messagesDiv.insertBefore(fragment, messagesDiv.firstChild);
+
+    el.scrollTop += el.scrollHeight - previousHeight;
+    setHasMoreHistory(hasMore);
+    updateButtonVisibility();
+}
+
 function clearPage() {
     const messagesDiv = document.getElementById("messages");
     messagesDiv.innerHTML = "";
 }
 
-function addMessage(message, isUser = false, files) {
-    const messagesDiv = document.getElementById("messages");
+function buildMessage(message, isUser = false, files) {
     const messageDiv = document.createElement("div");
     messageDiv.className = isUser ? "user-message" : "ai-message";
 
@@ -74,8 +143,153 @@ function addMessage(message, isUser = false, files) {
         messageDivContent.appendChild(fileListDiv);
         messageDivContent.appendChild(fileContentDiv);
     }
+    return messageDiv;
+}
+
+function addMessage(message, isUser = false, files) {
+    const messagesDiv = document.getElementById("messages");
+    const messageDiv = buildMessage(message, isUser, files);
+    messagesDiv.appendChild(messageDiv);
+    messageDiv.scrollIntoView({ block: "end" });
+    updateButtonVisibility();
+}
+
+/**
+ * Acrescenta uma lista de mensagens ({text, isUser, files}) de uma vez:
+ * uma única inserção no DOM, um único scroll e um único layout.
+ */
+function addMessages(messages) {
+    if (!messages || messages.length === 0) {
+        return;
+    }
+    const messagesDiv = document.getElementById("messages");
+    const fragment = document.createDocumentFragment();
+    messages.forEach(msg => fragment.appendChild(buildMessage(msg.text, msg.isUser, msg.files)));
+    const lastMessage = fragment.lastChild;
+    messagesDiv.appendChild(fragment);
+    lastMessage.scrollIntoView({ block: "end" });
+    updateButtonVisibility();
+}
+
+function isNearBottom() {
+    const el = scrollingElement();
+    return el.scrollHeight - el.scrollTop - el.clientHeight < 100;
+}
+
+/** Cria a bolha de uma resposta em andamento. */
+function beginStreamMessage(streamId) {
+    const messagesDiv = document.getElementById("messages");
+    const messageDiv = buildMessage("", false, []);
+    messageDiv.classList.add("streaming");
     messagesDiv.appendChild(messageDiv);
-    messagesDiv.scrollTop = messageDiv.scrollHeight;
+    streams[streamId] = {
+        messageDiv: messageDiv,
+        contentDiv: messageDiv.querySelector(".message-content"),
+        pending: "",
+        frame: null
+    };
+    messageDiv.scrollIntoView({ block: "end" });
+    updateButtonVisibility();
+}
+
+/** Acrescenta à bolha do grupo uma sub-bolha em streaming, registrada em `streams[streamId]`. */
+function addAgentAnswer(groupDiv, streamId, title, extraClass) {
+    const answerDiv = document.createElement("div");
+    answerDiv.className = "agent-answer streaming" + (extraClass ? " " + extraClass : "");
+    const nameDiv = document.createElement("div");
+    nameDiv.className = "agent-name";
+    nameDiv.innerText = title;
+    const contentDiv = document.createElement("div");
+    contentDiv.className = "agent-content";
+    answerDiv.appendChild(nameDiv);
+    answerDiv.appendChild(contentDiv);
+    groupDiv.appendChild(answerDiv);
+    streams[streamId] = {
+        messageDiv: answerDiv,
+        contentDiv: contentDiv,
+        pending: "",
+        frame: null
+    };
+}
+
+/**
+ * Cria a bolha de um fan-out: uma sub-bolha por agente, com stream
+ * `groupId + ":" + agente` (alimentada por appendStreamChunk/endStreamMessage).
+ */
+function beginAgentGroup(groupId, agents) {
+    const messagesDiv = document.getElementById("messages");
+    const messageDiv = buildMessage("", false, []);
+    const groupDiv = document.createElement("div");
+    groupDiv.className = "agent-group";
+    messageDiv.querySelector(".message-content").appendChild(groupDiv);
+    agents.forEach(agent => addAgentAnswer(groupDiv, groupId + ":" + agent, agent));
+    agentGroups[groupId] = groupDiv;
+    messagesDiv.appendChild(messageDiv);
+    messageDiv.scrollIntoView({ block: "end" });
+    updateButtonVisibility();
+}
+
+/** Sub-bolha da resposta combinada do grupo (stream `groupId + ":merge"`). */
+function beginMergeStream(groupId, title) {
+    const groupDiv = agentGroups[groupId];
+    if (!groupDiv) {
+        beginStreamMessage(groupId + ":merge");
+        return;
+    }
+    addAgentAnswer(groupDiv, groupId + ":merge", title, "agent-merged");
+    delete agentGroups[groupId];
+}
+
+/**
+ * Acumula um delta; o DOM é atualizado no máximo uma vez por frame,
+ * não importa quantos deltas cheguem nesse intervalo.
+ */
+function appendStreamChunk(streamId, delta) {
+    const stream = streams[streamId];
+    if (!stream) {
+        return;
+    }
+    stream.pending += delta;
+    if (stream.frame === null) {
+        stream.frame = requestAnimationFrame(() => flushStream(streamId));
+    }
+}
+
+function flushStream(streamId) {
+    const stream = streams[streamId];
+    if (!stream) {
+        return;
+    }
+    stream.frame = null;
+    if (!stream.pending) {
+        return;
+    }
+    const stick = isNearBottom();
+    stream.contentDiv.appendChild(document.createTextNode(stream.pending));
+    stream.pending = "";
+    if (stick) {
+        stream.messageDiv.scrollIntoView({ block: "end" });
+    }
+    updateButtonVisibility();
+}
+
+/** Finaliza a bolha com o texto completo, renderizado como nas demais mensagens. */
+function endStreamMessage(streamId, finalText) {
+    const stream = streams[streamId];
+    if (!stream) {
+        addMessage(finalText, false, []);
+        return;
+    }
+    if (stream.frame !== null) {
+        cancelAnimationFrame(stream.frame);
+    }
+    const stick = isNearBottom();
+    stream.contentDiv.innerHTML = finalText;
+    stream.messageDiv.classList.remove("streaming");
+    delete streams[streamId];
+    if (stick) {
+        stream.messageDiv.scrollIntoView({ block: "end" });
+    }
     updateButtonVisibility();
 }
 
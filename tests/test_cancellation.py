@@ -0,0 +1,49 @@
+import threading
+import time
+
+import pytest
+
+from core.workers.cancellation import CancellationToken, DeadlineExceeded
+
+
+def test_deadlines_share_one_thread():
+    before = threading.active_count()
+    tokens = [CancellationToken(timeout=30) for _ in range(200)]
+    assert threading.active_count() <= before + 1
+    for token in tokens:
+        token.close()
+
+
+def test_deadline_fires_callbacks_without_polling():
+    fired = threading.Event()
+    token = CancellationToken(timeout=0.05)
+    token.on_cancel(fired.set)
+    assert fired.wait(2)
+    assert token.expired
+    with pytest.raises(DeadlineExceeded):
+        token.raise_if_cancelled()
+
+
+def test_wait_returns_at_deadline():
+    token = CancellationToken(timeout=0.1)
+    started = time.monotonic()
+    assert token.wait(5)
+    assert time.monotonic() - started < 1
+
+
+def test_closed_token_does_not_expire():
+    fired = threading.Event()
+    token = CancellationToken(timeout=0.05)
+    token.on_cancel(fired.set)
+    token.close()
+    assert not fired.wait(0.2)
+    assert not token.cancelled
+
+
+def test_unregistered_callback_is_not_called():
+    fired = threading.Event()
+    token = CancellationToken()
+    unregister = token.on_cancel(fired.set)
+    unregister()
+    token.cancel()
+    assert not fired.is_set()
@@ -0,0 +1,93 @@
+import threading
+
+import pytest
+
+from core.controller.chat_controller import ChatController, ChatRequest
+from core.service.ai_service import AIService, MockProvider
+from core.service.mock_backend import MockProfile
+from core.service.session_service import SessionService
+from core.workers.request_scheduler import RequestScheduler
+
+
+class CountingProvider(MockProvider):
+    """MockProvider que conta as chamadas upstream."""
+
+    def __init__(self, profile):
+        super().__init__(profile)
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def stream(self, request):
+        with self._lock:
+            self.calls += 1
+        yield from super().stream(request)
+
+
+@pytest.fixture
+def controller(tmp_path):
+    session = SessionService(storage_path=str(tmp_path))
+    provider = CountingProvider(MockProfile(ttft=0.2))
+    scheduler = RequestScheduler(max_workers=2)
+    controller = ChatController(session.create_chat(), session, AIService([provider]), scheduler)
+    yield controller, provider
+    scheduler.shutdown(wait=False)
+    session.close()
+
+
+def test_repeated_send_is_not_dropped(controller):
+    controller, provider = controller
+    first = controller.send("explique o módulo", files=[])
+    second = controller.send("explique o módulo", files=[])
+
+    assert second is not first
+    assert first.wait(10) and second.wait(10)
+    assert first.state == second.state == ChatRequest.DONE
+    assert provider.calls == 2
+    history = controller.session.load_history(controller.chat_id)
+    assert sum(entry.startswith("Você: ") for entry in history) == 2
+    assert sum(entry.startswith("AI: ") for entry in history) == 2
+
+
+def test_send_after_reply_calls_the_provider_again(controller):
+    controller, provider = controller
+    controller.send("explique o módulo", files=[]).wait(10)
+    controller.send("explique o módulo", files=[]).wait(10)
+
+    assert provider.calls == 2
+
+
+def test_joined_send_records_same_bytes_as_leader(tmp_path):
+    session = SessionService(storage_path=str(tmp_path))
+    provider = CountingProvider(MockProfile(ttft=0.2))
+    scheduler = RequestScheduler(max_workers=2)
+    ai = AIService([provider])
+    try:
+        first = ChatController(session.create_chat(), session, ai, scheduler)
+        second = ChatController(session.create_chat(), session, ai, scheduler)
+        a = first.send("explique o módulo", files=[])
+        b = second.send("explique o módulo", files=[])
+        assert a.wait(10) and b.wait(10)
+
+        assert provider.calls == 1
+        leader, follower = a.request.metrics, b.request.metrics
+        assert leader.bytes_out > len("explique o módulo")
+        assert (follower.bytes_out, follower.bytes_in) == (leader.bytes_out, leader.bytes_in)
+        assert leader.bytes_in > 0
+    finally:
+        scheduler.shutdown(wait=False)
+        session.close()
+
+
+def test_fan_out_bypasses_cache_for_every_agent(controller):
+    controller, _ = controller
+    controller.bypass_cache_once = True
+    fan_out = controller.fan_out("explique o módulo", agents=["prefetch", "merge", "revisor"], files=[],
+                                 merge=False)
+    for handle in fan_out.handles.values():
+        handle.wait(10)
+
+    assert all(handle.request.bypass_cache for handle in fan_out.handles.values())
+    assert controller.bypass_cache_once is False
+    owners = {handle.ticket.owner for handle in fan_out.handles.values()}
+    assert len(owners) == 3
+    assert (controller.chat_id, "prefetch") not in owners
@@ -0,0 +1,47 @@
+import core.service.context_builder as context_builder
+from core.service.context_builder import ContextBuilder
+from infra.file_cache import FileSnapshotCache
+
+
+def _builder(**kwargs):
+    return ContextBuilder(file_cache=FileSnapshotCache(), **kwargs)
+
+
+def test_large_files_with_the_same_prefix_are_not_duplicates(tmp_path, monkeypatch):
+    monkeypatch.setattr(context_builder, "MAX_FILE_BYTES", 64)
+    prefix = "x = 1\n" * 20
+    (tmp_path / "a.py").write_text(prefix + "a = 'fim a'\n")
+    (tmp_path / "b.py").write_text(prefix + "b = 'fim b'\n")
+
+    context = _builder().build([str(tmp_path / "a.py"), str(tmp_path / "b.py")])
+    assert context.report.duplicates == []
+    assert context.report.included == [str(tmp_path / "a.py"), str(tmp_path / "b.py")]
+    assert len({f.sha256 for f in context.files}) == 2
+
+
+def test_binary_and_duplicate_attachments_are_skipped(tmp_path):
+    (tmp_path / "a.py").write_text("print('oi')\n")
+    (tmp_path / "copia.py").write_text("print('oi')\n")
+    (tmp_path / "imagem.png").write_bytes(b"\x89PNG\r\n\x1a\n\x00\x00\x00")
+
+    context = _builder().build([str(tmp_path)])
+    assert context.report.included == [str(tmp_path / "a.py")]
+    assert context.report.duplicates == [str(tmp_path / "copia.py")]
+    assert context.report.binary == [str(tmp_path / "imagem.png")]
+
+
+def test_budget_truncates_first_overflow_and_omits_the_rest(tmp_path):
+    (tmp_path / "a.py").write_text("a = 1\n")
+    (tmp_path / "b.py").write_text("".join(f"valor_{i} = {i}\n" for i in range(2000)))
+    (tmp_path / "c.py").write_text("c = 3\n")
+
+    builder = _builder(token_budget=500)
+    context = builder.build([str(tmp_path)])
+    report = context.report
+    assert report.included == [str(tmp_path / "a.py"), str(tmp_path / "b.py")]
+    assert report.truncated == [str(tmp_path / "b.py")]
+    assert report.omitted == [str(tmp_path / "c.py")]
+    assert report.tokens <= 500
+    truncated = context.files[1]
+    assert truncated.truncated and truncated.text.endswith("\n")
+    assert truncated.tokens == builder.counter.count(truncated.text)
@@ -0,0 +1,55 @@
+from core.service.context_builder import BuiltContext, ContextFile, ContextReport
+from core.service.context_delta import UNCHANGED_FILE, ContextDelta
+from core.service.session_service import SessionService
+
+SOURCE = "".join(f"def funcao_{i}(x):\n    return x * {i} + {i % 7}\n\n" for i in range(300))
+
+
+def _context(text):
+    return BuiltContext([ContextFile("modulo.py", "sha", text, 0)], ContextReport(32_000))
+
+
+def test_unchanged_attachment_is_sent_once(tmp_path):
+    session = SessionService(storage_path=str(tmp_path))
+    try:
+        chat_id = session.create_chat()
+        delta = ContextDelta(session)
+        first = delta.apply(chat_id, 0, _context(SOURCE))
+        second = delta.apply(chat_id, 2, _context(SOURCE))
+
+        assert first.referenced == 0 and SOURCE in first.text
+        assert second.sent == 0 and second.referenced == first.sent
+        assert second.text == f"### modulo.py — {UNCHANGED_FILE}"
+    finally:
+        session.close()
+
+
+def test_only_edited_blocks_are_resent(tmp_path):
+    session = SessionService(storage_path=str(tmp_path))
+    try:
+        chat_id = session.create_chat()
+        delta = ContextDelta(session)
+        first = delta.apply(chat_id, 0, _context(SOURCE))
+        edited = SOURCE.replace("return x * 150 + 3", "return x * 150 - 3")
+        second = delta.apply(chat_id, 2, _context(edited))
+
+        assert 1 <= second.sent < first.sent
+        assert second.sent + second.referenced >= first.sent
+        assert "return x * 150 - 3" in second.text
+        assert "return x * 10 + 3" not in second.text
+        assert "inalteradas, já enviadas nesta conversa]" in second.text
+    finally:
+        session.close()
+
+
+def test_blocks_before_the_summary_cut_are_sent_again(tmp_path):
+    session = SessionService(storage_path=str(tmp_path))
+    try:
+        chat_id = session.create_chat()
+        delta = ContextDelta(session)
+        first = delta.apply(chat_id, 0, _context(SOURCE))
+        again = delta.apply(chat_id, 20, _context(SOURCE), since=16)
+
+        assert again.referenced == 0 and again.sent == first.sent
+    finally:
+        session.close()
@@ -0,0 +1,52 @@
+from core.service.history_compactor import HistoryCompactor
+from core.service.session_service import SessionService
+
+
+def _session(tmp_path, count):
+    session = SessionService(storage_path=str(tmp_path), flush_delay=60)
+    chat_id = session.create_chat()
+    for i in range(count):
+        session.save_message(chat_id, f"Você: mensagem {i}." if i % 2 == 0 else f"AI: resposta {i}.")
+    return session, chat_id
+
+
+def test_recent_messages_stay_whole_until_a_block_folds(tmp_path):
+    session, chat_id = _session(tmp_path, 10)
+    compactor = HistoryCompactor(session, keep_recent=4, block=4)
+    history = compactor.compact(chat_id)
+    assert history.folded == 4
+    assert len(history.messages) == 6
+    assert history.messages[0] == {"role": "user", "content": "mensagem 4."}
+    assert "mensagem 0." in history.summary
+    session.close()
+
+
+def test_summary_rolls_over_by_blocks(tmp_path):
+    session, chat_id = _session(tmp_path, 10)
+    calls = []
+
+    def summarize(previous, entries):
+        calls.append(len(entries))
+        return (previous + "\n" if previous else "") + "|".join(entries)
+
+    compactor = HistoryCompactor(session, keep_recent=4, block=4, summarize=summarize)
+    compactor.compact(chat_id)
+    compactor.compact(chat_id)
+    assert calls == [4]
+
+    for i in range(10, 14):
+        session.save_message(chat_id, f"Você: mensagem {i}.")
+    history = compactor.compact(chat_id)
+    assert calls == [4, 4]
+    assert history.folded == 8
+    assert session.get_summary(chat_id)["upto"] == 8
+    assert history.summary.splitlines()[1].startswith("Você: mensagem 4.")
+    session.close()
+
+
+def test_upto_ignores_later_messages(tmp_path):
+    session, chat_id = _session(tmp_path, 10)
+    history = HistoryCompactor(session, keep_recent=4, block=4).compact(chat_id, upto=6)
+    assert history.folded == 0
+    assert [m["content"] for m in history.messages][-1] == "resposta 5."
+    session.close()
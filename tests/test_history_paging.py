@@ -0,0 +1,71 @@
+import pytest
+
+from core.service.session_service import SessionService
+from infra.storage import JsonJournalStorage, SqliteStorage
+
+
+@pytest.fixture(params=[JsonJournalStorage, SqliteStorage])
+def storage_factory(request, tmp_path):
+    return lambda: request.param(str(tmp_path))
+
+
+def _fill(storage_factory, count):
+    session = SessionService(storage=storage_factory())
+    chat_id = session.create_chat()
+    for i in range(count):
+        session.save_message(chat_id, f"Você: {i}")
+    session.close()
+    return chat_id
+
+
+def test_page_is_read_without_loading_the_session(storage_factory, monkeypatch):
+    chat_id = _fill(storage_factory, 10)
+    storage = storage_factory()
+    session = SessionService(storage=storage)
+    if isinstance(storage, SqliteStorage):
+        monkeypatch.setattr(storage, "load", lambda chat_id: pytest.fail("sessão inteira carregada"))
+
+    assert session.history_count(chat_id) == 10
+    assert session.load_history(chat_id, limit=3) == ["Você: 7", "Você: 8", "Você: 9"]
+    assert session.load_history(chat_id, before=7, limit=3) == ["Você: 4", "Você: 5", "Você: 6"]
+    assert session.load_history(chat_id, before=2, limit=5) == ["Você: 0", "Você: 1"]
+    assert session.load_history(chat_id, before=0, limit=5) == []
+    storage.close()
+
+
+def test_cached_session_includes_pending_messages(storage_factory):
+    chat_id = _fill(storage_factory, 3)
+    session = SessionService(storage=storage_factory(), flush_delay=60)
+    session.save_message(chat_id, "AI: novo")
+    assert session.history_count(chat_id) == 4
+    assert session.load_history(chat_id, limit=2) == ["Você: 2", "AI: novo"]
+    session.close()
+
+
+def test_send_path_does_not_load_the_session(storage_factory, monkeypatch):
+    chat_id = _fill(storage_factory, 5)
+    storage = storage_factory()
+    session = SessionService(storage=storage, flush_delay=60)
+    # o journal JSON só pagina lendo a sessão; o índice vem do manifesto
+    if isinstance(storage, SqliteStorage):
+        monkeypatch.setattr(storage, "load", lambda chat_id: pytest.fail("sessão inteira carregada"))
+
+    assert session.save_message(chat_id, "Você: 5") == 5
+    assert session.save_message(chat_id, "AI: 6") == 6
+    assert session.history_count(chat_id) == 7
+    assert session.load_history(chat_id, before=7, limit=3) == ["Você: 4", "Você: 5", "AI: 6"]
+    assert session.load_history(chat_id, before=6, limit=1) == ["Você: 5"]
+    session.flush()
+    assert session.load_history(chat_id, limit=2) == ["Você: 5", "AI: 6"]
+    monkeypatch.undo()
+    session.close()
+
+
+def test_loading_a_session_applies_pending_records(storage_factory):
+    chat_id = _fill(storage_factory, 2)
+    session = SessionService(storage=storage_factory(), flush_delay=60)
+    session.save_message(chat_id, "AI: pendente")
+    session.add_file(chat_id, "a.py")
+    assert session.get_files(chat_id) == ["a.py"]
+    assert session.load_history(chat_id) == ["Você: 0", "Você: 1", "AI: pendente"]
+    session.close()
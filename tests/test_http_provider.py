@@ -0,0 +1,37 @@
+import threading
+
+import pytest
+
+from core.service.ai_service import AIRequest, HttpProvider
+from core.service.mock_backend import MockBackend, MockProfile
+from core.workers.cancellation import CancellationToken
+from tools.fake_ai_server import serve
+
+
+PROFILE = MockProfile(tokens_per_second=40)
+
+
+@pytest.fixture
+def server():
+    server = serve(port=0, profile=PROFILE)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_cancelling_a_finished_request_does_not_touch_the_reused_connection(server):
+    provider = HttpProvider(server)
+    first = CancellationToken()
+    assert provider.complete(AIRequest("primeira requisição", token=first))
+
+    prompt = " ".join(f"palavra{i}" for i in range(30))
+    second = provider.stream(AIRequest(prompt, token=CancellationToken()))
+    parts = [next(second)]
+    assert provider.pool.reused == 1
+    first.cancel()
+    parts.extend(second)
+
+    # socket fechado no meio do stream pareceria um fim normal, só que truncado
+    assert "".join(parts) == "".join(MockBackend(PROFILE).plan(prompt).tokens)
+    provider.close()
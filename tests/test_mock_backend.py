@@ -0,0 +1,26 @@
+from core.service.mock_backend import MockBackend, MockProfile
+
+PROFILE = dict(mean_tokens=40, ttft=0.5, ttft_jitter=0.5, error_rate=0.3)
+
+
+def _signature(plan):
+    return plan.ttft, plan.tokens, plan.error_status
+
+
+def test_same_seed_gives_same_plans_regardless_of_arrival_order():
+    prompts = [f"pergunta {i}" for i in range(10)]
+    a, b = MockBackend(MockProfile(seed=7, **PROFILE)), MockBackend(MockProfile(seed=7, **PROFILE))
+    first = {prompt: _signature(a.plan(prompt)) for prompt in prompts}
+    second = {prompt: _signature(b.plan(prompt)) for prompt in reversed(prompts)}
+
+    assert first == second
+
+
+def test_repeated_prompt_and_other_seed_give_new_plans():
+    backend = MockBackend(MockProfile(seed=7, **PROFILE))
+    first = [_signature(backend.plan("pergunta")) for _ in range(3)]
+    other = [_signature(MockBackend(MockProfile(seed=8, **PROFILE)).plan("pergunta"))]
+
+    assert len({repr(s) for s in first + other}) == 4
+    replay = MockBackend(MockProfile(seed=7, **PROFILE))
+    assert [_signature(replay.plan("pergunta")) for _ in range(3)] == first
@@ -0,0 +1,35 @@
+from core.service.ai_service import AIRequest
+from core.service.context_builder import BuiltContext, ContextFile, ContextReport
+from core.service.prompt_builder import PromptBuilder
+
+
+def _request(prompt, files, **kwargs):
+    context = BuiltContext(files, ContextReport(32_000))
+    return AIRequest(prompt=prompt, context=context, chat_id="chat", **kwargs)
+
+
+def _files(*paths):
+    return [ContextFile(path, path, f"conteúdo de {path}\n", 0) for path in paths]
+
+
+def test_layout_goes_from_most_to_least_stable():
+    history = [{"role": "user", "content": "oi"}, {"role": "assistant", "content": "olá"}]
+    messages = PromptBuilder.layout(_request("nova pergunta", _files("a.py"), agent="revisor",
+                                             summary="- Usuário: começo", history=history))
+
+    assert [m["role"] for m in messages] == ["system", "system", "user", "assistant", "user", "user"]
+    assert "revisor" in messages[0]["content"]
+    assert messages[1]["content"].endswith("- Usuário: começo")
+    assert messages[2:4] == history
+    assert "a.py" in messages[4]["content"]
+    assert messages[5]["content"] == "nova pergunta"
+
+
+def test_attachment_order_does_not_change_the_prefix():
+    builder = PromptBuilder()
+    first = builder.build(_request("primeira", _files("b.py", "a.py")))
+    second = builder.build(_request("segunda", _files("a.py", "b.py")))
+
+    assert first.messages[:-1] == second.messages[:-1]
+    assert second.prefix_tokens == second.tokens - builder.counter.count("segunda")
+    assert builder.stats("chat").prefix_tokens == second.prefix_tokens
@@ -0,0 +1,60 @@
+import threading
+
+from core.workers.request_scheduler import RequestScheduler
+
+
+def _blocked_scheduler():
+    """Scheduler de um worker ocupado até `gate` ser liberado."""
+    scheduler = RequestScheduler(max_workers=1)
+    gate = threading.Event()
+    scheduler.submit("ocupado", gate.wait, 10)
+    return scheduler, gate
+
+
+def test_prefetch_of_visible_tab_runs_after_background_tab_sends():
+    scheduler, gate = _blocked_scheduler()
+    order = []
+    try:
+        scheduler.set_visible_owner("aba-1")
+        warm = scheduler.submit(("aba-1", "prefetch"), order.append, "aquecimento", background=True)
+        send = scheduler.submit("aba-2", order.append, "envio")
+        gate.set()
+        assert warm.wait(5) and send.wait(5)
+        assert order == ["envio", "aquecimento"]
+    finally:
+        scheduler.shutdown(wait=False)
+
+
+def test_each_owner_runs_its_requests_in_order():
+    scheduler = RequestScheduler(max_workers=4)
+    order = []
+    lock = threading.Lock()
+
+    def record(owner, i):
+        with lock:
+            order.append((owner, i))
+
+    try:
+        tickets = [scheduler.submit(owner, record, owner, i) for i in range(20) for owner in ("aba-1", "aba-2")]
+        assert all(ticket.wait(5) for ticket in tickets)
+        for owner in ("aba-1", "aba-2"):
+            assert [i for o, i in order if o == owner] == list(range(20))
+    finally:
+        scheduler.shutdown(wait=False)
+
+
+def test_visible_tab_and_its_subqueues_go_first():
+    scheduler, gate = _blocked_scheduler()
+    order = []
+    try:
+        scheduler.set_visible_owner("aba-2")
+        tickets = [
+            scheduler.submit("aba-1", order.append, "aba-1"),
+            scheduler.submit(("aba-2", "agent", "revisor"), order.append, "revisor"),
+            scheduler.submit("aba-2", order.append, "aba-2"),
+        ]
+        gate.set()
+        assert all(ticket.wait(5) for ticket in tickets)
+        assert order == ["revisor", "aba-2", "aba-1"]
+    finally:
+        scheduler.shutdown(wait=False)
@@ -0,0 +1,67 @@
+import pytest
+
+from core.service.ai_service import AIProviderError, AIRequest
+from core.service.resilience import CircuitBreaker, ResilientProvider, RetryPolicy, parse_retry_after
+from core.service.singleflight import SingleFlight
+from core.workers.cancellation import CancellationToken
+
+
+class FailingProvider:
+    """Provedor que sempre falha com o erro dado."""
+    name = "failing"
+
+    def __init__(self, error):
+        self.error = error
+        self.calls = 0
+
+    def stream(self, request):
+        self.calls += 1
+        raise self.error
+        yield
+
+    def close(self):
+        pass
+
+
+def _drain(provider, request):
+    return "".join(provider.stream(request))
+
+
+def test_client_errors_do_not_open_the_breaker():
+    breaker = CircuitBreaker(failure_threshold=2)
+    provider = ResilientProvider(FailingProvider(AIProviderError("HTTP 400", status=400)), breaker=breaker)
+    for _ in range(3):
+        with pytest.raises(AIProviderError):
+            _drain(provider, AIRequest("oi"))
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.failures == 0
+
+
+def test_retry_after_is_honored():
+    assert parse_retry_after("2") == 2.0
+    assert parse_retry_after(None) is None
+    error = AIProviderError("HTTP 429", status=429, retry_after=3.0)
+    assert RetryPolicy().delay(1, error) == 3.0
+
+
+def test_retry_after_beyond_deadline_gives_up():
+    upstream = FailingProvider(AIProviderError("HTTP 429", status=429, retry_after=30.0))
+    provider = ResilientProvider(upstream, retry=RetryPolicy(max_attempts=3))
+    token = CancellationToken(timeout=1)
+    with pytest.raises(AIProviderError):
+        _drain(provider, AIRequest("oi", token=token))
+    assert upstream.calls == 1
+    token.close()
+
+
+def test_flight_inherits_leader_deadline():
+    seen = []
+
+    def produce(upstream):
+        seen.append(upstream.remaining())
+        yield "ok"
+
+    token = CancellationToken(timeout=5)
+    assert "".join(SingleFlight().stream("k", produce, token)) == "ok"
+    assert seen[0] is not None and 0 < seen[0] <= 5
+    token.close()
@@ -0,0 +1,49 @@
+import core.service.response_cache as response_cache
+from core.service.response_cache import ResponseCache
+
+
+class FakeClock:
+    """Relógio controlado pelo teste no lugar de time.time."""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+def _cache(tmp_path, monkeypatch, **kwargs):
+    clock = FakeClock()
+    monkeypatch.setattr(response_cache, "time", clock)
+    return ResponseCache(path=str(tmp_path / "responses.db"), **kwargs), clock
+
+
+def test_entry_expires_after_its_ttl(tmp_path, monkeypatch):
+    cache, clock = _cache(tmp_path, monkeypatch, ttl=60)
+    try:
+        cache.put("curta", "resposta", ttl=5)
+        cache.put("padrao", "resposta")
+        clock.now += 10
+        assert cache.get("curta") is None
+        assert cache.get("padrao") == "resposta"
+        clock.now += 60
+        assert cache.get("padrao") is None
+        assert (cache.hits, cache.misses) == (1, 2)
+    finally:
+        cache.close()
+
+
+def test_least_recently_used_entry_is_evicted_over_budget(tmp_path, monkeypatch):
+    cache, clock = _cache(tmp_path, monkeypatch, max_bytes=30)
+    try:
+        for key in ("a", "b", "c"):
+            cache.put(key, key * 10)
+            clock.now += 1
+        assert cache.get("a") == "a" * 10
+        clock.now += 1
+        cache.put("d", "d" * 10)
+
+        assert cache.get("b") is None
+        assert [cache.get(key) for key in ("a", "c", "d")] == ["a" * 10, "c" * 10, "d" * 10]
+    finally:
+        cache.close()
@@ -0,0 +1,52 @@
+import numpy as np
+
+from core.service.retrieval import RetrievalIndex
+
+
+def _text(word, lines=40):
+    return "".join(f"def {word}_{i}(): return {word}\n" for i in range(lines))
+
+
+def test_add_appends_without_rebuilding_the_matrix():
+    index = RetrievalIndex()
+    index.add("a.py", _text("alpha"), "a1")
+    buffer = index._buffer
+    index.add("b.py", _text("beta"), "b1")
+    assert index._buffer is buffer
+    assert index.search("beta", k=1)[0][1].path == "b.py"
+
+
+def test_reindexed_file_leaves_no_stale_chunks():
+    index = RetrievalIndex()
+    index.add("a.py", _text("alpha"), "a1")
+    index.add("b.py", _text("beta"), "b1")
+    index.add("a.py", _text("gamma"), "a2")
+    paths = {chunk.path for _, chunk in index.search("alpha gamma beta", k=100)}
+    assert paths == {"a.py", "b.py"}
+    assert all("alpha" not in chunk.text for _, chunk in index.search("alpha", k=100))
+    assert len(index) == sum(len(chunks) for _, chunks, _ in index._files.values())
+
+
+def test_least_recently_used_files_are_evicted():
+    probe = RetrievalIndex()
+    probe.add("a.py", _text("alpha"), "a1")
+    size = probe._bytes
+    index = RetrievalIndex(max_bytes=int(size * 2.5))
+    index.add("a.py", _text("alpha"), "a1")
+    index.add("b.py", _text("beta"), "b1")
+    index.search("alpha", paths=["a.py"])
+    index.add("c.py", _text("gamma"), "c1")
+    assert set(index.files()) == {"a.py", "c.py"}
+
+
+def test_dump_and_restore_round_trip():
+    index = RetrievalIndex()
+    index.add("b.py", _text("beta"), "b1")
+    index.add("a.py", _text("alpha"), "a1")
+    index.remove("b.py")
+    records, matrix = index.dump()
+    restored = RetrievalIndex()
+    restored.restore(records, matrix)
+    assert restored.files() == {"a.py": "a1"}
+    assert np.array_equal(restored.dump()[1], matrix)
+    assert restored.search("alpha", k=1)[0][1].path == "a.py"
@@ -0,0 +1,64 @@
+import time
+
+from core.service.session_service import SessionService
+from infra.storage import JsonJournalStorage
+
+
+class FlakyStorage(JsonJournalStorage):
+    """Recusa os primeiros `failures` lotes gravados."""
+
+    def __init__(self, path, failures=0):
+        super().__init__(path)
+        self.failures = failures
+        self.batches = []
+
+    def append(self, chat_id, records):
+        if self.failures:
+            self.failures -= 1
+            raise OSError("disco cheio")
+        self.batches.append(list(records))
+        super().append(chat_id, records)
+
+
+def test_continuous_mutations_are_flushed_within_max_delay(tmp_path):
+    storage = FlakyStorage(str(tmp_path))
+    session = SessionService(storage=storage, flush_delay=0.2, flush_max_delay=0.5)
+    chat_id = session.create_chat()
+    deadline = time.monotonic() + 1.5
+    while time.monotonic() < deadline and not storage.batches:
+        session.save_message(chat_id, "Você: oi")
+        time.sleep(0.05)
+    assert storage.batches
+    session.close()
+
+
+def test_failed_flush_is_retried(tmp_path):
+    storage = FlakyStorage(str(tmp_path), failures=1)
+    session = SessionService(storage=storage, flush_delay=60)
+    chat_id = session.create_chat()
+    session.save_message(chat_id, "Você: oi")
+    session.flush()
+    assert storage.batches == []
+    session.save_message(chat_id, "AI: olá")
+    session.close()
+
+    assert [record["value"] for record in storage.batches[0]] == ["Você: oi", "AI: olá"]
+    assert JsonJournalStorage(str(tmp_path)).load(chat_id)["history"] == ["Você: oi", "AI: olá"]
+
+
+def test_cache_evicts_only_clean_sessions(tmp_path):
+    storage = FlakyStorage(str(tmp_path))
+    session = SessionService(storage=storage, flush_delay=60, max_cached=2)
+    dirty = session.create_chat()
+    session.save_message(dirty, "Você: pendente")
+    clean = [session.create_chat() for _ in range(3)]
+    session.flush()
+    session.save_message(dirty, "Você: de novo")
+    for chat_id in clean:
+        session.get_files(chat_id)
+
+    assert len(session._cache) == 2
+    assert dirty in session._cache
+    assert session.load_history(dirty) == ["Você: pendente", "Você: de novo"]
+    assert session.load_history(clean[0]) == []
+    session.close()
@@ -0,0 +1,48 @@
+import json
+import os
+
+from infra.storage import MANIFEST_FILE, JsonJournalStorage
+
+
+def _manifest(path):
+    with open(os.path.join(path, MANIFEST_FILE), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_append_does_not_rewrite_manifest_until_close(tmp_path):
+    storage = JsonJournalStorage(str(tmp_path))
+    storage.create_chat("a", {"history": [], "title": None})
+    written = os.path.getmtime(os.path.join(tmp_path, MANIFEST_FILE))
+    before = _manifest(tmp_path)["a"]
+
+    storage.append("a", [{"op": "message", "value": "Você: oi"}])
+    assert _manifest(tmp_path)["a"] == before
+    assert os.path.getmtime(os.path.join(tmp_path, MANIFEST_FILE)) == written
+    assert storage.list_summaries()[0]["message_count"] == 1
+
+    storage.close()
+    assert _manifest(tmp_path)["a"]["message_count"] == 1
+
+
+def test_manifest_is_reconciled_after_crash(tmp_path):
+    storage = JsonJournalStorage(str(tmp_path))
+    storage.create_chat("a", {"history": [], "title": None})
+    storage.append("a", [{"op": "message", "value": "Você: oi"}, {"op": "title", "value": "Novo"}])
+    # sem close(): o manifesto em disco ficou desatualizado
+
+    summary = JsonJournalStorage(str(tmp_path)).list_summaries()[0]
+    assert summary["message_count"] == 1
+    assert summary["title"] == "Novo"
+
+
+def test_append_after_corrupt_snapshot(tmp_path):
+    storage = JsonJournalStorage(str(tmp_path))
+    storage.create_chat("a", {"history": [], "title": None})
+    storage.append("a", [{"op": "message", "value": "Você: oi"}])
+    storage.close()
+    with open(os.path.join(tmp_path, "a.json"), "w", encoding="utf-8") as f:
+        f.write("{corrompido")
+
+    reopened = JsonJournalStorage(str(tmp_path))
+    reopened.append("a", [{"op": "message", "value": "AI: olá"}])
+    assert reopened.load("a")["history"] == ["Você: oi", "AI: olá"]
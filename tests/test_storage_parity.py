@@ -0,0 +1,41 @@
+import pytest
+
+from core.service.session_service import SessionService
+from infra.storage import JsonJournalStorage, SqliteStorage
+
+OPERATIONS = [
+    ("save_message", "Você: oi"),
+    ("add_file", "a.py"),
+    ("add_file", "b.py"),
+    ("add_file", "a.py"),
+    ("set_file_active", "b.py", False),
+    ("save_message", "AI: olá"),
+    ("remove_file", "a.py"),
+    ("add_file", "a.py"),
+    ("rename_chat", "Título"),
+    ("set_summary", 1, "- Usuário: oi"),
+    ("set_context", 0, "contexto", ["h1"]),
+    ("remove_file_active", "b.py"),
+    ("add_metrics", {"state": "done", "total": 0.5}),
+]
+
+
+def _replay(backend, path, flush_each):
+    session = SessionService(storage=backend(str(path)), flush_delay=60)
+    chat_id = session.create_chat()
+    for name, *args in OPERATIONS:
+        getattr(session, name)(chat_id, *args)
+        if flush_each:
+            session.flush()
+    session.close()
+    data = backend(str(path)).load(chat_id)
+    data.pop("seq", None)
+    return data
+
+
+@pytest.mark.parametrize("flush_each", [False, True])
+def test_backends_agree_on_the_same_operations(tmp_path, flush_each):
+    json_data = _replay(JsonJournalStorage, tmp_path / "json", flush_each)
+    sqlite_data = _replay(SqliteStorage, tmp_path / "sqlite", flush_each)
+    assert json_data == sqlite_data
+    assert json_data["files"] == ["b.py", "a.py"]
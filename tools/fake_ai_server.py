@@ -0,0 +1,188 @@
+# fake_ai_server.py
+"""
+Servidor local que imita a API de chat completions (SSE) para testar o
+HttpProvider sob carga e falhas, sem depender de um provedor real.
+
+As respostas seguem o mesmo MockProfile do MockProvider (ttft, tokens/s,
+taxa de erro, distribuição de tamanho, semente), então um teste de carga
+pelo HttpProvider reproduz os números do provedor em processo.
+
+    python tools/fake_ai_server.py --port 8765 --ttft 0.4 --tps 40 --mean-tokens 300 --error-rate 0.02 --rpm 600
+    set CHATBOT_AI_BASE_URL=http://127.0.0.1:8765
+"""
+import argparse
+import hashlib
+import json
+import logging
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from core.service.mock_backend import MockBackend, MockProfile  # noqa: E402
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("[FakeAIServer]")
+
+# Prefixos de prompt lembrados pelo cache simulado.
+PREFIX_CACHE_ENTRIES = 10_000
+
+
+class FakeAIState:
+    """Backend simulado, limite de taxa e contadores compartilhados entre as conexões."""
+
+    def __init__(self, profile: MockProfile | None = None, rpm=0, cached_ttft_factor=1.0):
+        self.backend = MockBackend(profile)
+        self.rpm = rpm
+        self.cached_ttft_factor = cached_ttft_factor
+        self.prefixes = OrderedDict()
+        self.recent = deque()
+        self.lock = threading.Lock()
+        self.served = 0
+        self.failed = 0
+        self.limited = 0
+
+    def admit(self):
+        """False se a requisição estoura o limite de `rpm` (responder 429)."""
+        with self.lock:
+            now = time.monotonic()
+            while self.recent and now - self.recent[0] >= 60:
+                self.recent.popleft()
+            if self.rpm and len(self.recent) >= self.rpm:
+                self.limited += 1
+                return False
+            self.recent.append(now)
+            return True
+
+    def prompt_cache(self, messages):
+        """
+        Cache de prefixo como o dos provedores: (tokens do prompt, tokens do
+        maior prefixo de mensagens já visto). Tokens estimados em 4 caracteres.
+        """
+        digest, total, cached, chain = hashlib.sha256(), 0, 0, []
+        for message in messages:
+            digest.update(json.dumps(message, ensure_ascii=False, sort_keys=True).encode("utf-8"))
+            total += len(str(message.get("content", ""))) // 4 + 1
+            chain.append(digest.copy().hexdigest())
+        with self.lock:
+            prefix_total = 0
+            for message, key in zip(messages, chain):
+                prefix_total += len(str(message.get("content", ""))) // 4 + 1
+                if key not in self.prefixes:
+                    break
+                cached = prefix_total
+            for key in chain:
+                self.prefixes[key] = True
+                self.prefixes.move_to_end(key)
+            while len(self.prefixes) > PREFIX_CACHE_ENTRIES:
+                self.prefixes.popitem(last=False)
+        return total, cached
+
+    def count(self, failed):
+        with self.lock:
+            if failed:
+                self.failed += 1
+            else:
+                self.served += 1
+
+
+class FakeAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state: FakeAIState = None
+
+    def log_message(self, fmt, *args):
+        logger.debug(fmt % args)
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            request = json.loads(self.rfile.read(length) or b"{}")
+            if not self.state.admit():
+                self._send_json(429, {"error": "rate limit"}, {"Retry-After": "1"})
+                return
+            messages = request.get("messages") or [{}]
+            prompt_tokens, cached_tokens = self.state.prompt_cache(messages)
+            plan = self.state.backend.plan(messages[-1].get("content", ""))
+            # prefixo em cache encurta o tempo até o primeiro token
+            plan.ttft *= 1 - (1 - self.state.cached_ttft_factor) * cached_tokens / prompt_tokens
+            self.state.count(plan.failed)
+            if plan.failed:
+                time.sleep(plan.ttft)
+                self._send_json(plan.error_status, {"error": "falha simulada"})
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for token in plan.play():
+                delta = {"choices": [{"delta": {"content": token}}]}
+                self._write_chunk(f"data: {json.dumps(delta, ensure_ascii=False)}\n\n")
+            if (request.get("stream_options") or {}).get("include_usage"):
+                usage = {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": len(plan.tokens),
+                    "total_tokens": prompt_tokens + len(plan.tokens),
+                    "prompt_tokens_details": {"cached_tokens": cached_tokens},
+                }
+                self._write_chunk(f"data: {json.dumps({'choices': [], 'usage': usage})}\n\n")
+            self._write_chunk("data: [DONE]\n\n")
+            self._write_chunk("")
+        except (BrokenPipeError, ConnectionResetError):
+            logger.info("cliente desconectou durante o stream")
+        except Exception as e:
+            logger.error(f"Falha ao responder: {e}", exc_info=True)
+
+    def _write_chunk(self, text):
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+
+def serve(host="127.0.0.1", port=8765, profile: MockProfile | None = None, rpm=0, cached_ttft_factor=1.0):
+    """Cria o servidor (porta 0 escolhe uma livre); chame `serve_forever()` nele."""
+    state = FakeAIState(profile, rpm, cached_ttft_factor)
+    handler = type("BoundFakeAIHandler", (FakeAIHandler,), {"state": state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.state = state
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor SSE falso de chat completions.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--rpm", type=int, default=0, help="requisições por minuto antes de responder 429")
+    parser.add_argument("--cached-ttft-factor", type=float, default=1.0,
+                        help="ttft de um prompt todo em cache, relativo ao normal (ex.: 0.2)")
+    MockProfile.from_env().add_arguments(parser)
+    args = parser.parse_args(argv)
+    server = serve(args.host, args.port, MockProfile.from_args(args), args.rpm, args.cached_ttft_factor)
+    logger.info(f"Servindo em http://{args.host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        state = server.state
+        logger.info(f"atendidas={state.served} falhas={state.failed} limitadas={state.limited}")
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())